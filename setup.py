@@ -13,6 +13,10 @@ setup(
     version='0.0.1',
     packages=find_packages(exclude='travis'),
     include_package_data=True,
+    extras_require={
+        # columnar binary responses from the analysis endpoints
+        'columnar': ['msgpack>=0.5.2', 'pyarrow'],
+    },
     license='MIT License',
     description='A django app which acts as a drop-in extension for CATMAID, allowing users to incorporate automatic'
                 ' synapse suggestions into their expert neuron annotation workflow.',
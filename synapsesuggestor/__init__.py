@@ -0,0 +1 @@
+default_app_config = 'synapsesuggestor.apps.SynapsesuggestorConfig'
@@ -1,7 +1,49 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.db.models.signals import pre_save, post_save, post_delete
 
 
 class SynapsesuggestorConfig(AppConfig):
     name = 'synapsesuggestor'
+
+    def ready(self):
+        from catmaid.models import Stack, ProjectStack, Relation
+        from synapsesuggestor.control.cache import invalidate_caches
+        from synapsesuggestor.control.partitioning import create_partitions_on_workflow_save
+        from synapsesuggestor.control.synapse_detection import (
+            snapshot_project_geom_inputs, sync_project_geoms_on_project_stack_delete,
+            sync_project_geoms_on_project_stack_save, sync_project_geoms_on_stack_save
+        )
+        from synapsesuggestor.models import (
+            SynapseSuggestionWorkflow, ProjectSynapseSuggestionWorkflow, SynapseDetectionTiling
+        )
+
+        # the cached per-project and per-workflow constants are derived from these models
+        for model in (Stack, ProjectStack, Relation, SynapseDetectionTiling, SynapseSuggestionWorkflow,
+                      ProjectSynapseSuggestionWorkflow):
+            post_save.connect(invalidate_caches, sender=model, dispatch_uid='synapsesuggestor_cache_save')
+            post_delete.connect(invalidate_caches, sender=model, dispatch_uid='synapsesuggestor_cache_delete')
+
+        post_save.connect(
+            create_partitions_on_workflow_save, sender=SynapseSuggestionWorkflow,
+            dispatch_uid='synapsesuggestor_workflow_partitions'
+        )
+
+        # synapse_slice_project_geom is derived from stacks' resolution and project translation, and is re-synced when
+        # those change
+        for model in (Stack, ProjectStack):
+            pre_save.connect(
+                snapshot_project_geom_inputs, sender=model, dispatch_uid='synapsesuggestor_project_geoms_snapshot'
+            )
+        post_save.connect(
+            sync_project_geoms_on_project_stack_save, sender=ProjectStack,
+            dispatch_uid='synapsesuggestor_project_geoms_project_stack_save'
+        )
+        post_delete.connect(
+            sync_project_geoms_on_project_stack_delete, sender=ProjectStack,
+            dispatch_uid='synapsesuggestor_project_geoms_project_stack_delete'
+        )
+        post_save.connect(
+            sync_project_geoms_on_stack_save, sender=Stack, dispatch_uid='synapsesuggestor_project_geoms_stack_save'
+        )
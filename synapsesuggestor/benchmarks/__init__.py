@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for synapsesuggestor's database-heavy code paths.
+
+Each benchmark module exposes a ``run`` function which takes keyword options and returns a list of result dicts.
+Benchmarks which write to the database do so inside transactions which are rolled back.
+
+The ``volume`` benchmark runs the whole pipeline, from synapse slice ingest to the analysis endpoints, on a
+synthetic volume of any size (see synapsesuggestor.benchmarks.synthetic).
+"""
+from collections import OrderedDict
+
+from synapsesuggestor.benchmarks import (
+    slice_ingest, agglomeration, tile_neighbours, treenode_association, connector_intersection,
+    skeleton_proximity, volume,
+)
+
+BENCHMARKS = OrderedDict([
+    ('slice_ingest', slice_ingest.run),
+    ('agglomeration', agglomeration.run),
+    ('tile_neighbours', tile_neighbours.run),
+    ('treenode_association', treenode_association.run),
+    ('connector_intersection', connector_intersection.run),
+    ('skeleton_proximity', skeleton_proximity.run),
+    ('volume', volume.run),
+])
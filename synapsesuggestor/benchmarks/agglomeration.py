@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the NumPy disjoint-set slice clustering with the networkx graph it replaced, on synthetic adjacency graphs.
+"""
+import random
+
+import networkx as nx
+import numpy as np
+
+from synapsesuggestor.benchmarks.common import timed, result_row
+from synapsesuggestor.control.disjoint_set import cluster_slices
+
+
+def synthetic_adjacencies(slice_count, mean_object_size=8, mapped_fraction=0.5, seed=0):
+    """
+    Generate slices grouped into chains (synapse objects spanning several sections) with occasional bridges between
+    chains, and existing object mappings for a fraction of the chains.
+
+    Returns:
+        tuple: (seed slice IDs, (N, 2) adjacency array, (M, 2) slice-object mapping array)
+    """
+    rng = random.Random(seed)
+    slice_ids = list(range(1, slice_count + 1))
+
+    adjacencies = []
+    slice_object_pairs = []
+    start = 0
+    object_id = 1
+    while start < slice_count:
+        stop = min(slice_count, start + rng.randint(1, 2 * mean_object_size))
+        chain = slice_ids[start:stop]
+        adjacencies.extend(zip(chain[:-1], chain[1:]))
+        if rng.random() < 0.05 and stop < slice_count:
+            adjacencies.append((chain[-1], rng.choice(slice_ids)))
+        if rng.random() < mapped_fraction:
+            slice_object_pairs.extend((slice_id, object_id) for slice_id in chain)
+            object_id += 1
+        start = stop
+
+    seeds = [slice_id for slice_id in slice_ids if rng.random() < 0.5]
+    return seeds, np.array(adjacencies, dtype=np.int64), np.array(slice_object_pairs, dtype=np.int64)
+
+
+def networkx_clusters(synapse_slice_ids, adjacencies, slice_object_pairs):
+    """Reference implementation of the previous networkx-based clustering"""
+    graph = nx.Graph()
+    graph.add_nodes_from(synapse_slice_ids)
+    graph.add_edges_from(adjacencies.tolist())
+
+    existing_slice_to_obj = dict()
+    existing_obj_to_slices = dict()
+    for slice_id, obj in slice_object_pairs.tolist():
+        existing_slice_to_obj[slice_id] = obj
+        existing_obj_to_slices.setdefault(obj, []).append(slice_id)
+
+    for slice_group in existing_obj_to_slices.values():
+        # equivalent to Graph.add_path, which was removed in networkx 2.4
+        graph.add_nodes_from(slice_group)
+        graph.add_edges_from(zip(slice_group[:-1], slice_group[1:]))
+
+    out = []
+    for connected_component in nx.connected_components(graph):
+        possible_objects = {existing_slice_to_obj[s] for s in connected_component if s in existing_slice_to_obj}
+        out.append((set(connected_component), possible_objects))
+    return out
+
+
+def _canonical(clusters):
+    return sorted((sorted(slices), sorted(objects)) for slices, objects in clusters)
+
+
+def run(size=10000, seed=0, **kwargs):
+    """
+    Cluster a synthetic graph of `size` synapse slices with each implementation.
+    """
+    seeds, adjacencies, slice_object_pairs = synthetic_adjacencies(size, seed=seed)
+
+    results = []
+    outputs = dict()
+    for method, fn in (('networkx', networkx_clusters), ('disjoint_set', cluster_slices)):
+        outputs[method], seconds = timed(fn, seeds, adjacencies, slice_object_pairs)
+        results.append(result_row('agglomeration', method, size, seconds, clusters=len(outputs[method])))
+
+    matches = _canonical(outputs['networkx']) == _canonical(outputs['disjoint_set'])
+    for row in results:
+        row['matches_reference'] = matches
+
+    return results
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+import datetime
+import json
+import platform
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+RESULTS_FORMAT_VERSION = 1
+
+
+@contextmanager
+def rolled_back():
+    """Run the enclosed block in a transaction which is always rolled back"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def timed(fn, *args, **kwargs):
+    """
+    Call a function and time it.
+
+    Returns:
+        tuple: (return value, elapsed wall time in seconds)
+    """
+    start = time.time()
+    result = fn(*args, **kwargs)
+    return result, time.time() - start
+
+
+def result_row(benchmark, method, rows, seconds, **extra):
+    """Standard form of a benchmark result"""
+    row = {
+        'benchmark': benchmark,
+        'method': method,
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else None,
+    }
+    row.update(extra)
+    return row
+
+
+def explain_analyze(cursor, query, params=None):
+    """
+    Run a query under EXPLAIN ANALYZE.
+
+    Returns:
+        dict: the top level of the JSON plan, including 'Plan' and 'Execution Time' (in milliseconds)
+    """
+    cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + query, params)
+    plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def plan_node_types(plan):
+    """Set of the node types used anywhere in an EXPLAIN plan"""
+    node_types = {plan['Node Type']}
+    for child in plan.get('Plans', []):
+        node_types.update(plan_node_types(child))
+    return node_types
+
+
+def list_params(name, values):
+    """Encode a list as request parameters in the form read by catmaid.control.common.get_request_list"""
+    return {'{}[{}]'.format(name, idx): value for idx, value in enumerate(values)}
+
+
+def response_rows(content):
+    """Number of rows in a JSON response body: the length of its 'data', or of the body itself"""
+    parsed = json.loads(content.decode('utf-8'))
+    if isinstance(parsed, dict) and 'data' in parsed:
+        return len(parsed['data'])
+    return len(parsed)
+
+
+def call_view(view, method, user, params=None, **view_kwargs):
+    """
+    Call a view function directly with a request authenticated as the given user, reading the whole response.
+
+    Args:
+        view(callable): View function
+        method(str): 'get' or 'post'
+        user(django.contrib.auth.models.User):
+        params(dict, optional): GET or POST parameters
+        **view_kwargs: Keyword arguments of the view, e.g. project_id
+
+    Returns:
+        tuple: (status code, response body bytes)
+    """
+    request = getattr(APIRequestFactory(), method)('/', params or {})
+    force_authenticate(request, user=user)
+    response = view(request, **view_kwargs)
+    if getattr(response, 'streaming', False):
+        content = b''.join(response.streaming_content)
+    else:
+        content = response.content
+    if response.status_code >= 400:
+        raise RuntimeError('{} responded with {}: {}'.format(view.__name__, response.status_code, content[:200]))
+    return response.status_code, content
+
+
+def results_metadata(options=None, cursor=None):
+    """Describe the environment of a benchmark run, to be stored alongside its results"""
+    if cursor is None:
+        cursor = connection.cursor()
+    cursor.execute('SHOW server_version;')
+    postgres_version = cursor.fetchone()[0]
+    cursor.execute('SELECT postgis_lib_version();')
+    postgis_version = cursor.fetchone()[0]
+
+    return {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'postgres': postgres_version,
+        'postgis': postgis_version,
+        'host': platform.node(),
+        'options': options or {},
+    }
+
+
+def load_results(path):
+    """
+    Load benchmark results written by the ss_benchmark command.
+
+    Returns:
+        list: result rows. Files from before results were stored with metadata are a bare list of rows
+    """
+    with open(path) as f:
+        loaded = json.load(f)
+    return loaded['results'] if isinstance(loaded, dict) else loaded
+
+
+def compare_results(baseline, results, max_slowdown=1.5):
+    """
+    Find results which are slower than the result for the same benchmark and method in a baseline.
+
+    Args:
+        baseline(list): result rows of a previous run
+        results(list): result rows of this run
+        max_slowdown(float): Largest allowed ratio of this run's time to the baseline's
+
+    Returns:
+        list: (benchmark, method, baseline seconds, seconds, ratio) of each regression
+    """
+    baseline_seconds = {(row['benchmark'], row['method']): row['seconds'] for row in baseline}
+    regressions = []
+    for row in results:
+        previous = baseline_seconds.get((row['benchmark'], row['method']))
+        if not previous:
+            continue
+        ratio = row['seconds'] / previous
+        if ratio > max_slowdown:
+            regressions.append((row['benchmark'], row['method'], previous, row['seconds'], ratio))
+    return regressions
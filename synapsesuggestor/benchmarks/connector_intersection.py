@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the spatial joins between synapse slices and connectors: transforming every slice's stack-space geometry
+into project space on the fly, and using the stored, indexed project-space geometries. The latter are the queries
+used by synapsesuggestor.control.analysis, which also look up the connectors' treenodes.
+"""
+import random
+
+from django.db import connection
+
+from synapsesuggestor.benchmarks.common import result_row, explain_analyze, plan_node_types
+from synapsesuggestor.control.analysis import INTERSECTING_CONNECTORS_QUERIES
+from synapsesuggestor.control.common import get_translation_resolution
+from synapsesuggestor.models import ProjectSynapseSuggestionWorkflow
+
+TRANSSCALE_FROM = '''
+    FROM synapse_slice_synapse_object ss_so
+    INNER JOIN unnest(%(obj_ids)s::BIGINT[]) AS syns (id)
+      ON ss_so.synapse_object_id = syns.id
+    INNER JOIN (
+      SELECT ss.id, ss.synapse_detection_tile_id, ST_TransScale(
+        ss.geom_2d, %(offset_xs)s, %(offset_ys)s, %(resolution_x)s, %(resolution_y)s
+      )
+        FROM synapse_slice ss
+    ) AS ss_trans (id, synapse_detection_tile_id, geom_2d)
+      ON ss_trans.id = ss_so.synapse_slice_id
+    INNER JOIN synapse_detection_tile tile
+      ON ss_trans.synapse_detection_tile_id = tile.id
+'''
+
+QUERIES = (
+    ('edge', 'transscale', 'SELECT ss_so.synapse_object_id, tce.id' + TRANSSCALE_FROM + '''
+        INNER JOIN treenode_connector_edge tce
+          ON (tile.z_tile_idx + %(offset_zs)s) * %(resolution_z)s BETWEEN ST_ZMin(tce.edge) AND ST_ZMax(tce.edge)
+          AND ST_DWithin(tce.edge, ss_trans.geom_2d, %(tolerance)s)
+        WHERE tce.project_id = %(project_id)s
+    '''),
+    ('edge', 'project_geom', INTERSECTING_CONNECTORS_QUERIES['edge']),
+    ('node', 'transscale', 'SELECT ss_so.synapse_object_id, c.id' + TRANSSCALE_FROM + '''
+        INNER JOIN connector c
+          ON (tile.z_tile_idx + %(offset_zs)s) * %(resolution_z)s = c.location_z
+          AND ST_DWithin(ST_MakePoint(c.location_x, c.location_y), ss_trans.geom_2d, %(tolerance)s)
+          AND c.project_id = %(project_id)s
+    '''),
+    ('node', 'project_geom', INTERSECTING_CONNECTORS_QUERIES['node']),
+)
+
+
+def run(workflow_id=None, size=10000, seed=0, tolerance=100, **kwargs):
+    """
+    Find connectors intersecting `size` random synapse objects of the workflow with each spatial join, in the
+    project most recently associated with the workflow. Timings are the execution times reported by EXPLAIN ANALYZE.
+    """
+    if workflow_id is None:
+        raise ValueError('connector_intersection benchmark requires a workflow ID')
+
+    project_id = ProjectSynapseSuggestionWorkflow.objects.filter(
+        synapse_suggestion_workflow_id=workflow_id
+    ).latest('created').project_id
+
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT DISTINCT ss_so.synapse_object_id FROM synapse_slice_synapse_object ss_so
+          INNER JOIN synapse_slice ss
+            ON ss_so.synapse_slice_id = ss.id
+          INNER JOIN synapse_detection_tile tile
+            ON ss.synapse_detection_tile_id = tile.id
+          WHERE tile.synapse_suggestion_workflow_id = %s;
+    ''', (workflow_id,))
+    obj_ids = [row[0] for row in cursor.fetchall()]
+    obj_ids = random.Random(seed).sample(obj_ids, min(size, len(obj_ids)))
+
+    translation, resolution = get_translation_resolution(project_id, workflow_id, cursor)
+    offset_xs, offset_ys, offset_zs = translation / resolution
+    params = {
+        'obj_ids': obj_ids,
+        'offset_xs': offset_xs,
+        'offset_ys': offset_ys,
+        'offset_zs': offset_zs,
+        'resolution_x': resolution[0],
+        'resolution_y': resolution[1],
+        'resolution_z': resolution[2],
+        'tolerance': tolerance,
+        'project_id': project_id,
+    }
+
+    results = []
+    for mode, method, query in QUERIES:
+        plan = explain_analyze(cursor, query, params)
+        node_types = plan_node_types(plan['Plan'])
+        results.append(result_row(
+            'connector_intersection', '{}_{}'.format(mode, method), plan['Plan']['Actual Rows'],
+            plan['Execution Time'] / 1000, synapse_objects=len(obj_ids), plan_nodes=sorted(node_types)
+        ))
+
+    return results
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Time the search for synapse slices near a skeleton, in 2D and 3D, for the largest skeleton in the workflow's project
+(or a given skeleton).
+"""
+from django.db import connection
+
+from synapsesuggestor.benchmarks.common import timed, result_row
+from synapsesuggestor.control.treenode_association import (
+    NEAR_SKELETON_PREDICATES, _get_synapse_slices_near_skeleton
+)
+from synapsesuggestor.models import ProjectSynapseSuggestionWorkflow
+
+
+def largest_skeleton(project_id, cursor=None):
+    """Return the (skeleton ID, treenode count) of the skeleton with the most treenodes in the project"""
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        SELECT tn.skeleton_id, count(*) FROM treenode tn
+          WHERE tn.project_id = %s
+          GROUP BY tn.skeleton_id
+          ORDER BY count(*) DESC
+          LIMIT 1;
+    ''', (project_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError('skeleton_proximity benchmark requires a project with treenodes')
+    return row
+
+
+def run(workflow_id=None, skeleton_id=None, distance=1000, **kwargs):
+    """
+    Find the synapse slices within `distance` (in project space) of a skeleton with each search mode.
+    """
+    if workflow_id is None:
+        raise ValueError('skeleton_proximity benchmark requires a workflow ID')
+
+    pssw = ProjectSynapseSuggestionWorkflow.objects.filter(synapse_suggestion_workflow_id=workflow_id).latest('created')
+    cursor = connection.cursor()
+
+    if skeleton_id is None:
+        skeleton_id, treenode_count = largest_skeleton(pssw.project_id, cursor)
+    else:
+        cursor.execute('SELECT count(*) FROM treenode tn WHERE tn.skeleton_id = %s;', (skeleton_id,))
+        treenode_count = cursor.fetchone()[0]
+
+    results = []
+    for dimensions in sorted(NEAR_SKELETON_PREDICATES):
+        rows, seconds = timed(
+            _get_synapse_slices_near_skeleton, pssw.project_id, pssw.id, skeleton_id, distance, dimensions, cursor
+        )
+        results.append(result_row(
+            'skeleton_proximity', '{}d'.format(dimensions), treenode_count, seconds, result_rows=len(rows),
+            skeleton_id=skeleton_id
+        ))
+
+    return results
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Compare synapse slice ingest paths: the original VALUES list built by list_into_query, unnest()ed column arrays,
+and the COPY-based loader.
+"""
+from __future__ import division
+import json
+import random
+
+from django.db import connection
+
+from synapsesuggestor.benchmarks.common import rolled_back, timed, result_row
+from synapsesuggestor.control.common import list_into_query
+from synapsesuggestor.control.synapse_detection import (
+    _get_or_create_tiles, _insert_synapse_slices, load_synapse_slices
+)
+
+
+def synthetic_slice_records(count, tile_size=512, tiles_per_side=4, seed=0):
+    """
+    Generate square synapse slices scattered over a grid of tiles, in the form accepted by load_synapse_slices.
+    """
+    rng = random.Random(seed)
+    records = []
+    for naive_id in range(count):
+        x_idx, y_idx = rng.randrange(tiles_per_side), rng.randrange(tiles_per_side)
+        z_idx = naive_id // 1000
+        side = rng.randint(2, 20)
+        x0 = x_idx * tile_size + rng.randrange(tile_size - side)
+        y0 = y_idx * tile_size + rng.randrange(tile_size - side)
+        ring = [[x0, y0], [x0 + side, y0], [x0 + side, y0 + side], [x0, y0 + side], [x0, y0]]
+        records.append({
+            'id': naive_id,
+            'x_idx': x_idx,
+            'y_idx': y_idx,
+            'z_idx': z_idx,
+            'geom': json.dumps({'type': 'Polygon', 'coordinates': [ring]}),
+            'size_px': side * side,
+            'xs_centroid': x0 + side // 2,
+            'ys_centroid': y0 + side // 2,
+            'uncertainty': rng.random(),
+        })
+    return records
+
+
+def _tile_slices(ssw_id, records, cursor):
+    tile_idxs = [(r['x_idx'], r['y_idx'], r['z_idx']) for r in records]
+    tile_ids = _get_or_create_tiles(ssw_id, tile_idxs, cursor)
+    return [(tile_ids[tile_idx], tile_idx, record) for tile_idx, record in zip(tile_idxs, records)]
+
+
+def _ingest_values(ssw_id, records, tolerance, cursor):
+    rows = [
+        (tile_id, ssw_id, d['geom'], d['size_px'], d['xs_centroid'], d['ys_centroid'], d['uncertainty'])
+        for tile_id, _, d in _tile_slices(ssw_id, records, cursor)
+    ]
+    query, args = list_into_query(
+        '''
+            INSERT INTO synapse_slice (
+              synapse_detection_tile_id, synapse_suggestion_workflow_id, geom_2d, size_px, xs_centroid, ys_centroid,
+              uncertainty
+            )
+            VALUES {}
+            RETURNING id;
+        ''',
+        rows,
+        fmt='(%s, %s, ST_Simplify(ST_GeomFromGeoJson(%s), {}, TRUE), %s, %s, %s, %s)'.format(tolerance)
+    )
+    cursor.execute(query, args)
+    return len(cursor.fetchall())
+
+
+def _ingest_unnest(ssw_id, records, tolerance, cursor):
+    return len(_insert_synapse_slices(_tile_slices(ssw_id, records, cursor), tolerance, cursor))
+
+
+def _ingest_copy(ssw_id, records, tolerance, cursor):
+    return load_synapse_slices(ssw_id, records, tolerance, cursor=cursor)[0]
+
+
+METHODS = (
+    ('values', _ingest_values),
+    ('unnest', _ingest_unnest),
+    ('copy', _ingest_copy),
+)
+
+
+def run(workflow_id=None, size=10000, seed=0, tolerance=1, **kwargs):
+    """
+    Insert `size` synthetic synapse slices into the given workflow with each ingest path, rolling back after each.
+    """
+    if workflow_id is None:
+        raise ValueError('slice_ingest benchmark requires a workflow ID')
+
+    records = synthetic_slice_records(size, seed=seed)
+    cursor = connection.cursor()
+
+    results = []
+    for method, fn in METHODS:
+        with rolled_back():
+            count, seconds = timed(fn, workflow_id, records, tolerance, cursor)
+        results.append(result_row('slice_ingest', method, count, seconds))
+
+    return results
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Generation of a synthetic synapse detection volume: synapse objects spanning several z sections, their synapse
+slices, and skeletons which pass through some of them with the corresponding treenode associations.
+
+Synapse objects are roughly elliptical blobs whose centre drifts a few pixels between consecutive sections and whose
+radius swells towards the middle of their z extent, so that agglomeration sees realistic overlaps. Skeletons run up
+through the volume, one treenode per section, touching the edge of each synapse object they pass through.
+
+All coordinates are in stack space. Objects and skeletons are held in memory as lists of small tuples, while synapse
+slice records are generated lazily so that millions of them can be streamed into load_synapse_slices.
+"""
+from __future__ import division
+import json
+import math
+import random
+
+from django.db import connection
+
+POLYGON_VERTICES = 8
+
+
+def synthetic_synapse_objects(slice_count, tile_size=(512, 512), sections=50, mean_span=5, slices_per_tile=20,
+                              seed=0):
+    """
+    Generate synapse objects with about slice_count slices in total, spread over a square grid of tiles sized so that
+    each tile of each section holds about slices_per_tile slices.
+
+    Args:
+        slice_count(int): Number of synapse slices to generate
+        tile_size(tuple): (width, height) of tiles, in pixels
+        sections(int): Number of z sections
+        mean_span(int): Mean number of sections spanned by an object
+        slices_per_tile(int): Mean number of slices per tile and section
+        seed(int):
+
+    Returns:
+        list: objects, each a list of (z, x centre, y centre, radius) tuples for consecutive sections
+    """
+    rng = random.Random(seed)
+    tiles_per_side = max(1, int(math.ceil(math.sqrt(slice_count / (sections * slices_per_tile)))))
+    width, height = tile_size[0] * tiles_per_side, tile_size[1] * tiles_per_side
+
+    objects = []
+    generated = 0
+    while generated < slice_count:
+        span = min(rng.randint(1, 2 * mean_span - 1), sections, slice_count - generated)
+        z_start = rng.randint(0, sections - span)
+        radius = rng.uniform(4, 15)
+        cx = rng.uniform(radius, width - radius)
+        cy = rng.uniform(radius, height - radius)
+
+        obj = []
+        for offset in range(span):
+            # swell towards the middle of the object
+            profile = 0.5 + 0.5 * math.sin(math.pi * (offset + 0.5) / span)
+            obj.append((z_start + offset, cx, cy, max(1.5, radius * profile)))
+            cx = min(max(cx + rng.gauss(0, 1.5), radius), width - radius)
+            cy = min(max(cy + rng.gauss(0, 1.5), radius), height - radius)
+
+        objects.append(obj)
+        generated += span
+
+    return objects
+
+
+def first_naive_ids(objects):
+    """Naive ID of the first synapse slice of each object, as numbered by synapse_slice_records"""
+    ids = []
+    count = 0
+    for obj in objects:
+        ids.append(count)
+        count += len(obj)
+    return ids
+
+
+def synapse_slice_records(objects, tile_size=(512, 512), seed=0):
+    """
+    Generate synapse slice records of the given objects in the form accepted by load_synapse_slices, numbered in
+    order. Each slice is a polygon approximating its section of the object, clipped to the tile containing its centre.
+
+    Args:
+        objects(list): Output of synthetic_synapse_objects
+        tile_size(tuple): (width, height) of tiles, in pixels
+        seed(int):
+
+    Returns:
+        generator: synapse slice dicts
+    """
+    rng = random.Random(seed)
+    tile_width, tile_height = tile_size
+    naive_id = 0
+    for obj in objects:
+        for z, cx, cy, radius in obj:
+            x_idx, y_idx = int(cx // tile_width), int(cy // tile_height)
+            x_min, y_min = x_idx * tile_width, y_idx * tile_height
+
+            ring = []
+            for vertex in range(POLYGON_VERTICES):
+                angle = 2 * math.pi * vertex / POLYGON_VERTICES
+                # elongate along x a little
+                x = min(max(int(round(cx + 1.3 * radius * math.cos(angle))), x_min), x_min + tile_width)
+                y = min(max(int(round(cy + radius * math.sin(angle))), y_min), y_min + tile_height)
+                ring.append([x, y])
+            ring.append(ring[0])
+
+            yield {
+                'id': naive_id,
+                'x_idx': x_idx,
+                'y_idx': y_idx,
+                'z_idx': z,
+                'geom': json.dumps({'type': 'Polygon', 'coordinates': [ring]}),
+                'size_px': max(1, int(math.pi * 1.3 * radius * radius)),
+                'xs_centroid': int(cx),
+                'ys_centroid': int(cy),
+                'uncertainty': rng.random(),
+            }
+            naive_id += 1
+
+
+def synthetic_skeletons(objects, skeleton_count, objects_per_skeleton=20, seed=0):
+    """
+    Generate skeletons which each pass through up to objects_per_skeleton synapse objects whose z extents do not
+    overlap, with one treenode per section from the first object to the last. Treenodes within an object's sections
+    touch the edge of its slice, and between objects they are interpolated.
+
+    Args:
+        objects(list): Output of synthetic_synapse_objects
+        skeleton_count(int):
+        objects_per_skeleton(int):
+        seed(int):
+
+    Returns:
+        list: skeletons, each a tuple of a list of (x, y, z) treenode locations, ordered from the root, and a list
+            of (treenode index, synapse slice naive ID, contact area) associations
+    """
+    rng = random.Random(seed)
+    naive_ids = first_naive_ids(objects)
+
+    skeletons = []
+    for _ in range(skeleton_count):
+        candidates = rng.sample(range(len(objects)), min(3 * objects_per_skeleton, len(objects)))
+        candidates.sort(key=lambda obj_idx: objects[obj_idx][0][0])
+
+        anchors = dict()
+        contacts = dict()
+        last_z = -1
+        for obj_idx in candidates:
+            if len(contacts) >= objects_per_skeleton:
+                break
+            if objects[obj_idx][0][0] <= last_z:
+                continue
+            for offset, (z, cx, cy, radius) in enumerate(objects[obj_idx]):
+                anchors[z] = (cx + 1.3 * radius, cy)
+                contacts[z] = (naive_ids[obj_idx] + offset, max(1, int(round(radius))))
+            last_z = objects[obj_idx][-1][0]
+
+        if not anchors:
+            continue
+
+        anchor_zs = sorted(anchors)
+        nodes = []
+        associations = []
+        for previous_z, next_z in zip(anchor_zs, anchor_zs[1:] + [anchor_zs[-1] + 1]):
+            x0, y0 = anchors[previous_z]
+            x1, y1 = anchors.get(next_z, (x0, y0))
+            for z in range(previous_z, next_z):
+                fraction = (z - previous_z) / (next_z - previous_z)
+                if z in contacts:
+                    associations.append((len(nodes), ) + contacts[z])
+                nodes.append((x0 + fraction * (x1 - x0), y0 + fraction * (y1 - y0), z))
+
+        skeletons.append((nodes, associations))
+
+    return skeletons
+
+
+def create_skeletons(workflow, user_id, skeletons, cursor=None):
+    """
+    Insert synthetic skeletons into the workflow's project.
+
+    Args:
+        workflow(synapsesuggestor.control.common.WorkflowContext):
+        user_id(int): User to create the skeletons as
+        skeletons(list): Output of synthetic_skeletons
+        cursor(django.db.connection.cursor, optional):
+
+    Returns:
+        list: (skeleton ID, list of treenode IDs in the order given) for each skeleton
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        INSERT INTO class_instance (user_id, project_id, class_id, name)
+          SELECT %(user_id)s, %(project_id)s, c.id, 'synthetic skeleton ' || n
+            FROM class c
+            CROSS JOIN generate_series(1, %(count)s) n
+            WHERE c.project_id = %(project_id)s
+              AND c.class_name = 'skeleton'
+          RETURNING id;
+    ''', {'user_id': user_id, 'project_id': workflow.project_id, 'count': len(skeletons)})
+    skeleton_ids = [row[0] for row in cursor.fetchall()]
+    if len(skeleton_ids) != len(skeletons):
+        raise ValueError('Project {} has no skeleton class'.format(workflow.project_id))
+
+    translation, resolution = workflow.translation, workflow.resolution
+    node_skeleton_ids = []
+    locations = []
+    for skeleton_id, (nodes, _) in zip(skeleton_ids, skeletons):
+        node_skeleton_ids.extend([skeleton_id] * len(nodes))
+        locations.extend(nodes)
+
+    # treenodes are inserted as roots, then linked to their parents; their IDs are reserved up front, as
+    # INSERT ... RETURNING does not guarantee the order of its rows
+    treenode_ids = _reserve_ids('treenode', len(locations), cursor)
+    cursor.execute('''
+        INSERT INTO treenode (
+          id, user_id, editor_id, project_id, location_x, location_y, location_z, skeleton_id, radius, confidence
+        )
+          SELECT node.id, %(user_id)s, %(user_id)s, %(project_id)s, node.x, node.y, node.z, node.skeleton_id, 0, 5
+            FROM unnest(%(ids)s::bigint[], %(xs)s::real[], %(ys)s::real[], %(zs)s::real[], %(skeleton_ids)s::bigint[])
+              AS node (id, x, y, z, skeleton_id);
+    ''', {
+        'ids': treenode_ids,
+        'user_id': user_id,
+        'project_id': workflow.project_id,
+        'xs': [x * resolution[0] + translation[0] for x, _, _ in locations],
+        'ys': [y * resolution[1] + translation[1] for _, y, _ in locations],
+        'zs': [z * resolution[2] + translation[2] for _, _, z in locations],
+        'skeleton_ids': node_skeleton_ids,
+    })
+
+    created = []
+    child_ids, parent_ids = [], []
+    start = 0
+    for skeleton_id, (nodes, _) in zip(skeleton_ids, skeletons):
+        skeleton_treenode_ids = treenode_ids[start:start + len(nodes)]
+        child_ids.extend(skeleton_treenode_ids[1:])
+        parent_ids.extend(skeleton_treenode_ids[:-1])
+        created.append((skeleton_id, skeleton_treenode_ids))
+        start += len(nodes)
+
+    cursor.execute('''
+        UPDATE treenode tn
+          SET parent_id = edge.parent_id
+          FROM unnest(%s::bigint[], %s::bigint[]) AS edge (child_id, parent_id)
+          WHERE tn.id = edge.child_id;
+    ''', (child_ids, parent_ids))
+
+    return created
+
+
+def _reserve_ids(table, count, cursor):
+    """Take count values of the default of a table's id column, i.e. from its sequence"""
+    cursor.execute('''
+        SELECT pg_get_expr(d.adbin, d.adrelid)
+          FROM pg_attrdef d
+          INNER JOIN pg_attribute a
+            ON a.attrelid = d.adrelid
+            AND a.attnum = d.adnum
+          WHERE d.adrelid = %s::regclass
+            AND a.attname = 'id';
+    ''', (table,))
+    # CATMAID's treenode and connector IDs share a sequence, which pg_get_serial_sequence need not find for treenode
+    cursor.execute('SELECT {} FROM generate_series(1, %s);'.format(cursor.fetchone()[0]), (count,))
+    return [row[0] for row in cursor.fetchall()]
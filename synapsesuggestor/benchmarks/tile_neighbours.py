@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the tile neighbourhood join used by slice adjacency queries: the original range predicate on absolute index
+differences, and equality joins on explicit neighbour offsets which can use the (workflow, z, y, x) index.
+"""
+from __future__ import division
+import random
+
+from django.db import connection
+
+from synapsesuggestor.benchmarks.common import rolled_back, result_row, explain_analyze, plan_node_types
+from synapsesuggestor.control.synapse_detection import TILE_NEIGHBOUR_OFFSETS
+
+QUERIES = (
+    ('abs_range', '''
+        SELECT this_tile.id, that_tile.id FROM synapse_detection_tile this_tile
+          INNER JOIN unnest(%s::bigint[]) AS these_ids (id)
+            ON these_ids.id = this_tile.id
+          INNER JOIN synapse_detection_tile that_tile
+            ON that_tile.synapse_suggestion_workflow_id = this_tile.synapse_suggestion_workflow_id
+            AND abs(that_tile.z_tile_idx - this_tile.z_tile_idx) <= 1
+            AND abs(that_tile.y_tile_idx - this_tile.y_tile_idx) <= 1
+            AND abs(that_tile.x_tile_idx - this_tile.x_tile_idx) <= 1
+    '''),
+    ('offsets', '''
+        SELECT this_tile.id, that_tile.id FROM synapse_detection_tile this_tile
+          INNER JOIN unnest(%s::bigint[]) AS these_ids (id)
+            ON these_ids.id = this_tile.id
+          CROSS JOIN ({}) AS offsets (dz, dy, dx)
+          INNER JOIN synapse_detection_tile that_tile
+            ON that_tile.synapse_suggestion_workflow_id = this_tile.synapse_suggestion_workflow_id
+            AND that_tile.z_tile_idx = this_tile.z_tile_idx + offsets.dz
+            AND that_tile.y_tile_idx = this_tile.y_tile_idx + offsets.dy
+            AND that_tile.x_tile_idx = this_tile.x_tile_idx + offsets.dx
+    '''.format(TILE_NEIGHBOUR_OFFSETS)),
+)
+
+
+def _generate_tiles(workflow_id, size, cursor):
+    """Insert roughly `size` tiles in a cube above the workflow's existing tiles; return their IDs"""
+    side = max(1, int(round(size ** (1 / 3))))
+    cursor.execute('''
+        SELECT coalesce(max(z_tile_idx) + 2, 0) FROM synapse_detection_tile WHERE synapse_suggestion_workflow_id = %s
+    ''', (workflow_id,))
+    z_offset = cursor.fetchone()[0]
+
+    cursor.execute('''
+        INSERT INTO synapse_detection_tile (synapse_suggestion_workflow_id, x_tile_idx, y_tile_idx, z_tile_idx)
+          SELECT %(ssw_id)s, x, y, z + %(z_offset)s
+            FROM generate_series(0, %(last)s) x, generate_series(0, %(last)s) y, generate_series(0, %(last)s) z
+          RETURNING id;
+    ''', {'ssw_id': workflow_id, 'z_offset': z_offset, 'last': side - 1})
+    tile_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('ANALYZE synapse_detection_tile;')
+    return tile_ids
+
+
+def run(workflow_id=None, size=10000, seed=0, seed_tiles=1000, **kwargs):
+    """
+    Generate about `size` tiles in the given workflow and find the neighbours of `seed_tiles` of them with each query,
+    rolling back afterwards. Timings are the execution times reported by EXPLAIN ANALYZE.
+    """
+    if workflow_id is None:
+        raise ValueError('tile_neighbours benchmark requires a workflow ID')
+
+    cursor = connection.cursor()
+    results = []
+    with rolled_back():
+        tile_ids = _generate_tiles(workflow_id, size, cursor)
+        seeds = random.Random(seed).sample(tile_ids, min(seed_tiles, len(tile_ids)))
+
+        for method, query in QUERIES:
+            plan = explain_analyze(cursor, query, (seeds,))
+            results.append(result_row(
+                'tile_neighbours', method, plan['Plan']['Actual Rows'], plan['Execution Time'] / 1000,
+                tiles=len(tile_ids), seed_tiles=len(seeds),
+                uses_index=any('Index' in node_type for node_type in plan_node_types(plan['Plan']))
+            ))
+
+    return results
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Compare treenode association ingest paths: the original VALUES list built by list_into_query, unnest()ed column
+arrays, and COPY through a staging table.
+"""
+import random
+
+from django.db import connection
+
+from synapsesuggestor.benchmarks.common import rolled_back, timed, result_row
+from synapsesuggestor.control.common import list_into_query
+from synapsesuggestor.control.treenode_association import (
+    insert_treenode_associations, copy_treenode_associations
+)
+from synapsesuggestor.models import ProjectSynapseSuggestionWorkflow
+
+
+def synthetic_associations(pssw, count, seed=0, cursor=None):
+    """
+    Generate associations between random synapse slices of the workflow and random treenodes of the project.
+
+    Returns:
+        tuple: (synapse slice IDs, treenode IDs, contact areas)
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        SELECT ss.id FROM synapse_slice ss
+          INNER JOIN synapse_detection_tile tile
+            ON ss.synapse_detection_tile_id = tile.id
+          WHERE tile.synapse_suggestion_workflow_id = %s
+          LIMIT 100000;
+    ''', (pssw.synapse_suggestion_workflow_id,))
+    slice_ids = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute('SELECT tn.id FROM treenode tn WHERE tn.project_id = %s LIMIT 100000;', (pssw.project_id,))
+    treenode_ids = [row[0] for row in cursor.fetchall()]
+
+    if not slice_ids or not treenode_ids:
+        raise ValueError('treenode_association benchmark requires synapse slices and treenodes to associate')
+
+    rng = random.Random(seed)
+    return (
+        [rng.choice(slice_ids) for _ in range(count)],
+        [rng.choice(treenode_ids) for _ in range(count)],
+        [rng.randint(1, 100) for _ in range(count)],
+    )
+
+
+def _insert_values(pssw_id, columns, cursor):
+    ssw_id = ProjectSynapseSuggestionWorkflow.objects.get(id=pssw_id).synapse_suggestion_workflow_id
+    rows = [row + (pssw_id, ssw_id) for row in zip(*columns)]
+    query, args = list_into_query('''
+        INSERT INTO synapse_slice_treenode (
+          synapse_slice_id, treenode_id, contact_px, project_synapse_suggestion_workflow_id,
+          synapse_suggestion_workflow_id
+        )
+        VALUES {}
+        RETURNING id;
+    ''', rows, fmt='(%s, %s, %s, %s, %s)')
+    cursor.execute(query, args)
+    return len(cursor.fetchall())
+
+
+def _insert_unnest(pssw_id, columns, cursor):
+    insert_treenode_associations(pssw_id, *columns, cursor=cursor)
+    return len(columns[0])
+
+
+def _insert_copy(pssw_id, columns, cursor):
+    copy_treenode_associations(pssw_id, zip(*columns), cursor=cursor)
+    return len(columns[0])
+
+
+METHODS = (
+    ('values', _insert_values),
+    ('unnest', _insert_unnest),
+    ('copy', _insert_copy),
+)
+
+
+def run(workflow_id=None, size=10000, seed=0, **kwargs):
+    """
+    Insert `size` synthetic treenode associations into the workflow's most recent project workflow with each ingest
+    path, rolling back after each.
+    """
+    if workflow_id is None:
+        raise ValueError('treenode_association benchmark requires a workflow ID')
+
+    pssw = ProjectSynapseSuggestionWorkflow.objects.filter(synapse_suggestion_workflow_id=workflow_id).latest('created')
+    cursor = connection.cursor()
+    columns = synthetic_associations(pssw, size, seed, cursor)
+
+    results = []
+    for method, fn in METHODS:
+        with rolled_back():
+            count, seconds = timed(fn, pssw.id, columns, cursor)
+        results.append(result_row(
+            'treenode_association', method, count, seconds, us_per_row=1e6 * seconds / count if count else None
+        ))
+
+    return results
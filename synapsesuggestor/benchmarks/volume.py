@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark on a synthetic volume (see synapsesuggestor.benchmarks.synthetic): create a fresh workflow on
+the given workflow's stack, and time synapse slice ingest, agglomeration, treenode association ingest, and the
+association and analysis endpoints on the result. Everything is rolled back afterwards.
+"""
+from __future__ import division
+import json
+import random
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from synapsesuggestor.benchmarks.common import rolled_back, timed, result_row, call_view, list_params, response_rows
+from synapsesuggestor.benchmarks.synthetic import (
+    synthetic_synapse_objects, synapse_slice_records, synthetic_skeletons, create_skeletons
+)
+from synapsesuggestor.control import analysis, treenode_association as node_assoc, workflow as workflow_views
+from synapsesuggestor.control.cache import clear_caches
+from synapsesuggestor.control.common import resolve_workflow
+from synapsesuggestor.control.synapse_detection import load_synapse_slices, agglomerate_synapse_slices_by_layer
+from synapsesuggestor.models import SynapseSuggestionWorkflow, ProjectSynapseSuggestionWorkflow
+
+BENCHMARK = 'volume'
+
+
+def _benchmark_user():
+    user_model = get_user_model()
+    user = user_model.objects.filter(is_superuser=True).order_by('id').first()
+    if user is None:
+        raise ValueError('volume benchmark requires a superuser to create skeletons as')
+    return user
+
+
+def _create_workflow(project_id, stack_id, tile_size, seed, user):
+    """Create a synthetic synapse suggestion workflow and project workflow through the workflow endpoints"""
+    hashcode = 'synthetic-benchmark-{}'.format(seed)
+    _, content = call_view(workflow_views.get_workflow, 'get', user, {
+        'stack_id': stack_id, 'detection_hash': hashcode, 'tile_size': tile_size,
+    })
+    ssw_id = json.loads(content.decode('utf-8'))['workflow_id']
+    call_view(workflow_views.get_project_workflow, 'get', user, {
+        'workflow_id': ssw_id, 'association_hash': hashcode,
+    }, project_id=project_id)
+    return resolve_workflow(project_id, ssw_id=ssw_id)
+
+
+def _time_view(method_name, view, method, user, param_sets, **view_kwargs):
+    """Call a view once for each set of parameters, and time all of the calls together"""
+    def call_all():
+        return sum(response_rows(call_view(view, method, user, params, **view_kwargs)[1]) for params in param_sets)
+
+    rows, seconds = timed(call_all)
+    return result_row(
+        BENCHMARK, method_name, rows, seconds, requests=len(param_sets),
+        ms_per_request=1000 * seconds / len(param_sets) if param_sets else None
+    )
+
+
+def _endpoint_results(workflow, user, skeleton_ids, object_ids, distance):
+    project_id = workflow.project_id
+    per_skeleton = [{'skid': skid, 'project_workflow_id': workflow.pssw_id} for skid in skeleton_ids]
+    objects = list_params('synapse_object_ids', object_ids)
+
+    results = [
+        _time_view(
+            'treenode_associations', node_assoc.get_treenode_associations, 'get', user, per_skeleton,
+            project_id=project_id
+        ),
+    ]
+    for dimensions in (2, 3):
+        results.append(_time_view(
+            'near_skeleton_{}d'.format(dimensions), node_assoc.get_synapse_slices_near_skeletons, 'get', user,
+            [dict(params, distance=distance, dimensions=dimensions) for params in per_skeleton], project_id=project_id
+        ))
+
+    results.extend([
+        _time_view(
+            'skeleton_synapses', analysis.get_skeleton_synapses, 'get', user,
+            [{'skeleton_id': skid, 'workflow_id': workflow.ssw_id} for skid in skeleton_ids], project_id=project_id
+        ),
+        _time_view(
+            'skeleton_synapses_batch', analysis.get_skeletons_synapses, 'post', user,
+            [dict(list_params('skeleton_ids', skeleton_ids), workflow_id=workflow.ssw_id)], project_id=project_id
+        ),
+        _time_view(
+            'intersecting_connectors_edge', analysis.get_intersecting_connectors, 'post', user,
+            [dict(objects, mode='edge', tolerance=distance)], project_id=project_id
+        ),
+        _time_view(
+            'intersecting_connectors_node', analysis.get_intersecting_connectors, 'post', user,
+            [dict(objects, mode='node', tolerance=distance)], project_id=project_id
+        ),
+        _time_view('partners', analysis.get_partners, 'post', user, [objects], project_id=project_id),
+        _time_view('synapse_extents', analysis.get_synapse_extents, 'get', user, [objects], project_id=project_id),
+        _time_view(
+            'workflow_info', workflow_views.get_workflows_info, 'get', user, [{'stack_id': workflow.stack_id}],
+            project_id=project_id
+        ),
+    ])
+    return results
+
+
+def run(workflow_id=None, size=10000, seed=0, sections=50, skeletons=None, objects_per_skeleton=20,
+        sample_skeletons=20, sample_objects=1000, distance=None, **kwargs):
+    """
+    Generate a volume of `size` synthetic synapse slices over `sections` z sections, and enough skeletons to touch
+    about a fifth of its synapse objects, in the project and stack of the given workflow, and time each stage.
+
+    Endpoints are timed for `sample_skeletons` skeletons and `sample_objects` synapse objects; per-skeleton endpoints
+    are called once per skeleton. `distance` (in project space) is used for proximity searches and connector
+    tolerances, and defaults to 2 pixels.
+    """
+    if workflow_id is None:
+        raise ValueError('volume benchmark requires a workflow ID')
+
+    source_ssw = SynapseSuggestionWorkflow.objects.select_related('synapse_detection_tiling').get(id=workflow_id)
+    tiling = source_ssw.synapse_detection_tiling
+    project_id = ProjectSynapseSuggestionWorkflow.objects.filter(
+        synapse_suggestion_workflow_id=workflow_id
+    ).latest('created').project_id
+    user = _benchmark_user()
+    rng = random.Random(seed)
+    cursor = connection.cursor()
+
+    results = []
+    try:
+        with rolled_back():
+            # the workflow endpoint creates square tilings
+            workflow = _create_workflow(project_id, tiling.stack_id, tiling.tile_width_px, seed, user)
+            if distance is None:
+                distance = 2 * workflow.resolution[0]
+
+            tile_size = (workflow.tile_width_px, workflow.tile_height_px)
+            objects = synthetic_synapse_objects(size, tile_size, sections, seed=seed)
+            if skeletons is None:
+                skeletons = max(1, len(objects) // (5 * objects_per_skeleton))
+            skeleton_paths = synthetic_skeletons(objects, skeletons, objects_per_skeleton, seed)
+
+            (count, id_rows), seconds = timed(
+                load_synapse_slices, workflow.ssw_id, synapse_slice_records(objects, tile_size, seed),
+                return_ids=True, cursor=cursor
+            )
+            results.append(result_row(BENCHMARK, 'slice_ingest', count, seconds, objects=len(objects)))
+            slice_ids = {int(row[3]): row[4] for row in id_rows}
+            del id_rows
+
+            layers, seconds = timed(lambda: list(agglomerate_synapse_slices_by_layer(workflow.ssw_id, cursor=cursor)))
+            results.append(result_row(
+                BENCHMARK, 'agglomeration', sum(layer['slices'] for layer in layers), seconds, layers=len(layers),
+                new_objects=sum(layer['new_objects'] for layer in layers)
+            ))
+
+            created, seconds = timed(create_skeletons, workflow, user.id, skeleton_paths, cursor)
+            results.append(result_row(
+                BENCHMARK, 'skeleton_ingest', sum(len(treenode_ids) for _, treenode_ids in created), seconds,
+                skeletons=len(created)
+            ))
+
+            associations = [
+                (slice_ids[naive_id], treenode_ids[node_idx], contact_px)
+                for (_, treenode_ids), (_, skeleton_associations) in zip(created, skeleton_paths)
+                for node_idx, naive_id, contact_px in skeleton_associations
+            ]
+            synapse_slice_ids, treenode_ids, contact_pxs = (list(column) for column in zip(*associations))
+            _, seconds = timed(
+                call_view, node_assoc.add_treenode_synapse_associations_bulk, 'post', user, {
+                    'project_workflow_id': workflow.pssw_id,
+                    'synapse_slice_ids': json.dumps(synapse_slice_ids),
+                    'treenode_ids': json.dumps(treenode_ids),
+                    'contact_px': json.dumps(contact_pxs),
+                    'method': 'copy',
+                }, project_id=project_id
+            )
+            results.append(result_row(BENCHMARK, 'association_ingest', len(associations), seconds))
+
+            cursor.execute('ANALYZE synapse_slice, synapse_slice_synapse_object, synapse_slice_treenode, treenode;')
+
+            cursor.execute('''
+                SELECT DISTINCT ss_so.synapse_object_id FROM synapse_slice_synapse_object ss_so
+                  INNER JOIN unnest(%s::bigint[]) AS ss (id)
+                    ON ss_so.synapse_slice_id = ss.id;
+            ''', (synapse_slice_ids,))
+            object_ids = sorted(row[0] for row in cursor.fetchall())
+
+            results.extend(_endpoint_results(
+                workflow, user,
+                rng.sample([skid for skid, _ in created], min(sample_skeletons, len(created))),
+                rng.sample(object_ids, min(sample_objects, len(object_ids))),
+                distance
+            ))
+    finally:
+        # cached workflow constants may refer to rolled-back rows
+        clear_caches()
+
+    return results
@@ -6,15 +6,28 @@ from __future__ import division
 
 from django.db import connection
 from django.http import JsonResponse
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 
 from catmaid.control.common import get_request_list
 
-from synapsesuggestor.control.common import get_most_recent_project_SS_workflow, get_translation_resolution
-from synapsesuggestor.models import ProjectSynapseSuggestionWorkflow
+from synapsesuggestor.control.columnar import TABULAR_RENDERER_CLASSES, tabular_response
+from synapsesuggestor.control.common import iter_query, resolve_workflow
+
+SKELETON_SYNAPSES_COLUMNS = [
+    'synapse', 'nodes', 'skeleton_id',
+    'xs', 'ys', 'zs', 'z_slices',
+    'size_px', 'contact_px', 'uncertainty_avg'
+]
+
+INTERSECTING_CONNECTORS_COLUMNS = [
+    'synapse_object_id',
+    'connector_id', 'connector_x', 'connector_y', 'connector_z', 'connector_confidence', 'connector_creator',
+    'skeleton_ids', 'treenode_ids', 'distance'
+]
 
 
 @api_view(['GET'])
+@renderer_classes(TABULAR_RENDERER_CLASSES)
 def get_skeleton_synapses(request, project_id=None):
     """
     Get the details of synapse slices detected in the given workflow ID associated with the given skeleton IDs.
@@ -32,6 +45,9 @@ def get_skeleton_synapses(request, project_id=None):
     contact area, in pixels, of the synapse object's interactions with the skeleton
     average uncertainty of the synapse slice detection
 
+    The response can instead be a columnar Arrow or msgpack encoding, through the Accept header or 'format' parameter
+    (see synapsesuggestor.control.columnar).
+
     ---
     parameters:
       - name: workflow_id
@@ -60,41 +76,152 @@ def get_skeleton_synapses(request, project_id=None):
         required: true
     """
 
-    # todo: weight averages by slice size
-
-    columns = [
-        'synapse', 'nodes', 'skeleton_id',
-        'xs', 'ys', 'zs', 'z_slices',
-        'size_px', 'contact_px', 'uncertainty_avg'
-    ]
     skid = request.GET.get('skeleton_id')
     if skid is None:
-        return JsonResponse({'columns': columns, 'data': []})
+        return tabular_response(request, [], SKELETON_SYNAPSES_COLUMNS)
 
-    ssw_id = request.GET.get('workflow_id')
+    workflow = resolve_workflow(project_id, ssw_id=request.GET.get('workflow_id'))
 
-    if ssw_id is None:
-        pssw = get_most_recent_project_SS_workflow(project_id)
-    else:
-        pssw = ProjectSynapseSuggestionWorkflow.objects.get(
-            synapse_suggestion_workflow_id=ssw_id, project_id=project_id
-        )
+    return tabular_response(
+        request, iter_query(*_skeleton_synapses_query([int(skid)], workflow.pssw_id)), SKELETON_SYNAPSES_COLUMNS
+    )
+
+
+@api_view(['POST'])
+def get_skeletons_synapses(request, project_id=None):
+    """
+    Get the details of synapse slices detected in the given workflow ID associated with each of the given skeleton
+    IDs, as returned by get_skeleton_synapses, in a single query. Optionally also get the connectors intersecting the
+    synapse objects, as returned by get_intersecting_connectors.
+
+    ---
+    parameters:
+      - name: workflow_id
+        description: ID of synapse suggestion workflow through which synapse slices were detected
+        type: integer
+        required: false
+        paramType: form
+      - name: skeleton_ids
+        description: Skeletons to get synapse slices associated with
+        type: array
+        items:
+          type: integer
+        paramType: form
+        required: false
+      - name: include_connectors
+        description: Whether to also get the connectors intersecting each skeleton's synapse objects (default false)
+        type: boolean
+        required: false
+        paramType: form
+      - name: mode
+        description: As for get_intersecting_connectors
+        type: string
+        required: false
+        paramType: form
+      - name: tolerance
+        description: As for get_intersecting_connectors
+        type: float
+        required: false
+        paramType: form
+    type:
+      columns:
+        type: array
+        items:
+          type: string
+        description: headers for columns in data arrays, as for get_skeleton_synapses
+        required: true
+      data:
+        type: object
+        description: object whose keys are skeleton IDs and values are arrays of rows, as for get_skeleton_synapses
+        required: true
+      connector_columns:
+        type: array
+        items:
+          type: string
+        description: headers for columns in connectors arrays, as for get_intersecting_connectors
+        required: false
+      connectors:
+        type: object
+        description: > object whose keys are skeleton IDs and values are arrays of rows describing connectors
+          intersecting that skeleton's synapse objects, as for get_intersecting_connectors
+        required: false
+    """
+    skids = get_request_list(request.POST, 'skeleton_ids', tuple(), int)
+    include_connectors = request.POST.get('include_connectors', 'false').lower() == 'true'
+
+    response = {'columns': SKELETON_SYNAPSES_COLUMNS, 'data': {skid: [] for skid in skids}}
+    if include_connectors:
+        response['connector_columns'] = INTERSECTING_CONNECTORS_COLUMNS
+        response['connectors'] = {skid: [] for skid in skids}
+
+    if not skids:
+        return JsonResponse(response)
+
+    workflow = resolve_workflow(project_id, ssw_id=request.POST.get('workflow_id'))
 
     cursor = connection.cursor()
 
+    skid_idx = SKELETON_SYNAPSES_COLUMNS.index('skeleton_id')
+    obj_idx = SKELETON_SYNAPSES_COLUMNS.index('synapse')
+    skids_by_obj = dict()
+    for row in _get_skeleton_synapses(skids, workflow.pssw_id, cursor):
+        response['data'][row[skid_idx]].append(row)
+        skids_by_obj.setdefault(row[obj_idx], []).append(row[skid_idx])
+
+    if include_connectors and skids_by_obj:
+        rows = _get_intersecting_connectors(
+            project_id, list(skids_by_obj), request.POST.get('mode', 'edge'), float(request.POST.get('tolerance', 0)),
+            cursor
+        )
+        for row in rows:
+            for skid in skids_by_obj[row[0]]:
+                response['connectors'][skid].append(row)
+
+    return JsonResponse(response)
+
+
+def _get_skeleton_synapses(skeleton_ids, pssw_id, cursor=None):
+    """
+    Get one row per skeleton and synapse object associated with it, with the columns in SKELETON_SYNAPSES_COLUMNS.
+
+    Args:
+        skeleton_ids(list):
+        pssw_id(int): Project synapse suggestion workflow ID
+        cursor(django.db.connection.cursor, optional):
+
+    Returns:
+        list
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute(*_skeleton_synapses_query(skeleton_ids, pssw_id))
+    return cursor.fetchall()
+
+
+def _skeleton_synapses_query(skeleton_ids, pssw_id):
+    """
+    Get the query and parameters for _get_skeleton_synapses.
+
+    Returns:
+        tuple: (query, params)
+    """
+    # todo: weight averages by slice size
     # todo: why is this casting necessary? unit tests produced strings
-    cursor.execute('''
+    return '''
         SELECT
             ss_so_synapse_object_id, array_agg(tn_id), tn_skeleton_id,
             cast(round(avg(that_ss_xs_centroid)) as int), cast(round(avg(that_ss_ys_centroid)) as int),
             cast(round(avg(tile_z_tile_idx)) as int), array_agg(tile_z_tile_idx),
             sum(that_ss_size_px), sum(ss_tn_contact_px), avg(that_ss_uncertainty)
         FROM (
-            SELECT DISTINCT ON (that_ss.id)
+            SELECT DISTINCT ON (tn.skeleton_id, that_ss.id)
               ss_so.synapse_object_id, tn.id, tn.skeleton_id,
               that_ss.xs_centroid, that_ss.ys_centroid, tile.z_tile_idx,
               that_ss.size_px, ss_tn.contact_px, that_ss.uncertainty
             FROM treenode tn
+              INNER JOIN unnest(%s::bigint[]) AS skids (id)
+                ON tn.skeleton_id = skids.id
               INNER JOIN synapse_slice_treenode ss_tn
                 ON tn.id = ss_tn.treenode_id
               INNER JOIN synapse_slice this_ss
@@ -105,20 +232,18 @@ def get_skeleton_synapses(request, project_id=None):
                 ON ss_so.synapse_slice_id = that_ss.id
               INNER JOIN synapse_detection_tile tile
                 ON that_ss.synapse_detection_tile_id = tile.id
-            WHERE tn.skeleton_id = %s
-              AND ss_tn.project_synapse_suggestion_workflow_id = %s
+            WHERE ss_tn.project_synapse_suggestion_workflow_id = %s
         ) as rows (
           ss_so_synapse_object_id, tn_id, tn_skeleton_id,
           that_ss_xs_centroid, that_ss_ys_centroid, tile_z_tile_idx,
           that_ss_size_px, ss_tn_contact_px, that_ss_uncertainty
         )
         GROUP BY ss_so_synapse_object_id, tn_skeleton_id;
-    ''', (skid, pssw.id))
-
-    return JsonResponse({'columns': columns, 'data': cursor.fetchall()})
+    ''', (list(skeleton_ids), pssw_id)
 
 
 @api_view(['POST'])
+@renderer_classes(TABULAR_RENDERER_CLASSES)
 def get_intersecting_connectors(request, project_id=None):
     """
     Given a set of synapse objects, return information connectors and treenodes they may be associated with.
@@ -128,10 +253,13 @@ def get_intersecting_connectors(request, project_id=None):
     skeleton_ids: array of skeletons to which those treenodes belong
     distance: shortest 2D distance from the synapse object to one of the edges associated with the connector
 
+    Like get_skeleton_synapses, also available in columnar binary encodings.
+
     ---
     parameters:
       - name: workflow_id
-        description: ID of synapse suggestion workflow through which synapse slices were detected
+        description: > Unused, as synapse objects belong to a single synapse suggestion workflow; accepted for
+          compatibility
         type: integer
         required: false
         paramType: form
@@ -170,138 +298,134 @@ def get_intersecting_connectors(request, project_id=None):
         required: true
     """
 
-    columns = [
-        'synapse_object_id',
-        'connector_id', 'connector_x', 'connector_y', 'connector_z', 'connector_confidence', 'connector_creator',
-        'skeleton_ids', 'treenode_ids', 'distance'
-    ]
-
     mode = request.POST.get('mode', 'edge')
 
     tolerance = float(request.POST.get('tolerance', 0))
 
     obj_ids = get_request_list(request.POST, 'synapse_object_ids', tuple(), int)
     if not obj_ids:
-        return JsonResponse({'columns': columns, 'data': []})
-
-    ssw_id = request.POST.get('workflow_id')
-    if ssw_id is None:
-        ssw_id = get_most_recent_project_SS_workflow(project_id).synapse_suggestion_workflow_id
-
-    cursor = connection.cursor()
-
-    translation, resolution = get_translation_resolution(project_id, ssw_id, cursor)
+        return tabular_response(request, [], INTERSECTING_CONNECTORS_COLUMNS)
 
-    offset_xs, offset_ys, offset_zs = translation / resolution
+    return tabular_response(
+        request, iter_query(*_intersecting_connectors_query(project_id, obj_ids, mode, tolerance)),
+        INTERSECTING_CONNECTORS_COLUMNS
+    )
 
-    params = {
-        'obj_ids': obj_ids,
-        'offset_xs': offset_xs,
-        'offset_ys': offset_ys,
-        'offset_zs': offset_zs,
-        'resolution_x': resolution[0],
-        'resolution_y': resolution[1],
-        'resolution_z': resolution[2],
-        'tolerance': tolerance,
-        'project_id': project_id
-    }
 
-    modes = {
-        'edge': _get_intersecting_connectors_edge,
-        'node': _get_intersecting_connectors_node,
-        # 'box': _get_intersecting_connectors_box  # todo?
-    }
+def _get_intersecting_connectors(project_id, obj_ids, mode='edge', tolerance=0, cursor=None):
+    """
+    Get one row per synapse object - connector intersection, with the columns in INTERSECTING_CONNECTORS_COLUMNS.
 
-    data = modes[mode](cursor, **params)
+    Synapse slices are compared in project space using their stored project-space geometries (see
+    synapsesuggestor.control.synapse_detection.sync_synapse_slice_project_geoms), so that the search can use the
+    n-dimensional GiST indices on both sides.
 
-    return JsonResponse({'columns': columns, 'data': data})
+    Args:
+        project_id(int):
+        obj_ids(list): Synapse object IDs
+        mode(str): 'edge' or 'node'
+        tolerance(float): XY distance, in project space, within which geometries are considered to intersect
+        cursor(django.db.connection.cursor, optional):
 
+    Returns:
+        list
+    """
+    if cursor is None:
+        cursor = connection.cursor()
 
-def _get_intersecting_connectors_edge(cursor=None, **kwargs):
-    cursor = cursor or connection.cursor()
+    cursor.execute(*_intersecting_connectors_query(project_id, obj_ids, mode, tolerance))
+    return cursor.fetchall()
 
-    cursor.execute('''
-          SELECT subq.syn_id, subq.c_id, subq.c_x, subq.c_y, subq.c_z, subq.c_conf, subq.c_user,
-            array_agg(tn.skeleton_id), array_agg(tn.id), subq.min_dist
-          FROM (
-            SELECT
-              ss_so.synapse_object_id,
-              c.id, c.location_x, c.location_y, c.location_z, c.confidence, c.user_id,
-              min(ST_Distance(tce.edge, ss_trans.geom_2d))
-            FROM synapse_slice_synapse_object ss_so
-            INNER JOIN unnest(%(obj_ids)s::BIGINT[]) AS syns (id)
-              ON ss_so.synapse_object_id = syns.id
-            INNER JOIN (
-              SELECT ss.id, ss.synapse_detection_tile_id, ST_TransScale(
-                ss.geom_2d, %(offset_xs)s, %(offset_ys)s, %(resolution_x)s, %(resolution_y)s
-              )
-                FROM synapse_slice ss
-            ) AS ss_trans (id, synapse_detection_tile_id, geom_2d)
-              ON ss_trans.id = ss_so.synapse_slice_id
-            INNER JOIN synapse_detection_tile tile
-              ON ss_trans.synapse_detection_tile_id = tile.id
-            INNER JOIN treenode_connector_edge tce
-              ON (tile.z_tile_idx + %(offset_zs)s) * %(resolution_z)s BETWEEN ST_ZMin(tce.edge) AND ST_ZMax(tce.edge)
-              AND ST_DWithin(tce.edge, ss_trans.geom_2d, %(tolerance)s)
-            INNER JOIN treenode_connector tc
-              ON tc.id = tce.id
-            INNER JOIN relation
-              ON tc.relation_id = relation.id
-            INNER JOIN connector c
-              ON c.id = tc.connector_id
-            WHERE tce.project_id = %(project_id)s
-              AND relation.relation_name = ANY(ARRAY['presynaptic_to', 'postsynaptic_to'])
-            GROUP BY ss_so.synapse_object_id, c.id
-          ) AS subq (syn_id, c_id, c_x, c_y, c_z, c_conf, c_user, min_dist)
-          INNER JOIN treenode_connector tc2
-            ON tc2.connector_id = subq.c_id
-          INNER JOIN treenode tn
-            ON tc2.treenode_id = tn.id
-          GROUP BY subq.syn_id, subq.c_id, subq.c_x, subq.c_y, subq.c_z, subq.c_conf, subq.c_user, subq.min_dist;
-        ''', kwargs)
 
-    return cursor.fetchall()
+def _intersecting_connectors_query(project_id, obj_ids, mode='edge', tolerance=0):
+    """
+    Get the query and parameters for _get_intersecting_connectors.
 
+    Returns:
+        tuple: (query, params)
+    """
+    params = {
+        'obj_ids': list(obj_ids),
+        'tolerance': tolerance,
+        'project_id': project_id
+    }
 
-def _get_intersecting_connectors_node(cursor=None, **kwargs):
-    # todo: test
-    cursor = cursor or connection.cursor()
+    return INTERSECTING_CONNECTORS_QUERIES[mode], params
 
-    cursor.execute('''
-      SELECT subq.syn_id, subq.c_id, subq.c_x, subq.c_y, subq.c_z, subq.c_conf, subq.c_user,
-        array_agg(tn.skeleton_id), array_agg(tn.id), subq.min_dist
-      FROM (
-        SELECT
-          ss_so.synapse_object_id,
-          c.id, c.location_x, c.location_y, c.location_z, c.confidence, c.user_id,
-          min(ST_Distance(ST_MakePoint(c.location_x, c.location_y), ss_trans.geom_2d))
-        FROM synapse_slice_synapse_object ss_so
-        INNER JOIN unnest(%(obj_ids)s::BIGINT[]) AS syns (id)
-          ON ss_so.synapse_object_id = syns.id
-        INNER JOIN (
-          SELECT ss.id, ss.synapse_detection_tile_id, ST_TransScale(
-            ss.geom_2d, %(offset_xs)s, %(offset_ys)s, %(resolution_x)s, %(resolution_y)s
-          )
-            FROM synapse_slice ss
-        ) AS ss_trans (id, synapse_detection_tile_id, geom_2d)
-          ON ss_trans.id = ss_so.synapse_slice_id
-        INNER JOIN synapse_detection_tile tile
-          ON ss_trans.synapse_detection_tile_id = tile.id
-        INNER JOIN connector c
-          ON (tile.z_tile_idx + %(offset_zs)s) * %(resolution_z)s = c.location_z
-          -- better way to handle geom?
-          AND ST_DWithin(ST_MakePoint(c.location_x, c.location_y), ss_trans.geom_2d, %(tolerance)s)
-          AND c.project_id = %(project_id)s
-        GROUP BY ss_so.synapse_object_id, c.id
-      ) AS subq (syn_id, c_id, c_x, c_y, c_z, c_conf, c_user, min_dist)
-      INNER JOIN treenode_connector tc2
-        ON tc2.connector_id = subq.c_id
-      INNER JOIN treenode tn
-        ON tc2.treenode_id = tn.id
-      GROUP BY subq.syn_id, subq.c_id, subq.c_x, subq.c_y, subq.c_z, subq.c_conf, subq.c_user, subq.min_dist;
-    ''', kwargs)
 
-    return cursor.fetchall()
+# the &&& bounding box test can use the n-dimensional indices on both geometries; the z extent of a slice's geometry is
+# its section
+INTERSECTING_CONNECTORS_EDGE_QUERY = '''
+        SELECT subq.syn_id, subq.c_id, subq.c_x, subq.c_y, subq.c_z, subq.c_conf, subq.c_user,
+          array_agg(tn.skeleton_id), array_agg(tn.id), subq.min_dist
+        FROM (
+          SELECT
+            ss_so.synapse_object_id,
+            c.id, c.location_x, c.location_y, c.location_z, c.confidence, c.user_id,
+            min(ST_Distance(tce.edge, ssp.geom_p))
+          FROM synapse_slice_synapse_object ss_so
+          INNER JOIN unnest(%(obj_ids)s::BIGINT[]) AS syns (id)
+            ON ss_so.synapse_object_id = syns.id
+          INNER JOIN synapse_slice_project_geom ssp
+            ON ssp.synapse_slice_id = ss_so.synapse_slice_id
+            AND ssp.project_id = %(project_id)s
+          INNER JOIN treenode_connector_edge tce
+            ON tce.edge &&& ST_Expand(ssp.geom_p, %(tolerance)s)
+            AND ST_ZMin(ssp.geom_p) BETWEEN ST_ZMin(tce.edge) AND ST_ZMax(tce.edge)
+            AND ST_DWithin(tce.edge, ssp.geom_p, %(tolerance)s)
+          INNER JOIN treenode_connector tc
+            ON tc.id = tce.id
+          INNER JOIN relation
+            ON tc.relation_id = relation.id
+          INNER JOIN connector c
+            ON c.id = tc.connector_id
+          WHERE tce.project_id = %(project_id)s
+            AND relation.relation_name = ANY(ARRAY['presynaptic_to', 'postsynaptic_to'])
+          GROUP BY ss_so.synapse_object_id, c.id
+        ) AS subq (syn_id, c_id, c_x, c_y, c_z, c_conf, c_user, min_dist)
+        INNER JOIN treenode_connector tc2
+          ON tc2.connector_id = subq.c_id
+        INNER JOIN treenode tn
+          ON tc2.treenode_id = tn.id
+        GROUP BY subq.syn_id, subq.c_id, subq.c_x, subq.c_y, subq.c_z, subq.c_conf, subq.c_user, subq.min_dist;
+'''
+
+# todo: test
+INTERSECTING_CONNECTORS_NODE_QUERY = '''
+        SELECT subq.syn_id, subq.c_id, subq.c_x, subq.c_y, subq.c_z, subq.c_conf, subq.c_user,
+          array_agg(tn.skeleton_id), array_agg(tn.id), subq.min_dist
+        FROM (
+          SELECT
+            ss_so.synapse_object_id,
+            c.id, c.location_x, c.location_y, c.location_z, c.confidence, c.user_id,
+            min(ST_Distance(cg.geom, ssp.geom_p))
+          FROM synapse_slice_synapse_object ss_so
+          INNER JOIN unnest(%(obj_ids)s::BIGINT[]) AS syns (id)
+            ON ss_so.synapse_object_id = syns.id
+          INNER JOIN synapse_slice_project_geom ssp
+            ON ssp.synapse_slice_id = ss_so.synapse_slice_id
+            AND ssp.project_id = %(project_id)s
+          INNER JOIN connector_geom cg
+            ON cg.geom &&& ST_Expand(ssp.geom_p, %(tolerance)s)
+            AND ST_Z(cg.geom)::real = ST_ZMin(ssp.geom_p)::real
+            AND ST_DWithin(cg.geom, ssp.geom_p, %(tolerance)s)
+            AND cg.project_id = %(project_id)s
+          INNER JOIN connector c
+            ON c.id = cg.id
+          GROUP BY ss_so.synapse_object_id, c.id
+        ) AS subq (syn_id, c_id, c_x, c_y, c_z, c_conf, c_user, min_dist)
+        INNER JOIN treenode_connector tc2
+          ON tc2.connector_id = subq.c_id
+        INNER JOIN treenode tn
+          ON tc2.treenode_id = tn.id
+        GROUP BY subq.syn_id, subq.c_id, subq.c_x, subq.c_y, subq.c_z, subq.c_conf, subq.c_user, subq.min_dist;
+'''
+
+INTERSECTING_CONNECTORS_QUERIES = {
+    'edge': INTERSECTING_CONNECTORS_EDGE_QUERY,
+    'node': INTERSECTING_CONNECTORS_NODE_QUERY,
+    # 'box': INTERSECTING_CONNECTORS_BOX_QUERY  # todo?
+}
 
 
 @api_view(['GET'])
@@ -341,19 +465,18 @@ def get_synapse_extents(request, project_id=None):
     xy_pad = int(request.GET.get('xy_padding', 0))
 
     cursor = connection.cursor()
-    # could use ST_Extent, but would then have to interrogate str to add padding
     cursor.execute('''
-        SELECT ss_so.synapse_object_id, array_agg(ss.id),
-            min(ST_XMin(ss.geom_2d)) - %(xy_pad)s, max(ST_XMax(ss.geom_2d)) + %(xy_pad)s,
-            min(ST_YMin(ss.geom_2d)) - %(xy_pad)s, max(ST_YMax(ss.geom_2d)) + %(xy_pad)s,
-            min(tile.z_tile_idx) - %(z_pad)s, max(tile.z_tile_idx) + %(z_pad)s
-          FROM synapse_slice_synapse_object ss_so
-          INNER JOIN synapse_slice ss
-            ON ss_so.synapse_slice_id = ss.id
-          INNER JOIN synapse_detection_tile tile
-            ON ss.synapse_detection_tile_id = tile.id
-          WHERE ss_so.synapse_object_id = ANY(%(syn_ids)s::bigint[])
-          GROUP BY ss_so.synapse_object_id;
+        SELECT sos.synapse_object_id,
+            array(
+              SELECT ss_so.synapse_slice_id FROM synapse_slice_synapse_object ss_so
+                WHERE ss_so.synapse_object_id = sos.synapse_object_id
+                ORDER BY ss_so.synapse_slice_id
+            ),
+            sos.xs_min - %(xy_pad)s, sos.xs_max + %(xy_pad)s,
+            sos.ys_min - %(xy_pad)s, sos.ys_max + %(xy_pad)s,
+            sos.zs_min - %(z_pad)s, sos.zs_max + %(z_pad)s
+          FROM synapse_object_summary sos
+          WHERE sos.synapse_object_id = ANY(%(syn_ids)s::bigint[]);
     ''', {'z_pad': z_pad, 'xy_pad': xy_pad, 'syn_ids': syn_ids})
 
     output = dict()
@@ -375,21 +498,17 @@ def get_synapse_extents(request, project_id=None):
 
 
 @api_view(['POST'])
+@renderer_classes(TABULAR_RENDERER_CLASSES)
 def get_partners(request, project_id=None):
     # todo: document, test
     syn_ids = get_request_list(request.POST, 'synapse_object_ids', tuple(), int)
 
-    response = {
-        'columns': ['synapse_object_id', 'tnids', 'skid', 'contact_px'],
-        'data': []
-    }
+    columns = ['synapse_object_id', 'tnids', 'skid', 'contact_px']
 
     if not syn_ids:
-        return JsonResponse(response)
-
-    cursor = connection.cursor()
+        return tabular_response(request, [], columns)
 
-    cursor.execute('''
+    rows = iter_query('''
         SELECT
             ss_so.synapse_object_id, array_agg(tn.id), tn.skeleton_id, sum(ss_tn.contact_px)
           FROM synapse_slice_synapse_object ss_so
@@ -401,7 +520,6 @@ def get_partners(request, project_id=None):
             ON tn.id = ss_tn.treenode_id
           WHERE tn.project_id = %(pid)s
           GROUP BY ss_so.synapse_object_id, tn.skeleton_id;
-    ''', {'pid': project_id, 'syns': syn_ids})
+    ''', {'pid': project_id, 'syns': list(syn_ids)})
 
-    response['data'] = cursor.fetchall()
-    return JsonResponse(response)
+    return tabular_response(request, rows, columns)
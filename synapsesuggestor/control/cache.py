@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+In-process caches of per-project and per-workflow constants, such as stack translations and resolutions, tile sizes,
+the project's current workflow and relation IDs, which would otherwise be queried on most requests.
+
+Each cache is bounded in size (least recently used entries are evicted first) and entries expire after a TTL. All
+caches are cleared when a workflow, tiling, stack, project stack or relation is saved or deleted through the ORM, and
+again when the transaction doing so commits (see synapsesuggestor.apps). Other processes, and changes made with raw
+SQL, are only seen once entries expire. Values read within a transaction are only cached once it commits, and missing
+values (None) are not cached.
+"""
+from __future__ import division
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+from django.db import connection, transaction
+from django.http import JsonResponse
+from rest_framework.decorators import api_view
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAXSIZE = 1024
+DEFAULT_TTL = 300  # seconds
+
+CACHES = OrderedDict()
+
+_MISSING = object()
+
+
+class TTLCache(object):
+    """Thread-safe mapping with a maximum size, least-recently-used eviction and per-entry expiry"""
+    def __init__(self, name, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL, timer=time.time):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = self._timer()
+        with self._lock:
+            expires, value = self._entries.get(key, (None, _MISSING))
+            if value is _MISSING or expires <= now:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return default
+
+            # move to the most recently used end
+            del self._entries[key]
+            self._entries[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self._timer() + self.ttl, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, fn):
+        """
+        Get the cached value for the key, or call fn (outside of the cache's lock) to compute it.
+
+        None is not cached, so that rows created later are found. A value computed within a transaction is only cached
+        once the transaction commits, as it may have been read from rows which are rolled back.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = fn()
+            if value is not None:
+                if connection.in_atomic_block:
+                    transaction.on_commit(lambda: self.set(key, value))
+                else:
+                    self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else None,
+        }
+
+
+def get_cache(name, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+    """Get the named cache, creating it if necessary"""
+    if name not in CACHES:
+        CACHES[name] = TTLCache(name, maxsize, ttl)
+    return CACHES[name]
+
+
+def clear_caches(reset_stats=False):
+    """Clear all caches, and optionally reset their counters"""
+    for cache in CACHES.values():
+        cache.clear()
+        if reset_stats:
+            cache.reset_stats()
+
+
+def invalidate_caches(sender=None, **kwargs):
+    """
+    Signal receiver which clears all caches immediately, and again once the current transaction commits, so that
+    values read by other requests before the commit are not kept.
+    """
+    logger.debug('Clearing synapsesuggestor caches after change to %s', getattr(sender, '__name__', sender))
+    clear_caches()
+    transaction.on_commit(clear_caches)
+
+
+@api_view(['GET'])
+def get_cache_stats(request):
+    """
+    Get the size and hit rate of each of this process's caches.
+    ---
+    type:
+      object
+    """
+    return JsonResponse({name: cache.stats() for name, cache in CACHES.items()})
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar binary encodings of the {columns, data} results returned by the analysis endpoints, chosen by DRF content
+negotiation (the request's Accept header, or the 'format' query parameter).
+
+application/json (default): the usual row-wise {columns, data} JSON object, streamed
+application/vnd.apache.arrow.stream (format=arrow): an Arrow IPC stream containing one record batch (requires
+    pyarrow)
+application/x-msgpack (format=msgpack): a msgpack map {columns, data} where data is a list of columns (requires
+    msgpack). Columns whose values are all integers or all numbers are sent as typed arrays: maps with the numpy dtype
+    string ('dtype') and the little-endian array bytes ('buffer'), which decode_msgpack_columns turns back into numpy
+    arrays. Other columns are lists.
+
+Both binary libraries are optional, and their renderers are only offered if they are installed, so a request which
+only accepts an unavailable encoding gets a 406 response.
+"""
+from decimal import Decimal
+import numbers
+
+import numpy as np
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from six import integer_types
+
+from synapsesuggestor.control.common import StreamedQuery, streaming_json_response
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def rows_to_columns(rows, column_count):
+    """Transpose an iterable of rows into a list of column lists"""
+    columns = [[] for _ in range(column_count)]
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+    return columns
+
+
+def typed_column(values):
+    """
+    Get a numpy array of a column's values if they are all integers (int64) or all real numbers (float64).
+
+    Returns:
+        numpy.ndarray or None
+    """
+    if not values:
+        return None
+    if all(isinstance(value, integer_types) and not isinstance(value, bool) for value in values):
+        return np.array(values, dtype='<i8')
+    if all(isinstance(value, (numbers.Real, Decimal)) and not isinstance(value, bool) for value in values):
+        return np.array([float(value) for value in values], dtype='<f8')
+    return None
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    raise TypeError('Cannot encode {} as msgpack'.format(type(obj)))
+
+
+def encode_msgpack_columns(column_names, columns):
+    """
+    Encode columns as msgpack.
+
+    Args:
+        column_names(list):
+        columns(list): list of column value lists
+
+    Returns:
+        bytes
+    """
+    data = []
+    for values in columns:
+        array = typed_column(values)
+        if array is None:
+            data.append(values)
+        else:
+            data.append({'dtype': array.dtype.str, 'buffer': array.tobytes()})
+
+    return msgpack.packb({'columns': column_names, 'data': data}, use_bin_type=True, default=_msgpack_default)
+
+
+def decode_msgpack_columns(content):
+    """
+    Decode the output of encode_msgpack_columns.
+
+    Returns:
+        dict: {'columns': column names, 'data': list of columns}, where typed columns are numpy arrays
+    """
+    decoded = msgpack.unpackb(content, raw=False)
+    decoded['data'] = [
+        np.frombuffer(column['buffer'], dtype=column['dtype']) if isinstance(column, dict) else column
+        for column in decoded['data']
+    ]
+    return decoded
+
+
+def encode_arrow_columns(column_names, columns):
+    """
+    Encode columns as an Arrow IPC stream with a single record batch.
+
+    Args:
+        column_names(list):
+        columns(list): list of column value lists
+
+    Returns:
+        bytes
+    """
+    arrays = []
+    for values in columns:
+        array = typed_column(values)
+        arrays.append(pyarrow.array(values if array is None else array))
+
+    batch = pyarrow.RecordBatch.from_arrays(arrays, column_names)
+    sink = pyarrow.BufferOutputStream()
+    writer = pyarrow.RecordBatchStreamWriter(sink, batch.schema)
+    writer.write_batch(batch)
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+
+class ColumnarRenderer(BaseRenderer):
+    """Base class of DRF renderers for {columns, data} results in a columnar binary encoding"""
+    charset = None
+    render_style = 'binary'
+
+    def encode(self, column_names, columns):
+        raise NotImplementedError()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        column_names = data['columns']
+        return self.encode(column_names, rows_to_columns(data['data'], len(column_names)))
+
+
+class ArrowRenderer(ColumnarRenderer):
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+    def encode(self, column_names, columns):
+        return encode_arrow_columns(column_names, columns)
+
+
+class MsgpackRenderer(ColumnarRenderer):
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+
+    def encode(self, column_names, columns):
+        return encode_msgpack_columns(column_names, columns)
+
+
+def _available_columnar_renderers():
+    renderers = []
+    if pyarrow is not None:
+        renderers.append(ArrowRenderer)
+    if msgpack is not None:
+        renderers.append(MsgpackRenderer)
+    return tuple(renderers)
+
+
+# renderer classes for endpoints which respond with tabular_response
+TABULAR_RENDERER_CLASSES = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + _available_columnar_renderers()
+
+
+def tabular_response(request, rows, columns):
+    """
+    Respond with rows in the encoding negotiated by DRF: streamed {columns, data} JSON by default, or a columnar
+    binary encoding if the view has TABULAR_RENDERER_CLASSES and one of them was accepted.
+
+    Args:
+        request(rest_framework.request.Request):
+        rows(iterable): Iterable of rows, e.g. from synapsesuggestor.control.common.iter_query
+        columns(list): Column headers
+
+    Returns:
+        django.http.HttpResponse
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+
+    if isinstance(renderer, ColumnarRenderer):
+        column_values = rows_to_columns(rows, len(columns))
+        response = HttpResponse(renderer.encode(columns, column_values), content_type=renderer.media_type)
+        response.row_count = len(column_values[0]) if column_values else 0
+        response.streamed_queries = [rows] if isinstance(rows, StreamedQuery) else []
+    else:
+        response = streaming_json_response(rows, columns)
+
+    response['Vary'] = 'Accept'
+    return response
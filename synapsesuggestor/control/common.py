@@ -1,18 +1,28 @@
 # -*- coding: utf-8 -*-
 import logging
+from collections import namedtuple
 from string import Formatter
+from itertools import chain, count
 import json
+import struct
+import time
 
 from six import string_types
 import numpy as np
 
-from django.db import connection
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from django.utils.encoding import force_text
 
+from synapsesuggestor.control.cache import get_cache
 from synapsesuggestor.models import ProjectSynapseSuggestionWorkflow
 
 
 logger = logging.getLogger(__name__)
 
+project_workflow_cache = get_cache('project_workflow')
+
 
 def flatten(arg):
     elements = []
@@ -95,6 +105,281 @@ def list_into_query_multi(query, fmt=None, **kwargs):
     return final_query, tuple(final_args)
 
 
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+
+_PGCOPY_NULL = struct.pack('>i', -1)
+
+PGCOPY_ENCODERS = {
+    'int4': struct.Struct('>i').pack,
+    'int8': struct.Struct('>q').pack,
+    'float8': struct.Struct('>d').pack,
+    'text': lambda value: value.encode('utf-8'),
+    'bytea': bytes,
+}
+
+
+def encode_binary_copy(rows, types):
+    """
+    Encode rows in PostgreSQL's binary COPY format.
+
+    Args:
+      rows(iterable): Iterable of row sequences
+      types(sequence): Postgres type name of each column (keys of PGCOPY_ENCODERS)
+
+    Returns:
+      generator: bytes chunks, one per row plus the header and trailer
+    """
+    encoders = [PGCOPY_ENCODERS[type_name] for type_name in types]
+    field_count = struct.pack('>h', len(encoders))
+
+    yield PGCOPY_HEADER
+    for row in rows:
+        fields = [field_count]
+        for encoder, value in zip(encoders, row):
+            if value is None:
+                fields.append(_PGCOPY_NULL)
+            else:
+                data = encoder(value)
+                fields.append(struct.pack('>i', len(data)))
+                fields.append(data)
+        yield b''.join(fields)
+    yield PGCOPY_TRAILER
+
+
+class IteratorReader(object):
+    """Minimal file-like wrapper around an iterable of bytes chunks, for use with cursor.copy_expert"""
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer.extend(next(self._chunks))
+            except StopIteration:
+                break
+
+        if size < 0:
+            size = len(self._buffer)
+        out = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return out
+
+
+def copy_rows(table, columns, types, rows, cursor=None):
+    """
+    Stream rows into a table with binary COPY, without building the whole payload in memory.
+
+    Args:
+      table(str): Table name
+      columns(sequence): Column names, in row order
+      types(sequence): Postgres type names of the columns, in row order (see PGCOPY_ENCODERS)
+      rows(iterable): Iterable of row sequences
+      cursor(django.db.connection.cursor, optional):  (Default value = None)
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    query = 'COPY {} ({}) FROM STDIN WITH (FORMAT binary)'.format(table, ', '.join(columns))
+    logger.debug('Streaming rows into %s with query \n%s', table, query)
+    cursor.copy_expert(query, IteratorReader(encode_binary_copy(rows, types)))
+
+
+STREAM_FETCH_SIZE = 2000
+
+_stream_cursor_ids = count()
+
+
+def iter_query(query, params=None, fetch_size=STREAM_FETCH_SIZE):
+    """
+    Run a query in a server-side (named) cursor and iterate over its rows, fetching them in batches.
+
+    A server-side cursor needs a transaction. When the rows are read outside of one, e.g. by a StreamingHttpResponse
+    after its view has returned, a transaction is opened for as long as the rows are being read, so that the client
+    gets the first rows while the query is still running. When the rows are read within the caller's transaction,
+    the cursor is declared WITH HOLD so that it survives the end of that transaction; if it is still open at commit,
+    PostgreSQL computes and stores the rest of the result then.
+
+    Args:
+      query(str): SQL query
+      params(sequence or dict, optional): Query parameters
+      fetch_size(int, optional): Number of rows fetched from the server at a time (Default value = STREAM_FETCH_SIZE)
+
+    Returns:
+      StreamedQuery: iterable of row tuples
+    """
+    return StreamedQuery(query, params, fetch_size)
+
+
+class StreamedQuery(object):
+    """
+    Rows of a query run by iter_query. As the query does not go through Django's cursors, the time spent executing it
+    and fetching its rows is recorded here instead, e.g. for synapsesuggestor.control.instrumentation.
+    """
+    def __init__(self, query, params=None, fetch_size=STREAM_FETCH_SIZE):
+        self.query = query
+        self.params = params
+        self.fetch_size = fetch_size
+        self.executed = False
+        self.seconds = 0.0
+
+    @property
+    def sql(self):
+        """The query with its parameters interpolated, as in django.db.connection.queries"""
+        connection.ensure_connection()
+        cursor = connection.connection.cursor()
+        try:
+            return force_text(cursor.mogrify(self.query, self.params))
+        finally:
+            cursor.close()
+
+    def __iter__(self):
+        connection.ensure_connection()
+        logger.debug('Streaming rows with query \n%s', self.query)
+
+        if connection.in_atomic_block:
+            for row in self._fetch(withhold=True):
+                yield row
+        else:
+            with transaction.atomic():
+                for row in self._fetch(withhold=False):
+                    yield row
+
+    def _fetch(self, withhold):
+        name = 'synapsesuggestor_stream_{}'.format(next(_stream_cursor_ids))
+        cursor = connection.connection.cursor(name, withhold=withhold)
+        try:
+            start = time.time()
+            self.executed = True
+            try:
+                cursor.execute(self.query, self.params)
+            finally:
+                self.seconds += time.time() - start
+
+            while True:
+                start = time.time()
+                try:
+                    rows = cursor.fetchmany(self.fetch_size)
+                finally:
+                    self.seconds += time.time() - start
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+
+def prime(rows):
+    """
+    Start iterating over rows, e.g. from iter_query, so that an error running the query is raised now, while an
+    error response can still be sent, rather than once streaming has begun.
+
+    Returns:
+      iterator: the same rows
+    """
+    rows = iter(rows)
+    try:
+        first = next(rows)
+    except StopIteration:
+        return iter(())
+    return chain([first], rows)
+
+
+def iter_json(rows, columns=None, extra=None, chunk_size=STREAM_FETCH_SIZE, encoder=DjangoJSONEncoder):
+    """
+    Incrementally encode rows as JSON, in the {columns, data} form used by JsonResponse-based endpoints.
+
+    If iterating over rows raises an exception, the JSON is completed with an "error" object (or, for a bare array, a
+    final element) giving its message and type, as {"error": message, "type": exception class name}.
+
+    Args:
+      rows(iterable): Iterable of JSON-serialisable rows
+      columns(list, optional): Column headers. If None, rows are encoded as a bare array
+      extra(dict, optional): Additional JSON-serialisable keys to add to the object, before 'data'
+      chunk_size(int, optional): Number of rows per yielded chunk (Default value = STREAM_FETCH_SIZE)
+      encoder(type, optional): JSON encoder class (Default value = DjangoJSONEncoder, as used by JsonResponse)
+
+    Returns:
+      generator: str chunks
+    """
+    json_encoder = encoder()
+
+    if columns is not None:
+        header = dict(extra or {}, columns=columns)
+        yield json_encoder.encode(header)[:-1] + ', "data": ['
+    else:
+        yield '['
+
+    chunk = []
+    separator = ''
+    error = None
+    try:
+        for row in rows:
+            chunk.append(json_encoder.encode(row))
+            if len(chunk) >= chunk_size:
+                yield separator + ', '.join(chunk)
+                separator = ', '
+                chunk = []
+    except Exception as e:
+        # the response status has already been sent, so the error can only be reported in the body
+        logger.exception('Error while streaming rows')
+        error = json_encoder.encode({'error': str(e), 'type': type(e).__name__})
+    if chunk:
+        yield separator + ', '.join(chunk)
+        separator = ', '
+
+    if error is None:
+        yield ']}' if columns is not None else ']'
+    elif columns is not None:
+        yield '], "error": ' + error + '}'
+    else:
+        yield separator + error + ']'
+
+
+def streaming_json_response(rows, columns=None, extra=None, chunk_size=STREAM_FETCH_SIZE):
+    """
+    Stream rows to the client as JSON (see iter_json), without building the whole result in memory. The first row is
+    read before returning, so that errors running the query are raised by the view.
+
+    Args:
+      rows(iterable): Iterable of JSON-serialisable rows, e.g. from iter_query
+      columns(list, optional): Column headers. If None, rows are encoded as a bare array
+      extra(dict, optional): Additional JSON-serialisable keys to add to the object
+      chunk_size(int, optional): Number of rows per chunk written to the client (Default value = STREAM_FETCH_SIZE)
+
+    Returns:
+      django.http.StreamingHttpResponse
+    """
+    counter = RowCounter(prime(rows))
+    response = StreamingHttpResponse(iter_json(counter, columns, extra, chunk_size), content_type='application/json')
+    # read by synapsesuggestor.control.instrumentation once the response has been streamed
+    response.row_counter = counter
+    response.streamed_queries = [rows] if isinstance(rows, StreamedQuery) else []
+    return response
+
+
+class RowCounter(object):
+    """
+    Iterable which counts the rows passing through it, e.g. to find how many rows a streamed response contained, and
+    keeps any exception raised while iterating over them.
+    """
+    def __init__(self, rows):
+        self._rows = rows
+        self.count = 0
+        self.error = None
+
+    def __iter__(self):
+        try:
+            for row in self._rows:
+                self.count += 1
+                yield row
+        except Exception as e:
+            self.error = e
+            raise
+
+
 def get_translation_resolution(project_id, ssw_id, cursor=None):
     """
     Return the translation and resolution for converting between stack and project coordinates.
@@ -109,28 +394,8 @@ def get_translation_resolution(project_id, ssw_id, cursor=None):
         Translation is the location of the stack origin, in project space
         Resolution is the size of a stack pixel, in project space
     """
-    if cursor is None:
-        cursor = connection.cursor()
-
-    cursor.execute('''
-        SELECT
-          (ps.translation).x, (ps.translation).y, (ps.translation).z,
-          (stack.resolution).x, (stack.resolution).y, (stack.resolution).z
-        FROM synapse_suggestion_workflow ssw
-          INNER JOIN synapse_detection_tiling tiling
-            ON ssw.synapse_detection_tiling_id = tiling.id
-          INNER JOIN stack
-            ON tiling.stack_id = stack.id
-          INNER JOIN project_stack ps
-            ON ps.stack_id = stack.id
-          WHERE ps.project_id = %s
-            AND ssw.id = %s
-          LIMIT 1;
-    ''', (project_id, ssw_id))
-
-    trans_res = cursor.fetchone()
-
-    return np.array(trans_res[:3]), np.array(trans_res[-3:])
+    context = resolve_workflow(project_id, ssw_id=ssw_id, cursor=cursor)
+    return np.array(context.translation), np.array(context.resolution)
 
 
 # def get_or_create_algo_version(request, project_id=None):
@@ -166,15 +431,111 @@ def get_project_SS_workflow(project_id, ssw_id=None):
     Given a project ID, return a ProjectSynapseSuggestionWorkflow object.
 
     If ssw_id is given, return the PSSW associated with the project and that SSW. If ssw_id is not given,
-    return the most recent PSSW associated with the project.
+    return the most recent PSSW associated with the project. Prefer resolve_workflow, which does not need to fetch the
+    object.
     """
-    if ssw_id is None:
-        return get_most_recent_project_SS_workflow(project_id)
-    else:
-        return ProjectSynapseSuggestionWorkflow.objects.get(synapse_suggestion_workflow_id=ssw_id,
-                                                            project_id=project_id)
+    pssw_id = resolve_workflow(project_id, ssw_id=ssw_id).pssw_id
+    return ProjectSynapseSuggestionWorkflow.objects.get(id=pssw_id)
 
 
 def get_most_recent_project_SS_workflow(project_id):
     """Given a project ID, return the ProjectSynapseSuggestionWorkflow row most recently created in that project"""
-    return ProjectSynapseSuggestionWorkflow.objects.filter(project_id=project_id).order_by('-created').first()
+    try:
+        return get_project_SS_workflow(project_id)
+    except ProjectSynapseSuggestionWorkflow.DoesNotExist:
+        return None
+
+
+WorkflowContext = namedtuple('WorkflowContext', [
+    'project_id', 'pssw_id', 'ssw_id', 'tiling_id', 'stack_id', 'tile_width_px', 'tile_height_px',
+    'translation', 'resolution',
+])
+WorkflowContext.__doc__ = """
+Everything about a project synapse suggestion workflow which views commonly need.
+
+translation and resolution are (x, y, z) tuples for converting between the stack's and the project's coordinates, as
+returned by get_translation_resolution.
+"""
+
+
+def resolve_workflow(project_id, pssw_id=None, ssw_id=None, cursor=None):
+    """
+    Get the context of a project synapse suggestion workflow in a single query: the given project workflow, or the
+    project's workflow for the given synapse suggestion workflow, or the project's most recently created workflow.
+
+    Results are cached (see synapsesuggestor.control.cache).
+
+    Args:
+      project_id(int):
+      pssw_id(int, optional): Project synapse suggestion workflow ID
+      ssw_id(int, optional): Synapse suggestion workflow ID
+      cursor(django.db.connection.cursor, optional):  (Default value = None)
+
+    Returns:
+      WorkflowContext
+
+    Raises:
+      ProjectSynapseSuggestionWorkflow.DoesNotExist: if there is no matching workflow in the project
+    """
+    key = (
+        'context', int(project_id), None if pssw_id is None else int(pssw_id), None if ssw_id is None else int(ssw_id)
+    )
+    context = project_workflow_cache.get_or_set(key, lambda: _query_workflow_context(*key[1:], cursor=cursor))
+    if context is None:
+        raise ProjectSynapseSuggestionWorkflow.DoesNotExist(
+            'No synapse suggestion workflow found for project {} (project workflow {}, workflow {})'.format(
+                project_id, pssw_id, ssw_id
+            )
+        )
+    return context
+
+
+def _query_workflow_context(project_id, pssw_id=None, ssw_id=None, cursor=None):
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        SELECT pssw.id, ssw.id, tiling.id, stack.id, tiling.tile_width_px, tiling.tile_height_px,
+          (ps.translation).x, (ps.translation).y, (ps.translation).z,
+          (stack.resolution).x, (stack.resolution).y, (stack.resolution).z
+          FROM project_synapse_suggestion_workflow pssw
+          INNER JOIN synapse_suggestion_workflow ssw
+            ON pssw.synapse_suggestion_workflow_id = ssw.id
+          INNER JOIN synapse_detection_tiling tiling
+            ON ssw.synapse_detection_tiling_id = tiling.id
+          INNER JOIN stack
+            ON tiling.stack_id = stack.id
+          LEFT OUTER JOIN project_stack ps
+            ON ps.stack_id = stack.id
+            AND ps.project_id = pssw.project_id
+          WHERE pssw.project_id = %(project_id)s
+            AND (%(pssw_id)s::int IS NULL OR pssw.id = %(pssw_id)s)
+            AND (%(ssw_id)s::int IS NULL OR ssw.id = %(ssw_id)s)
+          ORDER BY pssw.created DESC
+          LIMIT 1;
+    ''', {'project_id': project_id, 'pssw_id': pssw_id, 'ssw_id': ssw_id})
+
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    return WorkflowContext(project_id, *(row[:6] + (tuple(row[6:9]), tuple(row[9:]))))
+
+
+def get_request_pssw_id(params, project_id, key='project_workflow_id'):
+    """
+    Get the project synapse suggestion workflow ID given in request parameters, only falling back to (and querying
+    for) the project's most recent workflow if it is not given.
+
+    Args:
+      params(django.http.QueryDict): request.GET or request.POST
+      project_id(int):
+      key(str, optional): Name of the parameter (Default value = 'project_workflow_id')
+
+    Returns:
+      int
+    """
+    pssw_id = params.get(key)
+    if pssw_id is None:
+        return resolve_workflow(project_id).pssw_id
+    return int(pssw_id)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Array-backed connected component labelling, used to agglomerate synapse slices.
+
+Nodes are held as contiguous integer indices and components are found by repeatedly hooking the larger of two
+differing roots onto the smaller and then compressing paths by pointer jumping, so every step is a vectorised NumPy
+operation over all edges at once.
+"""
+import numpy as np
+
+
+def connected_components(node_count, edges):
+    """
+    Label the connected components of a graph.
+
+    Args:
+        node_count(int): nodes are 0..node_count-1
+        edges(numpy.ndarray): (N, 2) integer array of node indices
+
+    Returns:
+        numpy.ndarray: for each node, the smallest node index in its component
+    """
+    parent = np.arange(node_count)
+    edges = np.asarray(edges, dtype=parent.dtype).reshape(-1, 2)
+    u, v = edges[:, 0], edges[:, 1]
+
+    while True:
+        root_u, root_v = parent[u], parent[v]
+        differ = root_u != root_v
+        if not differ.any():
+            return parent
+
+        # hook the larger root onto the smaller; parent[i] <= i throughout, so no cycles are created
+        np.minimum.at(parent, np.maximum(root_u, root_v)[differ], np.minimum(root_u, root_v)[differ])
+
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def cluster_slices(synapse_slice_ids, adjacencies, slice_object_pairs):
+    """
+    Group synapse slices which are spatially adjacent, or which already belong to the same synapse object.
+
+    Args:
+        synapse_slice_ids(iterable): Seed synapse slice IDs
+        adjacencies(numpy.ndarray): (N, 2) array of adjacent synapse slice ID pairs
+        slice_object_pairs(numpy.ndarray): (M, 2) array of existing (synapse slice ID, synapse object ID) mappings
+
+    Returns:
+        list: List whose items are a tuple of a set of slice IDs which form an object, and a set of existing synapse
+            object IDs associated with that set of slices
+    """
+    adjacencies = np.asarray(adjacencies, dtype=np.int64).reshape(-1, 2)
+    slice_object_pairs = np.asarray(slice_object_pairs, dtype=np.int64).reshape(-1, 2)
+
+    slice_ids = np.unique(np.concatenate([
+        np.asarray(list(synapse_slice_ids), dtype=np.int64), adjacencies.ravel(), slice_object_pairs[:, 0]
+    ]))
+    object_ids = np.unique(slice_object_pairs[:, 1])
+
+    # synapse objects are represented as extra nodes after the slices
+    edges = np.concatenate([
+        np.searchsorted(slice_ids, adjacencies),
+        np.column_stack([
+            np.searchsorted(slice_ids, slice_object_pairs[:, 0]),
+            np.searchsorted(object_ids, slice_object_pairs[:, 1]) + len(slice_ids)
+        ])
+    ])
+
+    roots = connected_components(len(slice_ids) + len(object_ids), edges)
+
+    clusters = dict()
+    for root, slice_id in zip(roots[:len(slice_ids)].tolist(), slice_ids.tolist()):
+        clusters.setdefault(root, (set(), set()))[0].add(slice_id)
+    for root, object_id in zip(roots[len(slice_ids):].tolist(), object_ids.tolist()):
+        clusters[root][1].add(object_id)
+
+    return list(clusters.values())
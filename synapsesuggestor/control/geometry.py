@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Decoding of the geometry encodings accepted when ingesting synapse slices.
+
+geojson: GeoJSON Polygon, as a string or object (default)
+wkb_hex: hex-encoded well-known binary Polygon
+wkb_base64: base64-encoded well-known binary Polygon
+packed: base64-encoded little-endian int16 array of interleaved x, y coordinates relative to the tile's top-left
+    corner, with the start index (in points) of each ring given by the slice's "ring_offsets" (default [0])
+
+Additionally, 'pixel_runs' is used internally for WKB MultiPolygons of pixel boxes produced by
+synapsesuggestor.control.raster, which are dissolved into a single Polygon by the database.
+"""
+import base64
+import json
+import struct
+
+import numpy as np
+from six import string_types
+
+from synapsesuggestor.control.cache import get_cache
+from synapsesuggestor.models import SynapseSuggestionWorkflow
+
+
+GEOM_FORMATS = ('geojson', 'wkb_hex', 'wkb_base64', 'packed')
+
+_WKB_POLYGON_HEADER = struct.Struct('<BII')  # little-endian byte order marker, geometry type, ring count
+_WKB_RING_HEADER = struct.Struct('<I')  # point count
+_WKB_POLYGON = 3
+
+tile_size_cache = get_cache('tile_size')
+
+
+def check_geom_format(geom_format):
+    if geom_format not in GEOM_FORMATS:
+        raise ValueError('Geometry format must be one of {}, got {}'.format(', '.join(GEOM_FORMATS), geom_format))
+    return geom_format
+
+
+def geom_pg_type(geom_format):
+    """Postgres type of the values returned by prepare_geom"""
+    return 'bytea' if geom_format in ('packed', 'pixel_runs') else 'text'
+
+
+def geom_sql(geom_format, column):
+    """SQL expression which parses the given column, containing values returned by prepare_geom, into a geometry"""
+    return {
+        'geojson': 'ST_GeomFromGeoJson({})',
+        'wkb_hex': "ST_GeomFromWKB(decode({}, 'hex'))",
+        'wkb_base64': "ST_GeomFromWKB(decode({}, 'base64'))",
+        'packed': 'ST_GeomFromWKB({})',
+        'pixel_runs': 'ST_UnaryUnion(ST_GeomFromWKB({}))',
+    }[geom_format].format(column)
+
+
+def get_tile_size(ssw_id):
+    """Return the (width, height) in pixels of the tiles used by the given synapse suggestion workflow"""
+    return tile_size_cache.get_or_set(int(ssw_id), lambda: _get_tile_size(ssw_id))
+
+
+def _get_tile_size(ssw_id):
+    tiling = SynapseSuggestionWorkflow.objects.select_related('synapse_detection_tiling').get(
+        id=ssw_id
+    ).synapse_detection_tiling
+    return tiling.tile_width_px, tiling.tile_height_px
+
+
+def packed_to_wkb(packed, ring_offsets=None, origin=(0, 0)):
+    """
+    Convert tile-relative packed int16 coordinates into a WKB Polygon in stack coordinates.
+
+    Args:
+        packed(str): base64-encoded little-endian int16 array of interleaved x, y coordinates
+        ring_offsets(list, optional): start index, in points, of each ring (exterior first). Default [0]
+        origin(tuple, optional): stack coordinates of the tile's top-left corner
+
+    Returns:
+        bytes
+    """
+    coords = np.frombuffer(base64.b64decode(packed), dtype='<i2').reshape(-1, 2).astype('<f8')
+    coords += np.asarray(origin, dtype='<f8')
+
+    bounds = list(ring_offsets or [0]) + [len(coords)]
+
+    chunks = [_WKB_POLYGON_HEADER.pack(1, _WKB_POLYGON, len(bounds) - 1)]
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        ring = coords[start:stop]
+        if len(ring) and not np.array_equal(ring[0], ring[-1]):
+            ring = np.concatenate([ring, ring[:1]])
+        chunks.append(_WKB_RING_HEADER.pack(len(ring)))
+        chunks.append(ring.tobytes())
+
+    return b''.join(chunks)
+
+
+def prepare_geom(syn_slice, geom_format, tile_idx=None, tile_size=None):
+    """
+    Get the value to send to the database for a synapse slice's geometry.
+
+    Args:
+        syn_slice(dict): synapse slice information including "geom" (and "ring_offsets" for the packed format)
+        geom_format(str): one of GEOM_FORMATS
+        tile_idx(tuple, optional): (x, y, z) index of the slice's tile; required for the packed format
+        tile_size(tuple, optional): (width, height) of tiles in pixels; required for the packed format
+
+    Returns:
+        str or bytes
+    """
+    geom = syn_slice['geom']
+    if geom_format == 'geojson':
+        return geom if isinstance(geom, string_types) else json.dumps(geom)
+    elif geom_format == 'packed':
+        origin = (tile_idx[0] * tile_size[0], tile_idx[1] * tile_size[1])
+        return packed_to_wkb(geom, syn_slice.get('ring_offsets'), origin)
+    else:
+        return geom
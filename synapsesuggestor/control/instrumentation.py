@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+Per-endpoint instrumentation of synapsesuggestor's views.
+
+Every view in synapsesuggestor.urls is wrapped by `instrument`, which records for each request its wall time, the
+time spent in and number of database queries made through Django's cursors or streamed with
+synapsesuggestor.control.common.iter_query, the number of rows returned and the response size. Streamed responses are
+measured when they finish streaming. The most recent samples of each endpoint
+are kept in memory, per process, and summarised as percentiles by the metrics endpoint.
+
+Each process also publishes its samples to Django's default cache every SYNAPSESUGGESTOR_METRICS_PUBLISH_INTERVAL
+seconds, from where the ss_metrics management command merges them. This requires a cache shared between processes
+(e.g. memcached, redis or the database cache); with the default local-memory cache, only the serving process's
+metrics are visible, through the endpoint.
+
+Settings:
+
+SYNAPSESUGGESTOR_INSTRUMENTATION: set to False to disable instrumentation (default True)
+SYNAPSESUGGESTOR_METRICS_WINDOW: number of samples kept per endpoint (default 1024)
+SYNAPSESUGGESTOR_METRICS_PUBLISH_INTERVAL: seconds between publishing samples to the cache (default 30)
+SYNAPSESUGGESTOR_EXPLAIN_THRESHOLD_MS: if set, the slowest query of requests taking longer than this is explained,
+    and the plan is logged and kept with the endpoint's slow requests (default None). Read-only queries are run
+    again under EXPLAIN ANALYZE, which doubles the database time of slow requests; queries which may write are only
+    planned. The SQL of
+    every query is only kept in memory for the duration of the request while this is set (or DEBUG is True);
+    otherwise, only the number and time of queries are recorded.
+"""
+from __future__ import division
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.backends.utils import CursorWrapper
+from django.http import JsonResponse
+from rest_framework.decorators import api_view
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('wall_ms', 'db_ms', 'queries', 'rows', 'bytes')
+PERCENTILES = (50, 90, 99)
+
+# JSON responses larger than this are not parsed to count their rows
+ROW_COUNT_MAX_BYTES = 1024 * 1024
+
+SLOW_REQUESTS_KEPT = 20
+
+CACHE_KEY_PREFIX = 'synapsesuggestor:metrics:'
+CACHE_INDEX_KEY = CACHE_KEY_PREFIX + 'processes'
+CACHE_TIMEOUT = 3600  # seconds
+
+
+def _setting(name, default):
+    return getattr(settings, 'SYNAPSESUGGESTOR_' + name, default)
+
+
+class EndpointMetrics(object):
+    """Rolling window of the samples of one endpoint"""
+    def __init__(self, window):
+        self.samples = {metric: deque(maxlen=window) for metric in METRICS}
+        self.count = 0
+        self.errors = 0
+        self.slow = deque(maxlen=SLOW_REQUESTS_KEPT)
+
+    def add(self, sample, error=False):
+        self.count += 1
+        if error:
+            self.errors += 1
+        for metric in METRICS:
+            if sample.get(metric) is not None:
+                self.samples[metric].append(sample[metric])
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'samples': {metric: list(values) for metric, values in self.samples.items()},
+            'slow': list(self.slow),
+        }
+
+
+class MetricsRegistry(object):
+    """Thread-safe collection of the metrics of each endpoint, for one process"""
+    def __init__(self, window=None, timer=time.time):
+        self.window = window
+        self._timer = timer
+        self._endpoints = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_published = timer()
+
+    def record(self, endpoint, sample, error=False, slow=None):
+        with self._lock:
+            if endpoint not in self._endpoints:
+                self._endpoints[endpoint] = EndpointMetrics(self.window or _setting('METRICS_WINDOW', 1024))
+            self._endpoints[endpoint].add(sample, error)
+            if slow is not None:
+                self._endpoints[endpoint].slow.append(slow)
+
+        self._maybe_publish()
+
+    def snapshot(self):
+        """Raw samples of each endpoint, in the form merged by summarize"""
+        with self._lock:
+            return {endpoint: metrics.to_dict() for endpoint, metrics in self._endpoints.items()}
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def _maybe_publish(self):
+        now = self._timer()
+        if now - self._last_published < _setting('METRICS_PUBLISH_INTERVAL', 30):
+            return
+        self._last_published = now
+        try:
+            publish_metrics(self.snapshot())
+        except Exception:
+            # metrics must never break requests
+            logger.exception('Could not publish synapsesuggestor metrics to the cache')
+
+
+registry = MetricsRegistry()
+
+
+def process_key():
+    return '{}{}:{}'.format(CACHE_KEY_PREFIX, socket.gethostname(), os.getpid())
+
+
+def publish_metrics(snapshot):
+    """Store this process's samples in the cache, and add the process to the cache's index of processes"""
+    key = process_key()
+    django_cache.set(key, snapshot, CACHE_TIMEOUT)
+    index = django_cache.get(CACHE_INDEX_KEY) or []
+    if key not in index:
+        django_cache.set(CACHE_INDEX_KEY, index + [key], CACHE_TIMEOUT)
+
+
+def collect_published_metrics():
+    """
+    Get the samples published by all processes whose entries have not expired.
+
+    Returns:
+        dict: process cache key to snapshot, as from MetricsRegistry.snapshot
+    """
+    return django_cache.get_many(django_cache.get(CACHE_INDEX_KEY) or [])
+
+
+def clear_published_metrics():
+    index = django_cache.get(CACHE_INDEX_KEY) or []
+    django_cache.delete_many(index + [CACHE_INDEX_KEY])
+
+
+def summarize(snapshots):
+    """
+    Merge snapshots of endpoint samples, e.g. from several processes, and summarise each metric as percentiles.
+
+    Args:
+        snapshots(list): snapshots, as from MetricsRegistry.snapshot
+
+    Returns:
+        dict: endpoint name to {'count', 'errors', 'window', 'slow', and for each metric, {'mean', 'max', 'p50', ...}}
+    """
+    merged = OrderedDict()
+    for snapshot in snapshots:
+        for endpoint, data in snapshot.items():
+            entry = merged.setdefault(
+                endpoint, {'count': 0, 'errors': 0, 'samples': {metric: [] for metric in METRICS}, 'slow': []}
+            )
+            entry['count'] += data['count']
+            entry['errors'] += data['errors']
+            entry['slow'].extend(data.get('slow', []))
+            for metric in METRICS:
+                entry['samples'][metric].extend(data['samples'].get(metric, []))
+
+    summary = OrderedDict()
+    for endpoint in sorted(merged):
+        entry = merged[endpoint]
+        summary[endpoint] = {
+            'count': entry['count'],
+            'errors': entry['errors'],
+            'window': len(entry['samples']['wall_ms']),
+            'slow': sorted(entry['slow'], key=lambda slow: -slow['wall_ms'])[:SLOW_REQUESTS_KEPT],
+        }
+        for metric in METRICS:
+            summary[endpoint][metric] = _describe(entry['samples'][metric])
+    return summary
+
+
+def _describe(values):
+    if not values:
+        return None
+    array = np.asarray(values, dtype=np.float64)
+    description = {'mean': float(array.mean()), 'max': float(array.max())}
+    for percentile, value in zip(PERCENTILES, np.percentile(array, PERCENTILES)):
+        description['p{}'.format(percentile)] = float(value)
+    return description
+
+
+def _count_rows(response):
+    row_count = getattr(response, 'row_count', None)
+    if row_count is not None:
+        return row_count
+    if getattr(response, 'streaming', False):
+        counter = getattr(response, 'row_counter', None)
+        return None if counter is None else counter.count
+    if 'json' not in response.get('Content-Type', '') or len(response.content) > ROW_COUNT_MAX_BYTES:
+        return None
+
+    try:
+        parsed = json.loads(response.content.decode('utf-8'))
+    except ValueError:
+        return None
+    if isinstance(parsed, dict) and isinstance(parsed.get('data'), list):
+        return len(parsed['data'])
+    if isinstance(parsed, list):
+        return len(parsed)
+    return None
+
+
+# statements which write, lock or have other side effects when executed, which EXPLAIN ANALYZE would repeat
+SIDE_EFFECT_RE = re.compile(
+    r'\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|COPY|INTO|LOCK|SHARE|NEXTVAL|SETVAL|PG_ADVISORY_\w*)\b', re.IGNORECASE
+)
+
+
+def _explain(sql):
+    """
+    Get the plan of a captured query, in a savepoint which is rolled back. Plain reads are run again under EXPLAIN
+    ANALYZE; queries which may write, such as data-modifying CTEs, are only planned, and statements other than single
+    SELECT, WITH, INSERT, UPDATE and DELETE queries are not explained.
+    """
+    statement = sql.strip().rstrip(';')
+    if ';' in statement or not statement.upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')):
+        return None
+    options = 'FORMAT JSON' if SIDE_EFFECT_RE.search(statement) else 'ANALYZE, BUFFERS, FORMAT JSON'
+    try:
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.execute('EXPLAIN ({}) {}'.format(options, statement))
+            plan = cursor.fetchone()[0]
+            transaction.set_rollback(True)
+    except Exception:
+        logger.exception('Could not EXPLAIN slow query')
+        return None
+    return json.loads(plan) if not isinstance(plan, list) else plan
+
+
+class _TimingCursorWrapper(CursorWrapper):
+    """Cursor wrapper which logs the time of each query in connection.queries_log, but not its SQL"""
+    def _timed(self, method, *args):
+        start = time.time()
+        try:
+            return method(*args)
+        finally:
+            self.db.queries_log.append({'sql': None, 'time': '%.3f' % (time.time() - start)})
+
+    def execute(self, sql, params=None):
+        return self._timed(super(_TimingCursorWrapper, self).execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(super(_TimingCursorWrapper, self).executemany, sql, param_list)
+
+
+@contextmanager
+def _captured_queries(keep_sql):
+    """
+    Log the queries made through Django's cursors regardless of DEBUG, as django.test.utils.CaptureQueriesContext, and
+    collect them into the yielded list on exit. Unless keep_sql, only their times are logged: the SQL of bulk inserts
+    can be large.
+    """
+    db = connections[DEFAULT_DB_ALIAS]
+    queries = []
+    force_debug_cursor = db.force_debug_cursor
+    make_debug_cursor = db.__dict__.get('make_debug_cursor')
+    db.force_debug_cursor = True
+    if not keep_sql:
+        db.make_debug_cursor = lambda cursor: _TimingCursorWrapper(cursor, db)
+    initial_queries = len(db.queries_log)
+    try:
+        yield queries
+    finally:
+        db.force_debug_cursor = force_debug_cursor
+        if make_debug_cursor is not None:
+            db.make_debug_cursor = make_debug_cursor
+        elif not keep_sql:
+            del db.make_debug_cursor
+        queries.extend(list(db.queries_log)[initial_queries:])
+
+
+def _keep_sql():
+    """Whether to keep the SQL of queries, for EXPLAINing slow requests or when Django logs it anyway"""
+    return settings.DEBUG or _setting('EXPLAIN_THRESHOLD_MS', None) is not None
+
+
+def _streamed_queries(response, keep_sql):
+    """Queries run by synapsesuggestor.control.common.iter_query for the response, in the form of connection.queries"""
+    return [
+        {'sql': query.sql if keep_sql else None, 'time': query.seconds}
+        for query in getattr(response, 'streamed_queries', ()) if query.executed
+    ]
+
+
+def _add_queries(sample, queries):
+    sample['db_ms'] += 1000 * sum(float(query['time']) for query in queries)
+    sample['queries'] += len(queries)
+
+
+def _slow_request(endpoint, request, sample, queries):
+    threshold = _setting('EXPLAIN_THRESHOLD_MS', None)
+    if threshold is None or sample['wall_ms'] < threshold or not queries:
+        return None
+
+    slowest = max(queries, key=lambda query: float(query['time']))
+    slow = {
+        'path': request.get_full_path(),
+        'wall_ms': sample['wall_ms'],
+        'sql': slowest['sql'],
+        'query_ms': 1000 * float(slowest['time']),
+        'plan': _explain(slowest['sql']),
+    }
+    logger.warning(
+        'Slow request to %s (%.0fms); slowest query (%.0fms):\n%s\n%s',
+        endpoint, slow['wall_ms'], slow['query_ms'], slow['sql'], json.dumps(slow['plan'], indent=2)
+    )
+    return slow
+
+
+def _stream_and_record(response, endpoint, request, sample, start, queries, keep_sql):
+    """
+    Wrap a streaming response's content, to record the request once it has been fully sent, including the queries
+    whose rows were streamed
+    """
+    content = response.streaming_content
+
+    def measured():
+        error = True
+        try:
+            for chunk in content:
+                sample['bytes'] += len(chunk)
+                yield chunk
+            counter = getattr(response, 'row_counter', None)
+            error = counter is not None and counter.error is not None
+        finally:
+            sample['wall_ms'] = 1000 * (time.time() - start)
+            sample['rows'] = _count_rows(response)
+            all_queries = queries + _streamed_queries(response, keep_sql)
+            _add_queries(sample, all_queries)
+            registry.record(endpoint, sample, error, _slow_request(endpoint, request, sample, all_queries))
+
+    response.streaming_content = measured()
+    return response
+
+
+def instrument(view, endpoint=None):
+    """
+    Wrap a view so that its requests are recorded in the metrics registry under the given endpoint name (default the
+    view's name).
+    """
+    endpoint = endpoint or view.__name__
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _setting('INSTRUMENTATION', True):
+            return view(request, *args, **kwargs)
+
+        start = time.time()
+        keep_sql = _keep_sql()
+        try:
+            with _captured_queries(keep_sql) as queries:
+                response = view(request, *args, **kwargs)
+        except Exception:
+            registry.record(endpoint, {'wall_ms': 1000 * (time.time() - start)}, error=True)
+            raise
+
+        sample = {'wall_ms': 1000 * (time.time() - start), 'db_ms': 0, 'queries': 0}
+
+        if getattr(response, 'streaming', False):
+            sample['bytes'] = 0
+            return _stream_and_record(response, endpoint, request, sample, start, queries, keep_sql)
+
+        queries += _streamed_queries(response, keep_sql)
+        _add_queries(sample, queries)
+        sample['bytes'] = len(response.content)
+        sample['rows'] = _count_rows(response)
+        slow = _slow_request(endpoint, request, sample, queries)
+        registry.record(endpoint, sample, error=response.status_code >= 500, slow=slow)
+        return response
+
+    return wrapper
+
+
+def instrument_urlpatterns(urlpatterns):
+    """Wrap the views of the given URL patterns with instrument, naming endpoints by their view"""
+    from django.conf.urls import url
+
+    return [
+        url(pattern.regex.pattern, instrument(pattern.callback), pattern.default_args, pattern.name)
+        for pattern in urlpatterns
+    ]
+
+
+@api_view(['GET'])
+def get_metrics(request):
+    """
+    Get percentiles of the wall time (wall_ms), database time (db_ms), query count, rows returned and response size
+    (bytes) of each endpoint's recent requests, and the slowest requests over the EXPLAIN threshold.
+    ---
+    parameters:
+      - name: scope
+        type: string
+        enum: [process, all]
+        required: false
+        description: >  Metrics of only this process (default), or of all processes which have published metrics to
+          the cache
+    type:
+      object
+    """
+    snapshots = [registry.snapshot()]
+    if request.GET.get('scope', 'process') == 'all':
+        # this process's current samples supersede its published ones
+        published = collect_published_metrics()
+        published.pop(process_key(), None)
+        snapshots.extend(published.values())
+
+    return JsonResponse(summarize(snapshots))
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+Optional declarative partitioning of the synapse detection tables by synapse suggestion workflow.
+
+Once enabled, synapse_detection_tile, synapse_slice, synapse_slice_synapse_object and synapse_slice_treenode are each
+partitioned by LIST on their synapse_suggestion_workflow_id column, with one partition per workflow named
+<table>_w<workflow ID> and a <table>_default partition catching rows of workflows without partitions. Queries which
+constrain the workflow (directly, or through a join on it) only scan that workflow's partitions, and a workflow's
+rows can be detached or dropped as a metadata operation rather than deleted row by row.
+
+Partitioning requires PostgreSQL 12 or later, for foreign keys referencing partitioned tables. On older servers, the
+tables stay as they are: the workflow column is still maintained, and is used by queries for early filtering.
+
+Enabling partitioning rewrites the tables, taking an exclusive lock on them for the duration, and changes their
+primary keys to (id, synapse_suggestion_workflow_id). Foreign keys between the tables, and from
+synapse_slice_project_geom, are replaced by foreign keys on (ID, workflow). Every insert must then give the workflow
+explicitly, as synapsesuggestor's own insert paths do: the triggers which fill it in on unpartitioned tables cannot
+route rows between partitions.
+
+New workflows' partitions are created when they are saved (see SynapsesuggestorConfig.ready); partitions can also be
+managed with the ss_partitions management command.
+"""
+import logging
+import re
+
+from django.db import connection, transaction
+
+from synapsesuggestor.control.synapse_detection import sync_synapse_slice_project_geoms
+
+logger = logging.getLogger(__name__)
+
+MIN_SERVER_VERSION = 120000
+
+PARTITION_KEY = 'synapse_suggestion_workflow_id'
+
+# each table's rows refer to rows of the tables before it
+PARTITIONED_TABLES = (
+    'synapse_detection_tile', 'synapse_slice', 'synapse_slice_synapse_object', 'synapse_slice_treenode'
+)
+
+# (table, column, referenced table) of the foreign keys onto partitioned tables, which are replaced by foreign keys
+# including the partition key
+WORKFLOW_REFERENCES = (
+    ('synapse_slice', 'synapse_detection_tile_id', 'synapse_detection_tile'),
+    ('synapse_slice_synapse_object', 'synapse_slice_id', 'synapse_slice'),
+    ('synapse_slice_treenode', 'synapse_slice_id', 'synapse_slice'),
+    ('synapse_slice_project_geom', 'synapse_slice_id', 'synapse_slice'),
+)
+
+INDEX_DEFINITION = re.compile(
+    r'^CREATE (?P<unique>UNIQUE )?INDEX (?P<name>\S+) ON (?:ONLY )?\S+ USING (?P<method>\w+) \((?P<columns>.*?)\)'
+    r'(?P<rest>.*)$'
+)
+
+
+def partition_name(table, ssw_id):
+    return '{}_w{}'.format(table, int(ssw_id))
+
+
+def default_partition_name(table):
+    return '{}_default'.format(table)
+
+
+def check_server_version(cursor=None):
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('SHOW server_version_num;')
+    version = int(cursor.fetchone()[0])
+    if version < MIN_SERVER_VERSION:
+        raise ValueError(
+            'Partitioning synapsesuggestor tables requires PostgreSQL 12 or later (server version {})'.format(version)
+        )
+
+
+def is_partitioned(table='synapse_slice', cursor=None):
+    """Whether the given table is partitioned; this works on servers without declarative partitioning too"""
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        SELECT EXISTS (
+          SELECT * FROM pg_class c
+            WHERE c.oid = to_regclass(%s)
+              AND c.relkind = 'p'
+        );
+    ''', (table,))
+    return cursor.fetchone()[0]
+
+
+def _check_partitioned(cursor):
+    if not is_partitioned(cursor=cursor):
+        raise ValueError('synapsesuggestor tables are not partitioned')
+
+
+def _table_state(name, cursor):
+    """None if the table does not exist, otherwise whether it is a partition"""
+    cursor.execute('SELECT c.relispartition FROM pg_class c WHERE c.oid = to_regclass(%s);', (name,))
+    row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _foreign_keys(table, referenced, cursor):
+    """(name, definition) of the foreign keys from table, optionally only those onto the referenced table"""
+    cursor.execute('''
+        SELECT con.conname, pg_get_constraintdef(con.oid) FROM pg_constraint con
+          WHERE con.contype = 'f'
+            AND con.conrelid = %s::regclass
+            AND (%s::text IS NULL OR con.confrelid = %s::regclass)
+          ORDER BY con.conname;
+    ''', (table, referenced, referenced))
+    return cursor.fetchall()
+
+
+def _index_definitions(table, new_table, cursor):
+    """
+    Definitions of the indexes of table other than its primary key, rewritten to be created on new_table. Unique
+    indexes are extended with the partition key, as partitioned tables require, and duplicates this creates are
+    skipped.
+    """
+    cursor.execute('''
+        SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i
+          WHERE i.indrelid = %s::regclass
+            AND NOT i.indisprimary
+          ORDER BY i.indexrelid;
+    ''', (table,))
+
+    definitions = []
+    seen = set()
+    for definition, in cursor.fetchall():
+        match = INDEX_DEFINITION.match(definition)
+        if match is None:
+            raise ValueError('Cannot recreate index on partitioned table: {}'.format(definition))
+
+        unique = match.group('unique') or ''
+        method, columns, rest = match.group('method', 'columns', 'rest')
+        if unique and PARTITION_KEY not in columns:
+            columns = '{}, {}'.format(columns, PARTITION_KEY)
+        if (unique, method, columns, rest) in seen:
+            continue
+        seen.add((unique, method, columns, rest))
+        definitions.append('CREATE {}INDEX {} ON {} USING {} ({}){};'.format(
+            unique, match.group('name'), new_table, method, columns, rest
+        ))
+
+    return definitions
+
+
+def _partition_table(table, ssw_ids, cursor):
+    """Replace a table with an equivalent partitioned table, with a partition for each of the given workflows"""
+    old_table = table + '_unpartitioned'
+    cursor.execute('ALTER TABLE {} RENAME TO {};'.format(table, old_table))
+
+    cursor.execute('SELECT EXISTS (SELECT * FROM {} t WHERE t.{} IS NULL);'.format(old_table, PARTITION_KEY))
+    if cursor.fetchone()[0]:
+        raise ValueError('{} has rows without a workflow; apply the synapsesuggestor migrations first'.format(table))
+
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id');", (old_table,))
+    sequence = cursor.fetchone()[0]
+    indexes = _index_definitions(old_table, table, cursor)
+    foreign_keys = _foreign_keys(old_table, None, cursor)
+
+    cursor.execute('''
+        CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY LIST ({key});
+        ALTER TABLE {table} ALTER COLUMN {key} SET NOT NULL;
+        ALTER SEQUENCE {sequence} OWNED BY {table}.id;
+    '''.format(table=table, old_table=old_table, key=PARTITION_KEY, sequence=sequence))
+
+    for ssw_id in ssw_ids:
+        cursor.execute('CREATE TABLE {} PARTITION OF {} FOR VALUES IN ({});'.format(
+            partition_name(table, ssw_id), table, int(ssw_id)
+        ))
+    cursor.execute('CREATE TABLE {} PARTITION OF {} DEFAULT;'.format(default_partition_name(table), table))
+
+    logger.info('Copying %s into partitions', table)
+    cursor.execute('''
+        INSERT INTO {table} SELECT * FROM {old_table};
+        DROP TABLE {old_table};
+        ALTER TABLE {table} ADD PRIMARY KEY (id, {key});
+    '''.format(table=table, old_table=old_table, key=PARTITION_KEY))
+
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} {};'.format(table, _quote(name), definition))
+
+    cursor.execute('ANALYZE {};'.format(table))
+
+
+def partition_tables(cursor=None):
+    """
+    Convert the synapse detection tables to tables partitioned by workflow, with a partition for every existing
+    workflow, in one transaction. Tables which are already partitioned are left as they are.
+
+    Returns:
+        list: Names of the tables which were partitioned
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    check_server_version(cursor)
+
+    with transaction.atomic():
+        cursor.execute('SELECT ssw.id FROM synapse_suggestion_workflow ssw ORDER BY ssw.id;')
+        ssw_ids = [row[0] for row in cursor.fetchall()]
+
+        for table, _, referenced in WORKFLOW_REFERENCES:
+            if not is_partitioned(referenced, cursor):
+                for name, _ in _foreign_keys(table, referenced, cursor):
+                    cursor.execute('ALTER TABLE {} DROP CONSTRAINT {};'.format(table, _quote(name)))
+
+        partitioned = []
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(table, cursor):
+                _partition_table(table, ssw_ids, cursor)
+                partitioned.append(table)
+
+        for table, column, referenced in WORKFLOW_REFERENCES:
+            if not _foreign_keys(table, referenced, cursor):
+                cursor.execute('''
+                    ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_workflow_fk
+                      FOREIGN KEY ({column}, {key}) REFERENCES {referenced} (id, {key})
+                      DEFERRABLE INITIALLY DEFERRED;
+                '''.format(table=table, column=column, referenced=referenced, key=PARTITION_KEY))
+
+    return partitioned
+
+
+def create_workflow_partitions(ssw_id, cursor=None):
+    """
+    Create the partitions of a workflow in each partitioned table, re-attaching previously detached partitions and
+    moving any of the workflow's rows out of the default partitions. Project geometries of the synapse slices in
+    attached partitions are rebuilt.
+
+    Returns:
+        list: Names of the partitions created or attached
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    _check_partitioned(cursor)
+
+    with transaction.atomic():
+        pending = []
+        # tables referring to others are emptied from the default partitions first, so that no row is left referring
+        # to a moved one
+        for table in reversed(PARTITIONED_TABLES):
+            name = partition_name(table, ssw_id)
+            state = _table_state(name, cursor)
+            if state:
+                continue
+            if state is None:
+                cursor.execute('SELECT EXISTS (SELECT * FROM {} t WHERE t.{} = %s);'.format(
+                    default_partition_name(table), PARTITION_KEY
+                ), (ssw_id,))
+                if not cursor.fetchone()[0]:
+                    pending.append((table, name, False))
+                    continue
+                cursor.execute('''
+                    CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+                    INSERT INTO {name} SELECT * FROM {default} t WHERE t.{key} = %(ssw_id)s;
+                    DELETE FROM {default} t WHERE t.{key} = %(ssw_id)s;
+                '''.format(name=name, table=table, default=default_partition_name(table), key=PARTITION_KEY),
+                    {'ssw_id': ssw_id})
+            pending.append((table, name, True))
+
+        created = []
+        for table, name, attach in reversed(pending):
+            if attach:
+                cursor.execute('ALTER TABLE {} ATTACH PARTITION {} FOR VALUES IN ({});'.format(
+                    table, name, int(ssw_id)
+                ))
+            else:
+                cursor.execute('CREATE TABLE {} PARTITION OF {} FOR VALUES IN ({});'.format(name, table, int(ssw_id)))
+            created.append(name)
+
+        if any(attach for _, _, attach in pending):
+            # project geometries are deleted on detaching, and rows moved out of the default partitions may lack them
+            sync_synapse_slice_project_geoms(
+                cursor=cursor, id_relation='(SELECT ss.id FROM synapse_slice ss WHERE ss.{} = {})'.format(
+                    PARTITION_KEY, int(ssw_id)
+                )
+            )
+
+    return created
+
+
+def detach_workflow_partitions(ssw_id, drop=False, cursor=None):
+    """
+    Detach the partitions of a workflow from each partitioned table, deleting its synapse slices' project
+    geometries. Detached partitions are kept as standalone tables without foreign keys onto the partitioned tables,
+    from which they can be re-attached, unless they are dropped.
+
+    Synapse objects which were only mapped to from the workflow's synapse slices are left behind; the
+    sweep_synapse_objects management command deletes them.
+
+    Returns:
+        list: Names of the partitions detached
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    _check_partitioned(cursor)
+
+    with transaction.atomic():
+        cursor.execute('''
+            DELETE FROM synapse_slice_project_geom ssp
+              WHERE ssp.synapse_suggestion_workflow_id = %s;
+        ''', (ssw_id,))
+
+        detached = []
+        for table in reversed(PARTITIONED_TABLES):
+            name = partition_name(table, ssw_id)
+            if not _table_state(name, cursor):
+                continue
+            cursor.execute('ALTER TABLE {} DETACH PARTITION {};'.format(table, name))
+            if drop:
+                cursor.execute('DROP TABLE {};'.format(name))
+            else:
+                # otherwise detaching the partitions they refer to would fail
+                for referenced in PARTITIONED_TABLES:
+                    for constraint, _ in _foreign_keys(name, referenced, cursor):
+                        cursor.execute('ALTER TABLE {} DROP CONSTRAINT {};'.format(name, _quote(constraint)))
+            detached.append(name)
+
+    return detached
+
+
+def partition_status(cursor=None):
+    """
+    Get the partitions of the partitioned tables, and detached workflow partitions.
+
+    Returns:
+        list: (table, partition, workflow ID or None for the default partition, estimated rows, total bytes,
+            whether attached) tuples
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        SELECT tables.name, child.relname, child.relispartition, child.reltuples::bigint,
+            pg_total_relation_size(child.oid)
+          FROM unnest(%s::text[]) AS tables (name)
+          INNER JOIN pg_class child
+            ON child.relname LIKE tables.name || '\\_w%%'
+            OR child.relname = tables.name || '_default'
+          WHERE child.relkind = 'r'
+          ORDER BY tables.name, child.relname;
+    ''', (list(PARTITIONED_TABLES),))
+
+    status = []
+    for table, name, attached, rows, size in cursor.fetchall():
+        if name == default_partition_name(table):
+            ssw_id = None
+        else:
+            suffix = name[len(table) + len('_w'):]
+            if not suffix.isdigit():
+                continue
+            ssw_id = int(suffix)
+        status.append((table, name, ssw_id, max(rows, 0), size, attached))
+
+    return status
+
+
+def create_partitions_on_workflow_save(sender, instance, created, **kwargs):
+    """post_save receiver creating a new workflow's partitions, when the tables are partitioned"""
+    if created and is_partitioned():
+        create_workflow_partitions(instance.id)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorization of label rasters into synapse slices.
+
+Label images are uint32 arrays the size of one tile, where 0 is background and each 4-connected region of equal
+non-zero value becomes one synapse slice. Regions are found by run-length encoding each row and joining runs which
+overlap in adjacent rows, so the work scales with the number of runs rather than the number of pixels.
+
+The reverse, rasterizing synapse slice polygons into label patches, is done by scanline: each polygon edge toggles
+the pixels of the rows it crosses which are left of the crossing, so the work scales with the number of edges times
+the rows they span.
+"""
+from __future__ import division
+import base64
+import zlib
+
+import numpy as np
+
+from synapsesuggestor.control.disjoint_set import connected_components
+
+
+LABEL_ENCODINGS = ('zlib', 'rle')
+
+_WKB_BOX_DTYPE = np.dtype([
+    ('byte_order', 'u1'),
+    ('geom_type', '<u4'),
+    ('ring_count', '<u4'),
+    ('point_count', '<u4'),
+    ('coords', '<f8', (5, 2)),
+])
+_WKB_MULTI_HEADER_DTYPE = np.dtype([('byte_order', 'u1'), ('geom_type', '<u4'), ('count', '<u4')])
+
+
+def decode_label_image(data, encoding, shape):
+    """
+    Decode a base64-encoded label image.
+
+    Args:
+        data(str): base64-encoded label image
+        encoding(str): 'zlib' (zlib-compressed little-endian uint32 array in C order) or 'rle' (little-endian uint32
+            array of interleaved value, run length pairs in C order)
+        shape(tuple): (height, width) of the image
+
+    Returns:
+        numpy.ndarray: uint32 array of the given shape
+    """
+    raw = base64.b64decode(data)
+    if encoding == 'zlib':
+        flat = np.frombuffer(zlib.decompress(raw), dtype='<u4')
+    elif encoding == 'rle':
+        pairs = np.frombuffer(raw, dtype='<u4').reshape(-1, 2)
+        flat = np.repeat(pairs[:, 0], pairs[:, 1])
+    else:
+        raise ValueError('Label image encoding must be one of {}, got {}'.format(', '.join(LABEL_ENCODINGS), encoding))
+
+    if flat.size != shape[0] * shape[1]:
+        raise ValueError('Label image has {} pixels, expected {}x{}'.format(flat.size, shape[0], shape[1]))
+
+    return flat.reshape(shape)
+
+
+def label_runs(labels):
+    """
+    Find the 4-connected regions of equal non-zero value in a label image, as horizontal runs of pixels.
+
+    Args:
+        labels(numpy.ndarray): 2D integer array
+
+    Returns:
+        dict: arrays 'row', 'start', 'stop' (exclusive), 'value' and 'component' for each run, sorted by component.
+            Components are numbered from 0.
+    """
+    width = labels.shape[1]
+
+    is_start = np.ones(labels.shape, dtype=bool)
+    is_start[:, 1:] = labels[:, 1:] != labels[:, :-1]
+    flat_starts = np.flatnonzero(is_start)
+    # every row begins with a new run, so no run continues past the end of its row
+    flat_stops = np.append(flat_starts[1:], labels.size)
+
+    run_ids = np.cumsum(is_start.ravel()).reshape(labels.shape) - 1
+    values = labels.ravel()[flat_starts]
+
+    vertical = (labels[1:] == labels[:-1]) & (labels[1:] != 0)
+    edges = np.unique(np.column_stack([run_ids[1:][vertical], run_ids[:-1][vertical]]), axis=0)
+
+    roots = connected_components(len(flat_starts), edges)
+
+    foreground = values != 0
+    _, components = np.unique(roots[foreground], return_inverse=True)
+    order = np.argsort(components, kind='mergesort')
+
+    return {
+        'row': (flat_starts[foreground] // width)[order],
+        'start': (flat_starts[foreground] % width)[order],
+        'stop': (flat_stops[foreground] - (flat_starts[foreground] // width) * width)[order],
+        'value': values[foreground][order],
+        'component': components.ravel()[order],
+    }
+
+
+def runs_to_wkb(row, start, stop, origin=(0, 0)):
+    """
+    Build a WKB MultiPolygon with one unit-height box per run, in stack coordinates.
+
+    Args:
+        row(numpy.ndarray): row index of each run
+        start(numpy.ndarray): first column of each run
+        stop(numpy.ndarray): column after the last of each run
+        origin(tuple): stack coordinates of the top-left corner of the image
+
+    Returns:
+        bytes
+    """
+    x0 = start + origin[0]
+    x1 = stop + origin[0]
+    y0 = row + origin[1]
+    y1 = y0 + 1
+
+    boxes = np.zeros(len(row), dtype=_WKB_BOX_DTYPE)
+    boxes['byte_order'] = 1
+    boxes['geom_type'] = 3
+    boxes['ring_count'] = 1
+    boxes['point_count'] = 5
+    boxes['coords'][:, :, 0] = np.column_stack([x0, x1, x1, x0, x0])
+    boxes['coords'][:, :, 1] = np.column_stack([y0, y0, y1, y1, y0])
+
+    header = np.array([(1, 6, len(row))], dtype=_WKB_MULTI_HEADER_DTYPE)
+    return header.tobytes() + boxes.tobytes()
+
+
+def vectorize_label_image(labels, origin=(0, 0)):
+    """
+    Convert a label image into synapse slice information.
+
+    Args:
+        labels(numpy.ndarray): 2D integer array, 0 being background
+        origin(tuple): stack coordinates of the top-left corner of the image
+
+    Returns:
+        list: dicts with keys 'id' (component index), 'label', 'geom' (WKB MultiPolygon of pixel runs),
+            'size_px', 'xs_centroid' and 'ys_centroid', one per region
+    """
+    runs = label_runs(labels)
+    if not len(runs['component']):
+        return []
+
+    lengths = runs['stop'] - runs['start']
+    component_count = runs['component'][-1] + 1
+
+    size_px = np.bincount(runs['component'], weights=lengths, minlength=component_count)
+    # sum of pixel centre coordinates over each run
+    x_sums = np.bincount(runs['component'], weights=(runs['start'] + runs['stop']) * lengths / 2,
+                         minlength=component_count)
+    y_sums = np.bincount(runs['component'], weights=(runs['row'] + 0.5) * lengths, minlength=component_count)
+
+    xs_centroid = np.floor(x_sums / size_px).astype(int) + origin[0]
+    ys_centroid = np.floor(y_sums / size_px).astype(int) + origin[1]
+
+    bounds = np.append(np.flatnonzero(np.diff(runs['component'])) + 1, len(runs['component']))
+    slices = []
+    start_idx = 0
+    for component, stop_idx in enumerate(bounds):
+        slices.append({
+            'id': component,
+            'label': int(runs['value'][start_idx]),
+            'geom': runs_to_wkb(
+                runs['row'][start_idx:stop_idx], runs['start'][start_idx:stop_idx], runs['stop'][start_idx:stop_idx],
+                origin
+            ),
+            'size_px': int(size_px[component]),
+            'xs_centroid': int(xs_centroid[component]),
+            'ys_centroid': int(ys_centroid[component]),
+        })
+        start_idx = stop_idx
+
+    return slices
+
+
+def rasterize_polygon(rings, origin, shape):
+    """
+    Rasterize a polygon onto a pixel grid, with the even-odd rule; a pixel is inside if its centre is.
+
+    Args:
+        rings(list): Rings (exterior first, then holes) of (x, y) coordinates
+        origin(tuple): (x, y) coordinates of the top-left corner of the grid
+        shape(tuple): (height, width) of the grid
+
+    Returns:
+        numpy.ndarray: boolean array of the given shape
+    """
+    height, width = shape
+    # toggles[row, k] counts the edge crossings in the row which have k pixel centres to their left
+    toggles = np.zeros((height, width + 1), dtype=np.int32)
+
+    for ring in rings:
+        coords = np.asarray(ring, dtype=np.float64).reshape(-1, 2) - np.asarray(origin, dtype=np.float64)
+        if len(coords) < 2:
+            continue
+        if not np.array_equal(coords[0], coords[-1]):
+            coords = np.concatenate([coords, coords[:1]])
+
+        for (x0, y0), (x1, y1) in zip(coords[:-1], coords[1:]):
+            if y0 == y1:
+                continue
+            # rows whose pixel centre, at row + 0.5, is in [min(y0, y1), max(y0, y1))
+            row_start = max(int(np.ceil(min(y0, y1) - 0.5)), 0)
+            row_stop = min(int(np.ceil(max(y0, y1) - 0.5)), height)
+            if row_start >= row_stop:
+                continue
+
+            rows = np.arange(row_start, row_stop)
+            x_crossings = x0 + (rows + 0.5 - y0) * (x1 - x0) / (y1 - y0)
+            lefts = np.clip(np.ceil(x_crossings - 0.5), 0, width).astype(np.int64)
+            np.add.at(toggles, (rows, lefts), 1)
+
+    # a pixel is toggled by every crossing to its right
+    crossings_right = np.cumsum(toggles[:, ::-1], axis=1)[:, ::-1]
+    return crossings_right[:, 1:] % 2 == 1
+
+
+def rasterize_labels(polygons, labels, origin, shape, dtype=np.int64):
+    """
+    Rasterize labelled polygons into a label image, later polygons overwriting earlier ones.
+
+    Args:
+        polygons(list): Polygons, each a list of rings as accepted by rasterize_polygon
+        labels(list): Label of each polygon
+        origin(tuple): (x, y) coordinates of the top-left corner of the image
+        shape(tuple): (height, width) of the image
+        dtype(numpy.dtype, optional): Default int64
+
+    Returns:
+        numpy.ndarray: array of the given shape, 0 being background
+    """
+    image = np.zeros(shape, dtype=dtype)
+    for rings, label in zip(polygons, labels):
+        image[rasterize_polygon(rings, origin, shape)] = label
+    return image
@@ -2,46 +2,162 @@
 """
 Methods used by the synapse detection code
 """
+import base64
 import json
 import logging
 
-import networkx as nx
+import numpy as np
 
-from django.db import connection
-from django.http import JsonResponse
+from django.db import connection, transaction
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import condition
 from rest_framework.decorators import api_view
 
 # from catmaid.control.authentication import requires_user_role
 from catmaid.control.common import get_request_list
-from synapsesuggestor.control.common import list_into_query
+from synapsesuggestor.control.cache import get_cache
+from synapsesuggestor.control.common import list_into_query, copy_rows, iter_query, streaming_json_response
+from synapsesuggestor.control.disjoint_set import cluster_slices
+from synapsesuggestor.control.geometry import (
+    check_geom_format, geom_pg_type, geom_sql, get_tile_size, prepare_geom
+)
+from synapsesuggestor.control.raster import decode_label_image, vectorize_label_image
 from synapsesuggestor.models import SynapseDetectionTile, SynapseObject
 
 
 logger = logging.getLogger(__name__)
 
 
+TILE_COVERAGE_FORMATS = ('list', 'rle', 'bitmap')
+
+tile_grid_shape_cache = get_cache('tile_grid_shape')
+
+
+def _detected_tiles_etag(request, project_id=None):
+    """
+    ETag which changes whenever tiles are added to the workflow, and differs between response encodings.
+
+    Tiles are only ever added (or deleted along with their workflow), and their IDs come from a sequence, so the
+    workflow's latest tile ID identifies its set of tiles; it is read from the end of an index.
+    """
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT max(sdt.id) FROM synapse_detection_tile sdt
+          WHERE sdt.synapse_suggestion_workflow_id = %s;
+    ''', (int(request.GET['workflow_id']),))
+    max_id = cursor.fetchone()[0]
+    return '{}-{}-{}'.format(max_id, request.GET.get('format', 'list'), request.GET.get('binary', 'false').lower())
+
+
+def _get_tile_grid_shape(ssw_id, cursor=None):
+    """
+    Get the shape of the workflow's tiling grid over its stack.
+
+    Returns:
+        tuple: (z, y, x) number of tiles, or (0, 0, 0) if the workflow does not exist
+    """
+    return tile_grid_shape_cache.get_or_set(int(ssw_id), lambda: _query_tile_grid_shape(ssw_id, cursor))
+
+
+def _query_tile_grid_shape(ssw_id, cursor=None):
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        SELECT (stack.dimension).z,
+          ceil((stack.dimension).y::float / tiling.tile_height_px)::int,
+          ceil((stack.dimension).x::float / tiling.tile_width_px)::int
+          FROM synapse_suggestion_workflow ssw
+          INNER JOIN synapse_detection_tiling tiling
+            ON tiling.id = ssw.synapse_detection_tiling_id
+          INNER JOIN stack
+            ON stack.id = tiling.stack_id
+          WHERE ssw.id = %s;
+    ''', (ssw_id,))
+    row = cursor.fetchone()
+    return tuple(row) if row else (0, 0, 0)
+
+
+def _tile_coverage_runs(flat_idxs):
+    """Encode sorted, unique flat indices as interleaved start, length pairs of consecutive runs"""
+    breaks = np.flatnonzero(np.diff(flat_idxs) != 1) + 1
+    starts = flat_idxs[np.concatenate([[0], breaks])]
+    lengths = np.diff(np.concatenate([[0], breaks, [len(flat_idxs)]]))
+    return np.column_stack([starts, lengths]).ravel().tolist()
+
+
+@condition(etag_func=_detected_tiles_etag)
 def get_detected_tiles(request, project_id=None):
     """
     GET request which returns the set of tile indices which have been addressed by the given synapse suggestion
     workflow.
 
+    Supports conditional requests: the response has an ETag which only changes when tiles are added to the workflow.
+
     GET parameters:
     workflow_id
+    format: one of
+        'list' (default): list of [x, y, z] tile indices
+        'rle': object with 'shape', the (z, y, x) shape of the tiling grid, and 'layers', a list of [z, runs] for each
+            z index with detected tiles, where runs is a flat list of interleaved start, length pairs of runs of
+            detected tiles over the layer's row-major (y * x_count + x) tile indices
+        'bitmap': as 'rle', but with each layer given as a base64-encoded, big-endian bit-packed (numpy.packbits)
+            row-major boolean array
+    binary: if 'true' and format is 'bitmap', return the bit-packed row-major boolean array of the whole
+        (z, y, x) grid as an application/octet-stream body, with the shape in the X-Tile-Grid-Shape header
+        (default false)
     """
 
-    ssw_id = request.GET['workflow_id']
-
-    cursor = connection.cursor()
+    ssw_id = int(request.GET['workflow_id'])
+    coverage_format = request.GET.get('format', 'list')
+    if coverage_format not in TILE_COVERAGE_FORMATS:
+        raise ValueError('Tile coverage format must be one of {}, got {}'.format(
+            ', '.join(TILE_COVERAGE_FORMATS), coverage_format
+        ))
 
-    cursor.execute('''
+    query = '''
         SELECT sdt.x_tile_idx, sdt.y_tile_idx, sdt.z_tile_idx
           FROM synapse_detection_tile sdt
           INNER JOIN synapse_suggestion_workflow ssw
             ON sdt.synapse_suggestion_workflow_id = ssw.id
           WHERE ssw.id = %s;
-    ''', (ssw_id,))
+    '''
 
-    return JsonResponse(cursor.fetchall(), safe=False)
+    if coverage_format == 'list':
+        return streaming_json_response(iter_query(query, (ssw_id,)))
+
+    cursor = connection.cursor()
+    cursor.execute(query, (ssw_id,))
+
+    xyz = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3)
+    # tiles outside the stack extent are unexpected, but should not be lost
+    shape = np.array(_get_tile_grid_shape(ssw_id, cursor), dtype=np.int64)
+    if len(xyz):
+        shape = np.maximum(shape, xyz[:, ::-1].max(axis=0) + 1)
+    layer_size = int(shape[1] * shape[2])
+
+    if request.GET.get('binary', 'false').lower() == 'true' and coverage_format == 'bitmap':
+        grid = np.zeros(int(shape.prod()), dtype=bool)
+        grid[(xyz[:, 2] * shape[1] + xyz[:, 1]) * shape[2] + xyz[:, 0]] = True
+        response = HttpResponse(np.packbits(grid).tobytes(), content_type='application/octet-stream')
+        response['X-Tile-Grid-Shape'] = ','.join(str(item) for item in shape)
+        return response
+
+    layers = []
+    flat_idxs = np.unique(xyz[:, 2] * layer_size + xyz[:, 1] * shape[2] + xyz[:, 0])
+    z_idxs = flat_idxs // layer_size
+    bounds = np.flatnonzero(np.diff(z_idxs)) + 1
+    for layer_idxs in np.split(flat_idxs, bounds) if len(flat_idxs) else []:
+        z_idx = int(layer_idxs[0] // layer_size)
+        layer_idxs = layer_idxs - z_idx * layer_size
+        if coverage_format == 'rle':
+            layers.append([z_idx, _tile_coverage_runs(layer_idxs)])
+        else:
+            layer = np.zeros(layer_size, dtype=bool)
+            layer[layer_idxs] = True
+            layers.append([z_idx, base64.b64encode(np.packbits(layer).tobytes()).decode('ascii')])
+
+    return JsonResponse({'shape': shape.tolist(), 'layers': layers})
 
 
 def add_synapse_slices_from_tile(request, project_id=None):
@@ -69,47 +185,614 @@ def add_synapse_slices_from_tile(request, project_id=None):
     tolerance: Geometries are simplified before entering the database. This specifies the tolerance parameter
         used by the Ramer-Douglas-Peucker simplification algorithm. Note that due to this simplification,
         there may be a small difference between a synapseslice's size_px and its ST_Area(geom_2d).
+    geom_format: Encoding of the synapse slices' "geom" values (see synapsesuggestor.control.geometry): 'geojson'
+        (default), 'wkb_hex', 'wkb_base64' or 'packed' (tile-relative int16 coordinates with "ring_offsets").
     """
-    ssw_id = request.POST['workflow_id']
+    ssw_id = int(request.POST['workflow_id'])
     synapse_slices = get_request_list(request.POST, 'synapse_slices', tuple(), json.loads)
-    tile_x_idx = int(request.POST['x_idx'])
-    tile_y_idx = int(request.POST['y_idx'])
-    tile_z_idx = int(request.POST['z_idx'])
+    tile_idx = (int(request.POST['x_idx']), int(request.POST['y_idx']), int(request.POST['z_idx']))
     rdp_tolerance = float(request.POST.get('tolerance', 1))
+    geom_format = check_geom_format(request.POST.get('geom_format', 'geojson'))
 
-    tile, created = SynapseDetectionTile.objects.get_or_create(
-        synapse_suggestion_workflow_id=ssw_id,
-        x_tile_idx=tile_x_idx,
-        y_tile_idx=tile_y_idx,
-        z_tile_idx=tile_z_idx
-    )
-    tile_id = tile.id
+    cursor = connection.cursor()
+
+    tile_id = _get_or_create_tiles(ssw_id, [tile_idx], cursor)[tile_idx]
 
     if not synapse_slices:
         return JsonResponse(dict())
 
-    syn_slice_rows = [
-        (tile_id, d['geom'], d['size_px'], int(d['xs_centroid']), int(d['ys_centroid']), d['uncertainty'])
-        for d in synapse_slices
+    new_ids = _insert_synapse_slices(
+        [(tile_id, tile_idx, syn_slice) for syn_slice in synapse_slices], rdp_tolerance, cursor,
+        geom_format, get_tile_size(ssw_id) if geom_format == 'packed' else None
+    )
+    id_mapping = {syn_slice['id']: new_id for syn_slice, new_id in zip(synapse_slices, new_ids)}
+    return JsonResponse(id_mapping)
+
+
+@api_view(['POST'])
+def add_synapse_slices_from_tiles(request, project_id=None):
+    """
+    POST request which adds synapse slices from many tiles to the database in bulk, and returns the mapping from their
+    naive IDs to database IDs for each tile.
+
+    Missing tiles are created in a single statement, as are all of the synapse slices. The response is the same as
+    making one request to add_synapse_slices_from_tile per tile, collected into an array in the order the tiles were
+    given.
+
+    This function does not agglomerate 2D synapse slices into 3D synapse objects.
+    ---
+    parameters:
+      - name: workflow_id
+        description: ID of synapse suggestion workflow through which synapse slices were detected
+        type: integer
+        required: true
+        paramType: form
+      - name: tiles
+        description: >  Array of JSON-encoded objects with keys "x_idx", "y_idx", "z_idx" (integer tile indices) and
+          "synapse_slices" (array of synapse slice objects as accepted by add_synapse_slices_from_tile)
+        type: array
+        items:
+          type: string
+        required: false
+        paramType: form
+      - name: tolerance
+        description: tolerance used by the Ramer-Douglas-Peucker geometry simplification (default 1)
+        type: float
+        required: false
+        paramType: form
+      - name: geom_format
+        description: > encoding of the synapse slices' geometries: 'geojson' (default), 'wkb_hex', 'wkb_base64' or
+          'packed'
+        type: string
+        required: false
+        paramType: form
+    type:
+      - type: array
+        items:
+          type: object
+        description: > array of objects, one per given tile, whose keys are naive synapse slice IDs and values are
+          database synapse slice IDs
+        required: true
+    """
+    ssw_id = int(request.POST['workflow_id'])
+    tiles = get_request_list(request.POST, 'tiles', tuple(), json.loads)
+    rdp_tolerance = float(request.POST.get('tolerance', 1))
+    geom_format = check_geom_format(request.POST.get('geom_format', 'geojson'))
+
+    if not tiles:
+        return JsonResponse([], safe=False)
+
+    tile_idxs = [(int(tile['x_idx']), int(tile['y_idx']), int(tile['z_idx'])) for tile in tiles]
+
+    cursor = connection.cursor()
+
+    tile_ids = _get_or_create_tiles(ssw_id, tile_idxs, cursor)
+
+    tile_slices = [
+        (tile_ids[tile_idx], tile_idx, syn_slice)
+        for tile, tile_idx in zip(tiles, tile_idxs)
+        for syn_slice in tile.get('synapse_slices', [])
     ]
+    new_ids = iter(_insert_synapse_slices(
+        tile_slices, rdp_tolerance, cursor, geom_format, get_tile_size(ssw_id) if geom_format == 'packed' else None
+    ))
 
-    query, args = list_into_query(
-        '''
-            INSERT INTO synapse_slice (
-              synapse_detection_tile_id, geom_2d, size_px, xs_centroid, ys_centroid, uncertainty
+    id_mappings = []
+    for tile in tiles:
+        id_mappings.append({syn_slice['id']: next(new_ids) for syn_slice in tile.get('synapse_slices', [])})
+
+    return JsonResponse(id_mappings, safe=False)
+
+
+@api_view(['POST'])
+def add_synapse_slices_from_label_image(request, project_id=None):
+    """
+    POST request which vectorizes a label image covering one tile into synapse slices, and adds them to the database.
+
+    Each 4-connected region of equal non-zero value in the label image becomes one synapse slice, whose geometry is
+    the union of its pixels and whose size and centroid are calculated from its pixels.
+
+    This function does not agglomerate 2D synapse slices into 3D synapse objects.
+    ---
+    parameters:
+      - name: workflow_id
+        description: ID of synapse suggestion workflow through which synapse slices were detected
+        type: integer
+        required: true
+        paramType: form
+      - name: x_idx
+        type: integer
+        required: true
+        paramType: form
+      - name: y_idx
+        type: integer
+        required: true
+        paramType: form
+      - name: z_idx
+        type: integer
+        required: true
+        paramType: form
+      - name: label_image
+        description: > base64-encoded label image with the same dimensions as the workflow's tiles (see
+          synapsesuggestor.control.raster.decode_label_image)
+        type: string
+        required: true
+        paramType: form
+      - name: encoding
+        description: "'zlib' (default) or 'rle'"
+        type: string
+        required: false
+        paramType: form
+      - name: uncertainties
+        description: JSON-encoded object mapping label values to the uncertainty of those labels
+        type: string
+        required: false
+        paramType: form
+      - name: tolerance
+        description: tolerance used by the Ramer-Douglas-Peucker geometry simplification (default 1)
+        type: float
+        required: false
+        paramType: form
+    type:
+      columns:
+        type: array
+        items:
+          type: string
+        description: headers for columns in data array
+        required: true
+      data:
+        type: array
+        items:
+          type: array
+        description: array of arrays, each row of which describes one new synapse slice
+        required: true
+    """
+    columns = ['synapse_slice_id', 'label', 'xs_centroid', 'ys_centroid', 'size_px']
+
+    ssw_id = int(request.POST['workflow_id'])
+    tile_idx = (int(request.POST['x_idx']), int(request.POST['y_idx']), int(request.POST['z_idx']))
+    encoding = request.POST.get('encoding', 'zlib')
+    uncertainties = json.loads(request.POST.get('uncertainties', '{}'))
+    rdp_tolerance = float(request.POST.get('tolerance', 1))
+
+    tile_width, tile_height = get_tile_size(ssw_id)
+    labels = decode_label_image(request.POST['label_image'], encoding, (tile_height, tile_width))
+    synapse_slices = vectorize_label_image(labels, (tile_idx[0] * tile_width, tile_idx[1] * tile_height))
+    for syn_slice in synapse_slices:
+        syn_slice['uncertainty'] = uncertainties.get(str(syn_slice['label']))
+
+    cursor = connection.cursor()
+
+    tile_id = _get_or_create_tiles(ssw_id, [tile_idx], cursor)[tile_idx]
+    new_ids = _insert_synapse_slices(
+        [(tile_id, tile_idx, syn_slice) for syn_slice in synapse_slices], rdp_tolerance, cursor, 'pixel_runs'
+    )
+
+    data = [
+        [new_id, syn_slice['label'], syn_slice['xs_centroid'], syn_slice['ys_centroid'], syn_slice['size_px']]
+        for syn_slice, new_id in zip(synapse_slices, new_ids)
+    ]
+    return JsonResponse({'columns': columns, 'data': data})
+
+
+def _get_or_create_tiles(ssw_id, tile_idxs, cursor=None):
+    """
+    Get the database IDs of the synapse detection tiles with the given indices, creating any which do not yet exist in
+    a single statement.
+
+    Args:
+        ssw_id(int): Synapse suggestion workflow ID
+        tile_idxs(list): List of (x, y, z) tile index tuples
+        cursor(django.db.connection.cursor, optional):
+
+    Returns:
+        dict: Mapping from (x, y, z) tile index tuples to synapse detection tile IDs
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    xs, ys, zs = zip(*set(tile_idxs))
+
+    # rows inserted by the CTE are not visible to the outer SELECT on synapse_detection_tile, so the two halves of the
+    # union are disjoint
+    cursor.execute('''
+        WITH requested (x_tile_idx, y_tile_idx, z_tile_idx) AS (
+          SELECT * FROM unnest(%(xs)s::int[], %(ys)s::int[], %(zs)s::int[])
+        ), inserted AS (
+          INSERT INTO synapse_detection_tile (synapse_suggestion_workflow_id, x_tile_idx, y_tile_idx, z_tile_idx)
+            SELECT %(ssw_id)s, requested.x_tile_idx, requested.y_tile_idx, requested.z_tile_idx FROM requested
+            ON CONFLICT (synapse_suggestion_workflow_id, x_tile_idx, y_tile_idx, z_tile_idx) DO NOTHING
+            RETURNING id, x_tile_idx, y_tile_idx, z_tile_idx
+        )
+        SELECT inserted.id, inserted.x_tile_idx, inserted.y_tile_idx, inserted.z_tile_idx FROM inserted
+        UNION ALL
+        SELECT tile.id, tile.x_tile_idx, tile.y_tile_idx, tile.z_tile_idx FROM synapse_detection_tile tile
+          INNER JOIN requested
+            ON tile.x_tile_idx = requested.x_tile_idx
+            AND tile.y_tile_idx = requested.y_tile_idx
+            AND tile.z_tile_idx = requested.z_tile_idx
+          WHERE tile.synapse_suggestion_workflow_id = %(ssw_id)s;
+    ''', {'ssw_id': ssw_id, 'xs': list(xs), 'ys': list(ys), 'zs': list(zs)})
+
+    tile_ids = {(x, y, z): tile_id for tile_id, x, y, z in cursor.fetchall()}
+
+    # tiles created by a concurrent transaction are neither inserted nor visible in this statement's snapshot
+    missing = set(tile_idxs).difference(tile_ids)
+    if missing:
+        for tile in SynapseDetectionTile.objects.filter(synapse_suggestion_workflow_id=ssw_id).filter(
+            x_tile_idx__in={x for x, _, _ in missing},
+            y_tile_idx__in={y for _, y, _ in missing},
+            z_tile_idx__in={z for _, _, z in missing},
+        ):
+            tile_ids[(tile.x_tile_idx, tile.y_tile_idx, tile.z_tile_idx)] = tile.id
+
+    return tile_ids
+
+
+def _insert_synapse_slices(tile_slices, rdp_tolerance, cursor=None, geom_format='geojson', tile_size=None):
+    """
+    Insert synapse slices belonging to any number of tiles in a single statement.
+
+    Database IDs are reserved from the sequence before the insert, so that the returned IDs are guaranteed to be in
+    the same order as the input.
+
+    Args:
+        tile_slices(list): List of (tile ID, (x, y, z) tile index, synapse slice dict) tuples, where the dict is of
+            the form accepted by add_synapse_slices_from_tile
+        rdp_tolerance(float): Tolerance for geometry simplification
+        cursor(django.db.connection.cursor, optional):
+        geom_format(str, optional): Encoding of the synapse slice geometries, one of GEOM_FORMATS
+        tile_size(tuple, optional): (width, height) of tiles in pixels, required for the packed geometry format
+
+    Returns:
+        list: Synapse slice IDs, in the same order as the input
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    if not tile_slices:
+        return []
+
+    cursor.execute('''
+        SELECT nextval(pg_get_serial_sequence('synapse_slice', 'id')) FROM generate_series(1, %s);
+    ''', (len(tile_slices),))
+    new_ids = [row[0] for row in cursor.fetchall()]
+
+    columns = {
+        'ids': new_ids,
+        'tile_ids': [],
+        'geoms': [],
+        'sizes': [],
+        'xs': [],
+        'ys': [],
+        'uncertainties': [],
+    }
+    for tile_id, tile_idx, syn_slice in tile_slices:
+        columns['tile_ids'].append(tile_id)
+        columns['geoms'].append(prepare_geom(syn_slice, geom_format, tile_idx, tile_size))
+        columns['sizes'].append(int(syn_slice['size_px']))
+        columns['xs'].append(int(syn_slice['xs_centroid']))
+        columns['ys'].append(int(syn_slice['ys_centroid']))
+        columns['uncertainties'].append(syn_slice['uncertainty'])
+
+    cursor.execute('''
+        INSERT INTO synapse_slice (
+          id, synapse_detection_tile_id, synapse_suggestion_workflow_id, geom_2d, size_px, xs_centroid, ys_centroid,
+          uncertainty
+        )
+        SELECT
+          rows.id, rows.tile_id, tile.synapse_suggestion_workflow_id, ST_Simplify({geom}, %(tolerance)s, TRUE),
+          rows.size_px, rows.xs_centroid, rows.ys_centroid, rows.uncertainty
+        FROM unnest(
+          %(ids)s::int[], %(tile_ids)s::int[], %(geoms)s::{geom_type}[], %(sizes)s::int[],
+          %(xs)s::int[], %(ys)s::int[], %(uncertainties)s::float8[]
+        ) AS rows (id, tile_id, geom, size_px, xs_centroid, ys_centroid, uncertainty)
+        INNER JOIN synapse_detection_tile tile
+          ON tile.id = rows.tile_id;
+    '''.format(geom=geom_sql(geom_format, 'rows.geom'), geom_type=geom_pg_type(geom_format)),
+        dict(columns, tolerance=rdp_tolerance))
+
+    sync_synapse_slice_project_geoms(new_ids, cursor=cursor)
+
+    return new_ids
+
+
+def sync_synapse_slice_project_geoms(synapse_slice_ids=None, project_id=None, cursor=None, id_relation=None):
+    """
+    Create or update the project-space geometries of synapse slices, for every project containing their stack.
+
+    Args:
+        synapse_slice_ids(iterable, optional): IDs of synapse slices to sync. Default all
+        project_id(int, optional): Only sync geometries in this project. Default all projects
+        cursor(django.db.connection.cursor, optional):
+        id_relation(str, optional): SQL relation with an "id" column of synapse slice IDs to sync, used instead of
+            synapse_slice_ids
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    if id_relation is None:
+        if synapse_slice_ids is None:
+            id_relation = '(SELECT ss.id FROM synapse_slice ss)'
+        else:
+            synapse_slice_ids = list(synapse_slice_ids)
+            if not synapse_slice_ids:
+                return
+            id_relation = 'unnest(%(ids)s::bigint[])'
+
+    cursor.execute('''
+        INSERT INTO synapse_slice_project_geom (synapse_slice_id, synapse_suggestion_workflow_id, project_id, geom_p)
+          SELECT ss.id, ss.synapse_suggestion_workflow_id, ps.project_id, ST_Translate(
+              ST_Force3D(ST_Scale(ss.geom_2d, (stack.resolution).x, (stack.resolution).y)),
+              (ps.translation).x, (ps.translation).y, tile.z_tile_idx * (stack.resolution).z + (ps.translation).z
             )
-            VALUES {}
-            RETURNING id;
-        ''',
-        syn_slice_rows,
-        fmt='(%s, ST_Simplify(ST_GeomFromGeoJson(%s), {}, TRUE), %s, %s, %s, %s)'.format(rdp_tolerance)
+            FROM {} AS slice_ids (id)
+            INNER JOIN synapse_slice ss
+              ON ss.id = slice_ids.id
+            INNER JOIN synapse_detection_tile tile
+              ON ss.synapse_detection_tile_id = tile.id
+            INNER JOIN synapse_suggestion_workflow ssw
+              ON tile.synapse_suggestion_workflow_id = ssw.id
+            INNER JOIN synapse_detection_tiling tiling
+              ON ssw.synapse_detection_tiling_id = tiling.id
+            INNER JOIN stack
+              ON tiling.stack_id = stack.id
+            INNER JOIN project_stack ps
+              ON ps.stack_id = stack.id
+            WHERE %(project_id)s::int IS NULL OR ps.project_id = %(project_id)s
+          ON CONFLICT (synapse_slice_id, project_id) DO UPDATE SET geom_p = EXCLUDED.geom_p;
+    '''.format(id_relation), {'ids': synapse_slice_ids, 'project_id': project_id})
+
+
+def sync_stack_project_geoms(stack_id, project_id=None, cursor=None):
+    """
+    Bring the project-space geometries of the synapse slices detected in a stack in line with the stack's current
+    resolution and project translations, and delete those in projects which no longer contain the stack.
+
+    Args:
+        stack_id(int):
+        project_id(int, optional): Only sync geometries in this project, also deleting those of any other stack the
+            project no longer contains. Default all projects
+        cursor(django.db.connection.cursor, optional):
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        DELETE FROM synapse_slice_project_geom ssp
+          USING synapse_suggestion_workflow ssw, synapse_detection_tiling tiling
+          WHERE ssp.synapse_suggestion_workflow_id = ssw.id
+            AND ssw.synapse_detection_tiling_id = tiling.id
+            AND (%(project_id)s::int IS NULL AND tiling.stack_id = %(stack_id)s OR ssp.project_id = %(project_id)s)
+            AND NOT EXISTS (
+              SELECT 1 FROM project_stack ps WHERE ps.project_id = ssp.project_id AND ps.stack_id = tiling.stack_id
+            );
+    ''', {'stack_id': stack_id, 'project_id': project_id})
+
+    sync_synapse_slice_project_geoms(project_id=project_id, cursor=cursor, id_relation='''(
+        SELECT ss.id FROM synapse_slice ss
+          INNER JOIN synapse_suggestion_workflow ssw
+            ON ss.synapse_suggestion_workflow_id = ssw.id
+          INNER JOIN synapse_detection_tiling tiling
+            ON ssw.synapse_detection_tiling_id = tiling.id
+          WHERE tiling.stack_id = {}
+    )'''.format(int(stack_id)))
+
+
+# fields of catmaid's Stack and ProjectStack which synapse_slice_project_geom is derived from
+PROJECT_GEOM_INPUT_FIELDS = {
+    'Stack': ('resolution',),
+    'ProjectStack': ('project_id', 'stack_id', 'translation'),
+}
+
+
+def _project_geom_inputs(values):
+    """Comparable values of the fields in PROJECT_GEOM_INPUT_FIELDS, given in that order"""
+    return tuple(
+        (value.x, value.y, value.z) if hasattr(value, 'z') else value
+        for value in values
     )
 
-    cursor = connection.cursor()
-    cursor.execute(query, args)
-    new_ids = cursor.fetchall()  # todo: check these are in same order as input
-    id_mapping = {syn_slice['id']: new_id[0] for syn_slice, new_id in zip(synapse_slices, new_ids)}
-    return JsonResponse(id_mapping)
+
+def snapshot_project_geom_inputs(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    pre_save receiver for Stack and ProjectStack, recording the stored values of the fields which project-space
+    geometries are derived from, for the post_save receivers to find whether they changed
+    """
+    fields = PROJECT_GEOM_INPUT_FIELDS[sender.__name__]
+    stored = None
+    if not raw and instance.pk is not None and (update_fields is None or set(fields) & set(update_fields)):
+        stored = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+    instance._synapsesuggestor_geom_inputs = None if stored is None else _project_geom_inputs(stored)
+
+
+def _changed_project_geom_inputs(sender, instance, created):
+    """The stored values of the instance's project geometry inputs before saving, or None if they did not change"""
+    if created:
+        return None
+    old = getattr(instance, '_synapsesuggestor_geom_inputs', None)
+    if old is None:
+        return None
+    new = _project_geom_inputs(getattr(instance, field) for field in PROJECT_GEOM_INPUT_FIELDS[sender.__name__])
+    return None if new == old else old
+
+
+def sync_project_geoms_on_project_stack_save(sender, instance, created, raw=False, **kwargs):
+    """post_save receiver for ProjectStack, whose translation places stacks in project space"""
+    if raw:
+        return
+    old = _changed_project_geom_inputs(sender, instance, created)
+    if old is None and not created:
+        return
+    sync_stack_project_geoms(instance.stack_id, instance.project_id)
+    if old is not None and old[:2] != (instance.project_id, instance.stack_id):
+        # delete the geometries of the stack in the project which no longer contains it
+        old_project_id, old_stack_id = old[:2]
+        sync_stack_project_geoms(old_stack_id, old_project_id)
+
+
+def sync_project_geoms_on_project_stack_delete(sender, instance, **kwargs):
+    """post_delete receiver for ProjectStack"""
+    sync_stack_project_geoms(instance.stack_id, instance.project_id)
+
+
+def sync_project_geoms_on_stack_save(sender, instance, created, raw=False, **kwargs):
+    """post_save receiver for Stack, whose resolution scales synapse slices into project space"""
+    if raw or _changed_project_geom_inputs(sender, instance, created) is None:
+        return
+    sync_stack_project_geoms(instance.id)
+
+
+def load_synapse_slices_from_stream(request, project_id=None):
+    """
+    POST request which bulk-loads synapse slices from any number of tiles, for large backfills.
+
+    The request body is newline-delimited JSON, one synapse slice per line, in the form accepted by
+    add_synapse_slices_from_tile with the additional keys "x_idx", "y_idx" and "z_idx" giving the slice's tile. Lines
+    are streamed into a staging table with binary COPY, and then moved into synapse_slice (creating missing tiles) with
+    set-based geometry simplification.
+
+    GET parameters:
+    workflow_id
+    tolerance: tolerance used by the Ramer-Douglas-Peucker geometry simplification (default 1)
+    return_ids: if 'true', also return the mapping from naive IDs to database IDs (default false)
+    geom_format: encoding of the synapse slices' "geom" values, as for add_synapse_slices_from_tile
+
+    Returns an object with the number of synapse slices inserted and, if requested, 'columns' and 'data' describing
+    the ID mapping.
+    """
+    ssw_id = int(request.GET['workflow_id'])
+    rdp_tolerance = float(request.GET.get('tolerance', 1))
+    return_ids = request.GET.get('return_ids', 'false').lower() == 'true'
+    geom_format = check_geom_format(request.GET.get('geom_format', 'geojson'))
+
+    records = (json.loads(line.decode('utf-8')) for line in request if line.strip())
+    count, id_rows = load_synapse_slices(ssw_id, records, rdp_tolerance, return_ids, geom_format=geom_format)
+
+    response = {'count': count}
+    if return_ids:
+        response['columns'] = ['x_idx', 'y_idx', 'z_idx', 'naive_id', 'synapse_slice_id']
+        response['data'] = id_rows
+
+    return JsonResponse(response)
+
+
+def _staging_columns(geom_format):
+    return (
+        ('naive_id', 'text'),
+        ('x_idx', 'int4'),
+        ('y_idx', 'int4'),
+        ('z_idx', 'int4'),
+        ('geom', geom_pg_type(geom_format)),
+        ('size_px', 'int4'),
+        ('xs_centroid', 'int4'),
+        ('ys_centroid', 'int4'),
+        ('uncertainty', 'float8'),
+    )
+
+
+def _synapse_slice_staging_rows(records, geom_format, tile_size):
+    for record in records:
+        tile_idx = (int(record['x_idx']), int(record['y_idx']), int(record['z_idx']))
+        yield (
+            str(record['id']),
+            tile_idx[0], tile_idx[1], tile_idx[2],
+            prepare_geom(record, geom_format, tile_idx, tile_size),
+            int(record['size_px']), int(record['xs_centroid']), int(record['ys_centroid']),
+            None if record.get('uncertainty') is None else float(record['uncertainty'])
+        )
+
+
+def load_synapse_slices(ssw_id, records, rdp_tolerance=1, return_ids=False, cursor=None, geom_format='geojson'):
+    """
+    Bulk-load synapse slices through a COPY-populated staging table.
+
+    Args:
+        ssw_id(int): Synapse suggestion workflow ID
+        records(iterable): Iterable of synapse slice dicts, in the form accepted by add_synapse_slices_from_tile with
+            additional "x_idx", "y_idx" and "z_idx" keys
+        rdp_tolerance(float): Tolerance for geometry simplification
+        return_ids(bool): Whether to return the mapping from naive IDs to database IDs
+        cursor(django.db.connection.cursor, optional):
+        geom_format(str, optional): Encoding of the synapse slice geometries
+
+    Returns:
+        tuple: Number of synapse slices inserted, and a list of (x_idx, y_idx, z_idx, naive ID, synapse slice ID)
+            tuples if return_ids is True, otherwise None
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    staging_columns = _staging_columns(geom_format)
+    tile_size = get_tile_size(ssw_id) if geom_format == 'packed' else None
+
+    with transaction.atomic():
+        cursor.execute("SELECT pg_get_serial_sequence('synapse_slice', 'id');")
+        sequence_name = cursor.fetchone()[0]
+
+        cursor.execute('''
+            DROP TABLE IF EXISTS synapse_slice_staging;
+            CREATE TEMPORARY TABLE synapse_slice_staging (
+              synapse_slice_id bigint NOT NULL DEFAULT nextval(%s::regclass),
+              {}
+            ) ON COMMIT DROP;
+        '''.format(', '.join('{} {}'.format(*column) for column in staging_columns)), (sequence_name,))
+
+        copy_rows(
+            'synapse_slice_staging',
+            [name for name, _ in staging_columns], [type_name for _, type_name in staging_columns],
+            _synapse_slice_staging_rows(records, geom_format, tile_size), cursor
+        )
+
+        cursor.execute('''
+            ANALYZE synapse_slice_staging;
+
+            INSERT INTO synapse_detection_tile (synapse_suggestion_workflow_id, x_tile_idx, y_tile_idx, z_tile_idx)
+              SELECT DISTINCT %(ssw_id)s, staging.x_idx, staging.y_idx, staging.z_idx FROM synapse_slice_staging staging
+              ON CONFLICT (synapse_suggestion_workflow_id, x_tile_idx, y_tile_idx, z_tile_idx) DO NOTHING;
+
+            INSERT INTO synapse_slice (
+              id, synapse_detection_tile_id, synapse_suggestion_workflow_id, geom_2d, size_px, xs_centroid,
+              ys_centroid, uncertainty
+            )
+            SELECT
+              staging.synapse_slice_id, tile.id, %(ssw_id)s, ST_Simplify({geom}, %(tolerance)s, TRUE),
+              staging.size_px, staging.xs_centroid, staging.ys_centroid, staging.uncertainty
+            FROM synapse_slice_staging staging
+            INNER JOIN synapse_detection_tile tile
+              ON tile.synapse_suggestion_workflow_id = %(ssw_id)s
+              AND tile.x_tile_idx = staging.x_idx
+              AND tile.y_tile_idx = staging.y_idx
+              AND tile.z_tile_idx = staging.z_idx;
+        '''.format(geom=geom_sql(geom_format, 'staging.geom')), {'ssw_id': ssw_id, 'tolerance': rdp_tolerance})
+        count = cursor.rowcount
+
+        sync_synapse_slice_project_geoms(
+            cursor=cursor, id_relation='(SELECT staging.synapse_slice_id FROM synapse_slice_staging staging)'
+        )
+
+        id_rows = None
+        if return_ids:
+            cursor.execute('''
+                SELECT staging.x_idx, staging.y_idx, staging.z_idx, staging.naive_id, staging.synapse_slice_id
+                  FROM synapse_slice_staging staging;
+            ''')
+            id_rows = cursor.fetchall()
+
+        cursor.execute('DROP TABLE synapse_slice_staging;')
+
+    return count, id_rows
+
+
+# offsets of a tile's 26 neighbours and itself in (z, y, x) tile index space
+TILE_NEIGHBOUR_OFFSETS = 'VALUES {}'.format(', '.join(
+    '({}, {}, {})'.format(dz, dy, dx) for dz in (-1, 0, 1) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+))
+
+# offsets of the neighbours of a tile in the same or previous z layer, for z-ordered agglomeration
+TILE_LOWER_NEIGHBOUR_OFFSETS = 'VALUES {}'.format(', '.join(
+    '({}, {}, {})'.format(dz, dy, dx) for dz in (-1, 0) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+))
 
 
 def _get_synapse_slice_adjacencies(synapse_slice_ids, cursor=None):
@@ -121,49 +804,43 @@ def _get_synapse_slice_adjacencies(synapse_slice_ids, cursor=None):
         synapse_slice_ids(list):
 
     Returns:
-        networkx.Graph: Graph where nodes are synapse slices and edges are spatial adjacencies
+        numpy.ndarray: (N, 2) array of spatially adjacent synapse slice ID pairs
     """
     if cursor is None:
         cursor = connection.cursor()
 
-    graph = nx.Graph()
-    graph.add_nodes_from(synapse_slice_ids)
-    # get rows of synapse slices of interest; join to their tiles; join to z-adjacent tiles; join to synapse slices
-    # in those tiles which are also xy-adjacent and do not have the same ID
-    query, args = list_into_query('''
+    # get rows of synapse slices of interest; join to their tiles; join to the 27 tiles in their neighbourhood by
+    # explicit index offsets, so that the (workflow, z, y, x) index can be used; join to synapse slices in those tiles
+    # which are also xy-adjacent and do not have the same ID
+    cursor.execute('''
         SELECT this_slice.id, that_slice.id FROM synapse_slice this_slice
-          INNER JOIN (VALUES {}) these_ids (id)
+          INNER JOIN unnest(%s::bigint[]) AS these_ids (id)
             ON these_ids.id = this_slice.id
           INNER JOIN synapse_detection_tile this_tile
             ON this_tile.id = this_slice.synapse_detection_tile_id
-          INNER JOIN synapse_suggestion_workflow ssw
-            ON this_tile.synapse_suggestion_workflow_id = ssw.id
+          CROSS JOIN ({}) AS offsets (dz, dy, dx)
           INNER JOIN synapse_detection_tile that_tile
-            ON abs(this_tile.z_tile_idx - that_tile.z_tile_idx) <= 1
-            AND abs(this_tile.y_tile_idx - that_tile.y_tile_idx) <= 1
-            AND abs(this_tile.x_tile_idx - that_tile.x_tile_idx) <= 1
-            AND that_tile.synapse_suggestion_workflow_id = ssw.id
+            ON that_tile.synapse_suggestion_workflow_id = this_tile.synapse_suggestion_workflow_id
+            AND that_tile.z_tile_idx = this_tile.z_tile_idx + offsets.dz
+            AND that_tile.y_tile_idx = this_tile.y_tile_idx + offsets.dy
+            AND that_tile.x_tile_idx = this_tile.x_tile_idx + offsets.dx
           INNER JOIN synapse_slice that_slice
             ON that_slice.synapse_detection_tile_id = that_tile.id
             AND ST_DWithin(this_slice.geom_2d, that_slice.geom_2d, 1.1)
             AND this_slice.id != that_slice.id;
-    ''', synapse_slice_ids, fmt='(%s)')
-    cursor.execute(query, args)
-    results = cursor.fetchall()
-    graph.add_edges_from(results)
-    return graph
+    '''.format(TILE_NEIGHBOUR_OFFSETS), (list(synapse_slice_ids),))
+    return np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
 
 
-def _adjacencies_to_slice_clusters(adjacencies, cursor=None):
+def _adjacencies_to_slice_clusters(synapse_slice_ids, adjacencies, cursor=None):
     """
     Find the connected components of the adjacency graph and include slices not in the original graph,
     but which share a synapse object with those which are, as well as the mappings from connected components to the
     set of synapse objects its slices are already associated with.
 
-    This function is terrible.
-
     Args:
-        adjacencies(networkx.Graph): Graph where nodes are synapse slices and edges are spatial adjacencies
+        synapse_slice_ids(list): Seed synapse slice IDs
+        adjacencies(numpy.ndarray): (N, 2) array of spatially adjacent synapse slice ID pairs
 
     Returns:
         list: List whose items are a tuple of a set of slice IDs which form an object, and a set of existing synapse
@@ -172,37 +849,17 @@ def _adjacencies_to_slice_clusters(adjacencies, cursor=None):
     if cursor is None:
         cursor = connection.cursor()
 
-    query, cursor_args = list_into_query('''
-            SELECT DISTINCT ss_so2.synapse_slice_id, ss_so2.synapse_object_id FROM synapse_slice_synapse_object ss_so
-              INNER JOIN (VALUES {}) ss_interest (id)
-                ON ss_so.synapse_slice_id = ss_interest.id
-              INNER JOIN synapse_slice_synapse_object ss_so2
-                ON ss_so.synapse_object_id = ss_so2.synapse_object_id;
-        ''', adjacencies.nodes(), '(%s)')
-    cursor.execute(query, cursor_args)
-
-    existing_slice_to_obj = dict()
-    existing_obj_to_slices = dict()
-    for slice, obj in cursor.fetchall():
-        existing_slice_to_obj[slice] = obj
-        if obj not in existing_obj_to_slices:
-            existing_obj_to_slices[obj] = set()
-        existing_obj_to_slices[obj].add(slice)
+    node_ids = np.union1d(np.asarray(list(synapse_slice_ids), dtype=np.int64), adjacencies.ravel())
 
-    for slice_group in existing_obj_to_slices.values():
-        # order doesn't matter
-        adjacencies.add_path(slice_group)
-
-    out = []
-    for connected_component in nx.connected_components(adjacencies):
-        possible_objects = {None}
-        for slice_id in connected_component:
-            possible_objects.add(existing_slice_to_obj.get(slice_id))
-        possible_objects.remove(None)
-        slices = set(connected_component)
-        out.append((slices, possible_objects))
+    cursor.execute('''
+        SELECT DISTINCT ss_so2.synapse_slice_id, ss_so2.synapse_object_id FROM synapse_slice_synapse_object ss_so
+          INNER JOIN unnest(%s::bigint[]) AS ss_interest (id)
+            ON ss_so.synapse_slice_id = ss_interest.id
+          INNER JOIN synapse_slice_synapse_object ss_so2
+            ON ss_so.synapse_object_id = ss_so2.synapse_object_id;
+    ''', (node_ids.tolist(),))
 
-    return out
+    return cluster_slices(node_ids, adjacencies, cursor.fetchall())
 
 
 def _agglomerate_synapse_slices(slice_clusters, cursor=None):
@@ -243,41 +900,151 @@ def _agglomerate_synapse_slices(slice_clusters, cursor=None):
 
     logger.info('Inserting new slice:object mappings')
     query, cursor_args = list_into_query("""
-        INSERT INTO synapse_slice_synapse_object AS ss_so (synapse_slice_id, synapse_object_id)
-          VALUES {}
-          ON CONFLICT (synapse_slice_id)
+        INSERT INTO synapse_slice_synapse_object AS ss_so (
+          synapse_slice_id, synapse_object_id, synapse_suggestion_workflow_id
+        )
+          SELECT mapping.synapse_slice_id, mapping.synapse_object_id, ss.synapse_suggestion_workflow_id
+            FROM (VALUES {}) AS mapping (synapse_slice_id, synapse_object_id)
+            INNER JOIN synapse_slice ss
+              ON ss.id = mapping.synapse_slice_id
+          ON CONFLICT (synapse_slice_id, synapse_suggestion_workflow_id)
             DO UPDATE SET synapse_object_id = EXCLUDED.synapse_object_id;
     """, new_mappings.items(), fmt='(%s, %s)')
     cursor.execute(query, cursor_args)
 
+    _refresh_synapse_object_summaries(set(new_mappings.values()), cursor)
+
     return dict(new_mappings)
 
 
-def _delete_unused_synapse_objects(cursor=None):
+def _refresh_synapse_object_summaries(synapse_object_ids, cursor=None):
     """
-    Delete any synapse objects not referred to by any synapse slice : synapse object mappings.
+    Recalculate the synapse object summaries of the given synapse objects from their synapse slices.
 
     Args:
+        synapse_object_ids(iterable): IDs of synapse objects whose slices have changed
+        cursor(django.db.connection.cursor):
+    """
+    synapse_object_ids = list(synapse_object_ids)
+    if not synapse_object_ids:
+        return
+
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        DELETE FROM synapse_object_summary sos
+          WHERE sos.synapse_object_id = ANY(%(ids)s::bigint[]);
+
+        INSERT INTO synapse_object_summary (
+          synapse_object_id, slice_count, size_px, xs_centroid, ys_centroid, zs_centroid,
+          xs_min, xs_max, ys_min, ys_max, zs_min, zs_max, uncertainty_avg
+        )
+        SELECT ss_so.synapse_object_id, count(*), sum(ss.size_px),
+            avg(ss.xs_centroid), avg(ss.ys_centroid), avg(tile.z_tile_idx),
+            min(ST_XMin(ss.geom_2d)), max(ST_XMax(ss.geom_2d)),
+            min(ST_YMin(ss.geom_2d)), max(ST_YMax(ss.geom_2d)),
+            min(tile.z_tile_idx), max(tile.z_tile_idx), avg(ss.uncertainty)
+          FROM synapse_slice_synapse_object ss_so
+          INNER JOIN synapse_slice ss
+            ON ss_so.synapse_slice_id = ss.id
+          INNER JOIN synapse_detection_tile tile
+            ON ss.synapse_detection_tile_id = tile.id
+          WHERE ss_so.synapse_object_id = ANY(%(ids)s::bigint[])
+          GROUP BY ss_so.synapse_object_id;
+    ''', {'ids': synapse_object_ids})
+
+
+def _delete_unused_synapse_objects(synapse_object_ids, cursor=None):
+    """
+    Delete those of the given synapse objects which are not referred to by any synapse slice : synapse object
+    mappings. Use sweep_unused_synapse_objects to check every synapse object.
+
+    Args:
+        synapse_object_ids(iterable): IDs of synapse objects which may have lost their synapse slices
         cursor(django.db.connection.cursor):
 
     Returns:
         list: IDs of deleted synapse objects
     """
+    synapse_object_ids = list(synapse_object_ids)
+    if not synapse_object_ids:
+        return []
+
     if cursor is None:
         cursor = connection.cursor()
 
     cursor.execute('''
-        DELETE FROM synapse_object so
-          WHERE NOT EXISTS (
-            SELECT * FROM synapse_slice_synapse_object ss_so
-              WHERE so.id = ss_so.synapse_object_id
-          )
-          RETURNING so.id;
-    ''')
+        WITH deleted AS (
+          DELETE FROM synapse_object so
+            WHERE so.id = ANY(%s::bigint[])
+              AND NOT EXISTS (
+                SELECT * FROM synapse_slice_synapse_object ss_so
+                  WHERE so.id = ss_so.synapse_object_id
+              )
+            RETURNING so.id
+        ), deleted_summaries AS (
+          DELETE FROM synapse_object_summary sos
+            USING deleted
+            WHERE sos.synapse_object_id = deleted.id
+        )
+        SELECT deleted.id FROM deleted;
+    ''', (synapse_object_ids,))
 
     return [item[0] for item in cursor.fetchall()]
 
 
+def sweep_unused_synapse_objects(batch_size=10000, start_id=0, cursor=None):
+    """
+    Delete every synapse object not referred to by any synapse slice : synapse object mappings, checking batches of
+    objects in ID order. Each batch is committed separately, so an interrupted sweep can be resumed from the last ID
+    reported.
+
+    Args:
+        batch_size(int): Number of synapse objects to check per batch
+        start_id(int): Only check synapse objects with a greater ID than this
+        cursor(django.db.connection.cursor):
+
+    Yields:
+        tuple: (greatest synapse object ID checked, list of deleted synapse object IDs) for each batch
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    last_id = start_id
+    while True:
+        with transaction.atomic():
+            cursor.execute('''
+                WITH batch AS (
+                  SELECT so.id FROM synapse_object so
+                    WHERE so.id > %s
+                    ORDER BY so.id
+                    LIMIT %s
+                ), deleted AS (
+                  DELETE FROM synapse_object so
+                    USING batch
+                    WHERE so.id = batch.id
+                      AND NOT EXISTS (
+                        SELECT * FROM synapse_slice_synapse_object ss_so
+                          WHERE so.id = ss_so.synapse_object_id
+                      )
+                    RETURNING so.id
+                ), deleted_summaries AS (
+                  DELETE FROM synapse_object_summary sos
+                    USING deleted
+                    WHERE sos.synapse_object_id = deleted.id
+                )
+                SELECT (SELECT max(batch.id) FROM batch), array(SELECT deleted.id FROM deleted ORDER BY deleted.id);
+            ''', (last_id, batch_size))
+            batch_last_id, deleted = cursor.fetchone()
+
+        if batch_last_id is None:
+            return
+
+        last_id = batch_last_id
+        yield last_id, deleted
+
+
 @api_view(['POST'])
 def agglomerate_synapse_slices(request, project_id=None):
     """
@@ -302,7 +1069,8 @@ def agglomerate_synapse_slices(request, project_id=None):
         type: array
         items:
           type: integer
-        description: array of synapse object IDs deleted due to lack of synapse slices mapping to them.
+        description: array of synapse object IDs deleted due to lack of synapse slices mapping to them. Only objects
+          previously mapped to the agglomerated synapse slices are checked.
     """
     synapse_slice_ids = get_request_list(request.POST, 'synapse_slices', tuple(), int)
 
@@ -310,10 +1078,171 @@ def agglomerate_synapse_slices(request, project_id=None):
 
     if synapse_slice_ids:
         adjacencies = _get_synapse_slice_adjacencies(synapse_slice_ids, cursor)
-        ext_adjacencies = _adjacencies_to_slice_clusters(adjacencies, cursor)
+        ext_adjacencies = _adjacencies_to_slice_clusters(synapse_slice_ids, adjacencies, cursor)
         new_mappings = _agglomerate_synapse_slices(ext_adjacencies, cursor)
+        # only objects which were already mapped to the agglomerated slices can have lost all of their slices
+        remapped_objects = set().union(*(possible_object_ids for _, possible_object_ids in ext_adjacencies))
     else:
         new_mappings = dict()
+        remapped_objects = set()
 
-    deleted_objects = _delete_unused_synapse_objects(cursor)
+    deleted_objects = _delete_unused_synapse_objects(remapped_objects, cursor)
     return JsonResponse({'slice_object_mappings': new_mappings, 'deleted_objects': deleted_objects})
+
+
+def _get_layer_synapse_slices(ssw_id, z_idx, cursor=None):
+    """
+    Get the IDs of all synapse slices in one z layer of tiles of a synapse suggestion workflow, and the synapse
+    objects they are currently mapped to, if any.
+
+    Returns:
+        tuple: (numpy.ndarray of synapse slice IDs, (N, 2) numpy.ndarray of synapse slice ID, synapse object ID)
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        SELECT ss.id, ss_so.synapse_object_id FROM synapse_detection_tile tile
+          INNER JOIN synapse_slice ss
+            ON ss.synapse_detection_tile_id = tile.id
+            AND ss.synapse_suggestion_workflow_id = tile.synapse_suggestion_workflow_id
+          LEFT OUTER JOIN synapse_slice_synapse_object ss_so
+            ON ss_so.synapse_slice_id = ss.id
+            AND ss_so.synapse_suggestion_workflow_id = ss.synapse_suggestion_workflow_id
+          WHERE tile.synapse_suggestion_workflow_id = %s
+            AND tile.z_tile_idx = %s;
+    ''', (ssw_id, z_idx))
+    rows = cursor.fetchall()
+
+    slice_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    mapped = np.array([row for row in rows if row[1] is not None], dtype=np.int64).reshape(-1, 2)
+    return slice_ids, mapped
+
+
+def _get_layer_synapse_slice_adjacencies(ssw_id, z_idx, cursor=None):
+    """
+    Get adjacencies between the synapse slices in one z layer of tiles and all synapse slices in the same or the
+    previous layer.
+
+    Returns:
+        numpy.ndarray: (N, 2) array of spatially adjacent synapse slice ID pairs
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        SELECT this_slice.id, that_slice.id FROM synapse_detection_tile this_tile
+          INNER JOIN synapse_slice this_slice
+            ON this_slice.synapse_detection_tile_id = this_tile.id
+            AND this_slice.synapse_suggestion_workflow_id = this_tile.synapse_suggestion_workflow_id
+          CROSS JOIN ({}) AS offsets (dz, dy, dx)
+          INNER JOIN synapse_detection_tile that_tile
+            ON that_tile.synapse_suggestion_workflow_id = this_tile.synapse_suggestion_workflow_id
+            AND that_tile.z_tile_idx = this_tile.z_tile_idx + offsets.dz
+            AND that_tile.y_tile_idx = this_tile.y_tile_idx + offsets.dy
+            AND that_tile.x_tile_idx = this_tile.x_tile_idx + offsets.dx
+          INNER JOIN synapse_slice that_slice
+            ON that_slice.synapse_detection_tile_id = that_tile.id
+            AND that_slice.synapse_suggestion_workflow_id = that_tile.synapse_suggestion_workflow_id
+            AND ST_DWithin(this_slice.geom_2d, that_slice.geom_2d, 1.1)
+            AND this_slice.id != that_slice.id
+          WHERE this_tile.synapse_suggestion_workflow_id = %s
+            AND this_tile.z_tile_idx = %s;
+    '''.format(TILE_LOWER_NEIGHBOUR_OFFSETS), (ssw_id, z_idx))
+    return np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+
+
+def _merge_synapse_objects(slice_clusters, cursor=None):
+    """
+    Remap every synapse slice belonging to a synapse object which is being merged into another, including those not
+    in the given clusters, and delete the merged objects.
+
+    Args:
+        slice_clusters(list): as passed to _agglomerate_synapse_slices
+
+    Returns:
+        dict: Mapping from merged synapse object ID to the synapse object ID it was merged into
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    merges = dict()
+    for _, possible_object_ids in slice_clusters:
+        if len(possible_object_ids) > 1:
+            min_id = min(possible_object_ids)
+            merges.update((obj_id, min_id) for obj_id in possible_object_ids if obj_id != min_id)
+
+    if merges:
+        old_ids, new_ids = zip(*merges.items())
+        cursor.execute('''
+            UPDATE synapse_slice_synapse_object ss_so
+              SET synapse_object_id = merges.new_id
+              FROM unnest(%s::bigint[], %s::bigint[]) AS merges (old_id, new_id)
+              WHERE ss_so.synapse_object_id = merges.old_id;
+        ''', (list(old_ids), list(new_ids)))
+        cursor.execute('''
+            DELETE FROM synapse_object_summary sos
+              WHERE sos.synapse_object_id = ANY(%(ids)s::bigint[]);
+            DELETE FROM synapse_object so
+              WHERE so.id = ANY(%(ids)s::bigint[]);
+        ''', {'ids': list(old_ids)})
+
+    return merges
+
+
+def agglomerate_synapse_slices_by_layer(ssw_id, z_start=None, z_stop=None, cursor=None):
+    """
+    Agglomerate all synapse slices of a synapse suggestion workflow into synapse objects, one z layer of tiles at a
+    time in ascending order. Only the previous layer's slice:object mappings are held between layers, and each layer
+    is committed in its own transaction, so an interrupted run can be resumed from the layer it stopped at.
+
+    Args:
+        ssw_id(int): Synapse suggestion workflow ID
+        z_start(int, optional): First z tile index to process (inclusive). Default all
+        z_stop(int, optional): Last z tile index to process (exclusive). Default all
+        cursor(django.db.connection.cursor):
+
+    Yields:
+        dict: Progress after each layer, with keys 'z_idx', 'slices', 'new_objects' and 'merged_objects'
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        SELECT DISTINCT tile.z_tile_idx FROM synapse_detection_tile tile
+          WHERE tile.synapse_suggestion_workflow_id = %(ssw_id)s
+            AND (%(z_start)s IS NULL OR tile.z_tile_idx >= %(z_start)s)
+            AND (%(z_stop)s IS NULL OR tile.z_tile_idx < %(z_stop)s)
+          ORDER BY tile.z_tile_idx;
+    ''', {'ssw_id': ssw_id, 'z_start': z_start, 'z_stop': z_stop})
+    z_idxs = [row[0] for row in cursor.fetchall()]
+
+    previous_z = None
+    boundary = np.empty((0, 2), dtype=np.int64)
+    for z_idx in z_idxs:
+        if previous_z != z_idx - 1:
+            # starting, resuming or after a gap: the previous layer's mappings are whatever is in the database
+            boundary = _get_layer_synapse_slices(ssw_id, z_idx - 1, cursor)[1]
+
+        with transaction.atomic():
+            slice_ids, mapped = _get_layer_synapse_slices(ssw_id, z_idx, cursor)
+            if len(slice_ids):
+                adjacencies = _get_layer_synapse_slice_adjacencies(ssw_id, z_idx, cursor)
+                slice_clusters = cluster_slices(slice_ids, adjacencies, np.concatenate([boundary, mapped]))
+                merges = _merge_synapse_objects(slice_clusters, cursor)
+                new_mappings = _agglomerate_synapse_slices(slice_clusters, cursor)
+            else:
+                slice_clusters, merges, new_mappings = [], dict(), dict()
+
+        layer_ids = set(slice_ids.tolist())
+        boundary = np.array(
+            [(slice_id, obj_id) for slice_id, obj_id in new_mappings.items() if slice_id in layer_ids], dtype=np.int64
+        ).reshape(-1, 2)
+        previous_z = z_idx
+
+        yield {
+            'z_idx': z_idx,
+            'slices': len(slice_ids),
+            'new_objects': sum(1 for _, possible_object_ids in slice_clusters if not possible_object_ids),
+            'merged_objects': len(merges),
+        }
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Distribution of synapse detection work over many workers.
+
+Tiles to be processed are queued as synapse detection tile tasks. Workers claim batches of them with
+SELECT ... FOR UPDATE SKIP LOCKED, so concurrent claims never block on or return the same tasks. A claim is a lease
+which expires after a given time, after which the task can be claimed again by another worker.
+"""
+from django.db import connection
+from django.http import JsonResponse
+from rest_framework.decorators import api_view
+
+# from catmaid.control.authentication import requires_user_role
+from catmaid.control.common import get_request_list
+
+
+@api_view(['POST'])
+def populate_tile_tasks(request, project_id=None):
+    """
+    POST request which queues a task for every tile in the given range of the workflow's tiling grid. Tiles which
+    already have a task are ignored.
+
+    POST parameters:
+    workflow_id
+    x_min, y_min, z_min: inclusive lower bounds of tile indices (default 0)
+    x_max, y_max, z_max: exclusive upper bounds of tile indices (default the extent of the stack)
+    skip_detected: if 'true', do not queue tiles which have already been detected by this workflow (default true)
+
+    Returns an object with the number of tasks queued.
+    """
+    params = {'ssw_id': int(request.POST['workflow_id'])}
+    for dim in 'xyz':
+        params[dim + '_min'] = int(request.POST.get(dim + '_min', 0))
+        dim_max = request.POST.get(dim + '_max')
+        params[dim + '_max'] = int(dim_max) if dim_max is not None else None
+    params['skip_detected'] = request.POST.get('skip_detected', 'true').lower() == 'true'
+
+    cursor = connection.cursor()
+    cursor.execute('''
+        INSERT INTO synapse_detection_tile_task (synapse_suggestion_workflow_id, x_tile_idx, y_tile_idx, z_tile_idx)
+          SELECT ssw.id, xs.idx, ys.idx, zs.idx
+            FROM synapse_suggestion_workflow ssw
+            INNER JOIN synapse_detection_tiling tiling
+              ON tiling.id = ssw.synapse_detection_tiling_id
+            INNER JOIN stack
+              ON stack.id = tiling.stack_id
+            CROSS JOIN LATERAL generate_series(
+              %(z_min)s, coalesce(%(z_max)s, (stack.dimension).z) - 1
+            ) AS zs (idx)
+            CROSS JOIN LATERAL generate_series(
+              %(y_min)s, coalesce(%(y_max)s, ceil((stack.dimension).y::float / tiling.tile_height_px)::int) - 1
+            ) AS ys (idx)
+            CROSS JOIN LATERAL generate_series(
+              %(x_min)s, coalesce(%(x_max)s, ceil((stack.dimension).x::float / tiling.tile_width_px)::int) - 1
+            ) AS xs (idx)
+            WHERE ssw.id = %(ssw_id)s
+              AND NOT (%(skip_detected)s AND EXISTS (
+                SELECT * FROM synapse_detection_tile tile
+                  WHERE tile.synapse_suggestion_workflow_id = ssw.id
+                    AND tile.z_tile_idx = zs.idx
+                    AND tile.y_tile_idx = ys.idx
+                    AND tile.x_tile_idx = xs.idx
+              ))
+          ORDER BY zs.idx, ys.idx, xs.idx
+          ON CONFLICT (synapse_suggestion_workflow_id, x_tile_idx, y_tile_idx, z_tile_idx) DO NOTHING;
+    ''', params)
+
+    return JsonResponse({'count': cursor.rowcount})
+
+
+@api_view(['POST'])
+def claim_tile_tasks(request, project_id=None):
+    """
+    POST request which leases up to the given number of incomplete tile tasks to a worker, in z, y, x order. Tasks
+    whose lease has expired are claimable again.
+
+    POST parameters:
+    workflow_id
+    worker: string identifying the worker
+    count: maximum number of tasks to claim (default 1)
+    lease_seconds: length of the lease (default 600)
+    max_attempts: if given, tasks which have already been claimed this many times are not claimed again
+
+    Returns 'columns' and 'data' of the claimed tasks: ID, tile indices, attempt number and lease expiry time.
+    """
+    params = {
+        'ssw_id': int(request.POST['workflow_id']),
+        'worker': request.POST['worker'],
+        'count': int(request.POST.get('count', 1)),
+        'lease_seconds': float(request.POST.get('lease_seconds', 600)),
+        'max_attempts': int(request.POST['max_attempts']) if 'max_attempts' in request.POST else None,
+    }
+
+    cursor = connection.cursor()
+    cursor.execute('''
+        WITH claimable AS (
+          SELECT task.id FROM synapse_detection_tile_task task
+            WHERE task.synapse_suggestion_workflow_id = %(ssw_id)s
+              AND task.completed IS NULL
+              AND (task.lease_expires IS NULL OR task.lease_expires < clock_timestamp())
+              AND (%(max_attempts)s::int IS NULL OR task.attempts < %(max_attempts)s)
+            ORDER BY task.z_tile_idx, task.y_tile_idx, task.x_tile_idx
+            LIMIT %(count)s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE synapse_detection_tile_task task
+          SET worker = %(worker)s,
+            lease_expires = clock_timestamp() + %(lease_seconds)s * interval '1 second',
+            attempts = task.attempts + 1
+          FROM claimable
+          WHERE task.id = claimable.id
+          RETURNING task.id, task.x_tile_idx, task.y_tile_idx, task.z_tile_idx, task.attempts, task.lease_expires;
+    ''', params)
+
+    return JsonResponse({
+        'columns': ['task_id', 'x_idx', 'y_idx', 'z_idx', 'attempt', 'lease_expires'],
+        'data': sorted(cursor.fetchall(), key=lambda row: (row[3], row[2], row[1]))
+    })
+
+
+@api_view(['POST'])
+def complete_tile_tasks(request, project_id=None):
+    """
+    POST request which marks tile tasks as completed. Only tasks currently leased to the given worker are completed,
+    so a worker whose lease expired and was claimed by another worker cannot complete it.
+
+    POST parameters:
+    workflow_id
+    worker: string identifying the worker
+    tasks: list of task IDs
+
+    Returns a list of the IDs of the tasks which were completed.
+    """
+    ssw_id = int(request.POST['workflow_id'])
+    worker = request.POST['worker']
+    task_ids = get_request_list(request.POST, 'tasks', tuple(), int)
+
+    cursor = connection.cursor()
+    cursor.execute('''
+        UPDATE synapse_detection_tile_task task
+          SET completed = clock_timestamp(), lease_expires = NULL
+          WHERE task.id = ANY(%s::int[])
+            AND task.synapse_suggestion_workflow_id = %s
+            AND task.worker = %s
+            AND task.completed IS NULL
+          RETURNING task.id;
+    ''', (list(task_ids), ssw_id, worker))
+
+    return JsonResponse(sorted(row[0] for row in cursor.fetchall()), safe=False)
+
+
+@api_view(['GET'])
+def get_tile_task_status(request, project_id=None):
+    """
+    GET request which counts the workflow's tile tasks by state.
+
+    GET parameters:
+    workflow_id
+
+    Returns an object with the number of 'pending', 'leased' and 'completed' tasks.
+    """
+    ssw_id = int(request.GET['workflow_id'])
+
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT
+          count(*) FILTER (
+            WHERE task.completed IS NULL AND (task.lease_expires IS NULL OR task.lease_expires < clock_timestamp())
+          ),
+          count(*) FILTER (WHERE task.completed IS NULL AND task.lease_expires >= clock_timestamp()),
+          count(*) FILTER (WHERE task.completed IS NOT NULL)
+        FROM synapse_detection_tile_task task
+          WHERE task.synapse_suggestion_workflow_id = %s;
+    ''', (ssw_id,))
+    pending, leased, completed = cursor.fetchone()
+
+    return JsonResponse({'pending': pending, 'leased': leased, 'completed': completed})
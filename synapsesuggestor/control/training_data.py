@@ -5,38 +5,230 @@ import sys
 from django.db import connection
 from django.http import JsonResponse
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 
 from catmaid.control.common import get_request_list
 from catmaid.models import Relation
 
+from synapsesuggestor.control.cache import get_cache
+from synapsesuggestor.control.common import iter_query, streaming_json_response
+
+
+relation_cache = get_cache('relation')
+
+# TABLESAMPLE is asked for this many times the requested number of rows, to allow for rows from other projects and
+# for variance in the number of rows per page
+TABLESAMPLE_OVERSAMPLE = 3
+TABLESAMPLE_ATTEMPTS = 4
+
+SAMPLE_METHODS = ('tablesample', 'reservoir')
+
 
 def sample_treenodes(request, project_id):
     """
     Return a list of treenode IDs and their locations randomly sampled from the entire project.
+
+    The sampling method and rate are chosen from the table's statistics, which change when it is analyzed. To get the
+    same sample again, pass the seed, method and percent from the response; these give the same sample while the
+    treenode table is unchanged. See sample_treenode_rows.
+
+    GET parameters:
+    seed: integer (default random)
+    count: maximum number of treenodes to return (default 50)
+    method: 'tablesample' or 'reservoir' (default chosen automatically)
+    percent: TABLESAMPLE rate to start from (default estimated from the table's statistics)
+
+    Returns an object with the 'seed', the 'method' and 'percent' (TABLESAMPLE rate, or null) used to sample, and
+    'columns' and 'data'.
     """
-    # todo: test
     seed = int(request.GET.get('seed', random.randint(0, sys.maxsize)))
     count = int(request.GET.get('count', 50))
+    method = request.GET.get('method')
+    percent = float(request.GET['percent']) if 'percent' in request.GET else None
 
-    cursor = connection.cursor()
-    cursor.execute('''
-        SELECT id, location_x, location_y, location_z FROM treenode WHERE project_id = %s;
-    ''', (project_id))
-    rows = cursor.fetchall()
-
-    sampler = random.Random(seed)
-    sample = sampler.sample(rows, min(count, len(rows)))
+    rows, method, percent = sample_treenode_rows(project_id, count, seed, method, percent=percent)
 
     return JsonResponse({
         'seed': seed,
+        'method': method,
+        'percent': percent,
         'columns': ['treenode_id', 'xp', 'yp', 'zp'],
-        'data': sample
+        'data': rows
+    })
+
+
+def sample_treenode_rows(project_id, count, seed, method=None, cursor=None, percent=None):
+    """
+    Sample treenodes from a project without reading the whole project.
+
+    Pages of the treenode table are sampled with TABLESAMPLE SYSTEM ... REPEATABLE, seeded with the given seed, at a
+    rate estimated from the table's statistics to give several times the requested number of the project's treenodes;
+    the rate is increased if too few are found. The final sample is drawn from these candidates with a seeded
+    random.Random, so the work done scales with the count rather than the size of the table.
+
+    If the table has no statistics, or the project is too small a part of the table for page sampling to find enough
+    of its treenodes, the project's treenodes are instead streamed through a seeded reservoir sampler, which only
+    holds the sample in memory.
+
+    The statistics are updated whenever the table is analyzed, which can change the method and rate, and so the
+    sample, for the same seed. Passing the method and rate returned by a previous call gives the same sample as that
+    call while the treenode table is unchanged.
+
+    Note that page sampling is not uniform over treenodes: treenodes stored in the same page are sampled together.
+
+    Args:
+        project_id(int):
+        count(int): Number of treenodes to sample; fewer are returned if the project has fewer
+        seed(int):
+        method(str, optional): Force 'tablesample' or 'reservoir' sampling. Default choose automatically
+        cursor(django.db.connection.cursor, optional):
+        percent(float, optional): TABLESAMPLE rate to start from, in percent. Default estimate from the table's
+            statistics
+
+    Returns:
+        tuple: (list of (treenode ID, x, y, z) rows, method used, TABLESAMPLE rate of the sample or None)
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    if method is not None and method not in SAMPLE_METHODS:
+        raise ValueError('Sample method must be one of {}, got {}'.format(', '.join(SAMPLE_METHODS), method))
+
+    if count <= 0:
+        return [], method or 'tablesample', None
+
+    if method != 'reservoir':
+        if percent is None:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = 'treenode'::regclass;")
+            estimated_rows = cursor.fetchone()[0]
+            if estimated_rows > 0:
+                percent = 100 * TABLESAMPLE_OVERSAMPLE * count / estimated_rows
+            elif method == 'tablesample':
+                percent = 100
+
+        if percent is not None:
+            percent = min(float(percent), 100)
+            for attempt in range(TABLESAMPLE_ATTEMPTS):
+                if method == 'tablesample' and attempt == TABLESAMPLE_ATTEMPTS - 1:
+                    percent = 100
+                if percent >= 100:
+                    if method is None:
+                        # sampling every page is a scan of the whole table; only the project's rows need scanning
+                        break
+                    percent = 100
+
+                candidates = _tablesample_treenodes(project_id, percent, seed, cursor)
+                if len(candidates) >= count or percent == 100:
+                    candidates.sort()
+                    sample = random.Random(seed).sample(candidates, min(count, len(candidates)))
+                    return sample, 'tablesample', percent
+
+                # scale the rate by the shortfall, at least doubling it
+                percent *= max(2, TABLESAMPLE_OVERSAMPLE * count / max(len(candidates), 1))
+
+    rows = iter_query('''
+        SELECT id, location_x, location_y, location_z FROM treenode WHERE project_id = %s ORDER BY id;
+    ''', (project_id,))
+
+    return reservoir_sample(rows, count, random.Random(seed)), 'reservoir', None
+
+
+def _tablesample_treenodes(project_id, percent, seed, cursor):
+    cursor.execute('''
+        SELECT id, location_x, location_y, location_z
+          FROM treenode TABLESAMPLE SYSTEM (%s) REPEATABLE (%s)
+          WHERE project_id = %s;
+    ''', (percent, seed, project_id))
+    return cursor.fetchall()
+
+
+def reservoir_sample(iterable, count, rng=random):
+    """
+    Uniformly sample up to count items from an iterable of unknown length in a single pass (Algorithm R), holding only
+    the sample in memory.
+
+    Args:
+        iterable(iterable):
+        count(int):
+        rng(random.Random, optional): Source of randomness. Default the random module
+
+    Returns:
+        list
+    """
+    sample = []
+    for idx, item in enumerate(iterable):
+        if idx < count:
+            sample.append(item)
+        else:
+            replace_idx = rng.randint(0, idx)
+            if replace_idx < count:
+                sample[replace_idx] = item
+    return sample
+
+
+def sample_treenodes_stratified(workflow, per_stratum=1, seed=0, cursor=None):
+    """
+    Sample treenodes evenly over the workflow's stack: up to per_stratum treenodes from each z section and tile of the
+    workflow's tiling grid. Treenodes outside of the stack are ignored.
+
+    Within each stratum, treenodes are ranked by a hash of the seed and their ID, so the same seed gives the same
+    sample while the treenodes are unchanged.
+
+    Args:
+        workflow(synapsesuggestor.control.common.WorkflowContext):
+        per_stratum(int): Maximum number of treenodes per z section and tile
+        seed(int):
+        cursor(django.db.connection.cursor, optional):
+
+    Returns:
+        list: (treenode ID, skeleton ID, x, y, z) rows, with the pixel coordinates in stack space, ordered by stratum
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    cursor.execute('''
+        SELECT ranked.treenode_id, ranked.skeleton_id, ranked.xs, ranked.ys, ranked.zs
+          FROM (
+            SELECT tn.id AS treenode_id, tn.skeleton_id, stack_coords.xs, stack_coords.ys, stack_coords.zs,
+              row_number() OVER (
+                PARTITION BY stack_coords.zs, stack_coords.ys / %(tile_height)s, stack_coords.xs / %(tile_width)s
+                ORDER BY md5(%(seed)s || ':' || tn.id)
+              ) AS stratum_rank
+              FROM treenode tn
+              CROSS JOIN LATERAL (
+                SELECT floor((tn.location_x - %(tx)s) / %(rx)s)::int AS xs,
+                  floor((tn.location_y - %(ty)s) / %(ry)s)::int AS ys,
+                  round((tn.location_z - %(tz)s) / %(rz)s)::int AS zs
+              ) stack_coords
+              INNER JOIN stack
+                ON stack.id = %(stack_id)s
+              WHERE tn.project_id = %(project_id)s
+                AND stack_coords.xs BETWEEN 0 AND (stack.dimension).x - 1
+                AND stack_coords.ys BETWEEN 0 AND (stack.dimension).y - 1
+                AND stack_coords.zs BETWEEN 0 AND (stack.dimension).z - 1
+          ) ranked
+          WHERE ranked.stratum_rank <= %(per_stratum)s
+          ORDER BY ranked.zs, ranked.ys / %(tile_height)s, ranked.xs / %(tile_width)s, ranked.stratum_rank;
+    ''', {
+        'project_id': workflow.project_id,
+        'stack_id': workflow.stack_id,
+        'tile_width': workflow.tile_width_px,
+        'tile_height': workflow.tile_height_px,
+        'tx': workflow.translation[0], 'ty': workflow.translation[1], 'tz': workflow.translation[2],
+        'rx': workflow.resolution[0], 'ry': workflow.resolution[1], 'rz': workflow.resolution[2],
+        'seed': str(seed),
+        'per_stratum': per_stratum,
     })
 
+    return cursor.fetchall()
+
 
 @api_view(['GET'])
 def treenodes_by_label(request, project_id=None):
-    """Return all treenodes in the project associated with the given tags.
+    """Return treenodes in the project associated with the given tags, ordered by tag name and treenode ID.
+
+    Without a limit, all matching treenodes are streamed. With a limit, one page is returned along with 'next', the
+    keyset parameters (after_tag and after_treenode_id) of the following page, or null if this is the last page.
     ---
     parameters:
         - name: tags
@@ -46,27 +238,91 @@ def treenodes_by_label(request, project_id=None):
           items:
             type: str
           paramType: form
+        - name: limit
+          description: maximum number of treenodes to return, at least 1
+          required: false
+          type: integer
+          paramType: form
+        - name: after_tag
+          description: only return treenodes after this tag name and after_treenode_id
+          required: false
+          type: string
+          paramType: form
+        - name: after_treenode_id
+          description: only return treenodes after this treenode ID within after_tag
+          required: false
+          type: integer
+          paramType: form
     """
-    # todo: test
     labels = get_request_list(request.GET, 'tags', tuple())
+    limit = int(request.GET['limit']) if 'limit' in request.GET else None
+    if limit is not None and limit < 1:
+        raise ValidationError({'limit': 'Must be at least 1, got {}'.format(limit)})
+    after_tag = request.GET.get('after_tag')
+    after_treenode_id = int(request.GET.get('after_treenode_id', -1))
     columns = ['tag_name', 'treenode_id', 'xp', 'yp', 'zp']
 
     if not labels:
         return JsonResponse({'columns': columns, 'data': []})
 
-    labeled_as_relation = Relation.objects.get(project=project_id, relation_name='labeled_as')
+    query, params = _treenodes_by_label_query(project_id, labels, after_tag, after_treenode_id, limit)
+
+    if limit is None:
+        return streaming_json_response(iter_query(query, params), columns)
 
     cursor = connection.cursor()
-    cursor.execute("""
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+
+    next_page = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_page = {'after_tag': rows[-1][0], 'after_treenode_id': rows[-1][1]}
+
+    return JsonResponse({'columns': columns, 'data': rows, 'next': next_page})
+
+
+def get_labeled_as_relation_id(project_id):
+    """
+    Get the ID of the project's 'labeled_as' relation. Results are cached (see synapsesuggestor.control.cache).
+
+    Raises:
+        Relation.DoesNotExist
+    """
+    return relation_cache.get_or_set(
+        (int(project_id), 'labeled_as'),
+        lambda: Relation.objects.values_list('id', flat=True).get(project=project_id, relation_name='labeled_as')
+    )
+
+
+def _treenodes_by_label_query(project_id, labels, after_tag=None, after_treenode_id=-1, limit=None):
+    """
+    Build the keyset-paginated query for treenodes_by_label. One more row than the limit is selected, to find whether
+    there is a following page.
+
+    Returns:
+        tuple: (query, params)
+    """
+    query = """
         SELECT ci.name, t.id, t.location_x, t.location_y, t.location_z
           FROM class_instance ci
           JOIN treenode_class_instance tci
             ON tci.class_instance_id = ci.id
           JOIN treenode t
             ON tci.treenode_id = t.id
-          WHERE ci.project_id = %s
-            AND tci.relation_id = %s
-            AND ci.name = ANY(%s);
-    """, (project_id, labeled_as_relation.id, labels))
-
-    return JsonResponse({'columns': columns, 'data': cursor.fetchall()})
+          WHERE ci.project_id = %(project_id)s
+            AND tci.relation_id = %(relation_id)s
+            AND ci.name = ANY(%(labels)s)
+            AND (%(after_tag)s::text IS NULL OR (ci.name, t.id) > (%(after_tag)s::text, %(after_treenode_id)s))
+          ORDER BY ci.name, t.id
+          LIMIT %(limit)s;
+    """
+    params = {
+        'project_id': project_id,
+        'relation_id': get_labeled_as_relation_id(project_id),
+        'labels': list(labels),
+        'after_tag': after_tag,
+        'after_treenode_id': after_treenode_id,
+        'limit': None if limit is None else limit + 1,
+    }
+    return query, params
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Export of training data as chunked arrays which training jobs can memory-map without touching the database.
+
+Treenodes are sampled evenly over the z sections and tiles of a workflow's tiling grid (see
+synapsesuggestor.control.training_data.sample_treenodes_stratified). Around each one, the workflow's synapse slices in
+the treenode's section are rasterized into a square label patch in stack space.
+
+The output directory contains:
+
+manifest.json: export parameters, and the file names and lengths of the chunks
+treenodes.npy: structured array with the treenode_id, skeleton_id and the x, y, z stack coordinates of every sampled
+    treenode, in patch order
+labels_NNNNN.npy: int64 array of shape (n, patch_size, patch_size) for each chunk of n treenodes, holding the synapse
+    object ID of each pixel (0 being background). Patches are centred on their treenode, in [y, x] order
+associated_NNNNN.npy: uint8 array of the same shape, 1 where the pixel belongs to a synapse slice associated with the
+    patch's treenode through the project workflow
+
+Arrays are written with numpy.lib.format.open_memmap, so they can be read with numpy.load(path, mmap_mode='r').
+"""
+import json
+import os
+
+import numpy as np
+
+from django.db import connection
+
+from synapsesuggestor.control.common import resolve_workflow
+from synapsesuggestor.control.raster import rasterize_polygon
+from synapsesuggestor.control.training_data import sample_treenodes_stratified
+
+
+TREENODE_DTYPE = np.dtype([
+    ('treenode_id', '<i8'), ('skeleton_id', '<i8'), ('x', '<i4'), ('y', '<i4'), ('z', '<i4')
+])
+
+MANIFEST_VERSION = 1
+
+
+def export_training_patches(project_id, ssw_id, output_dir, per_stratum=1, patch_size=64, chunk_size=1024, seed=0,
+                            cursor=None):
+    """
+    Sample treenodes and write their label patches to output_dir, one chunk at a time.
+
+    Args:
+        project_id(int):
+        ssw_id(int): Synapse suggestion workflow ID
+        output_dir(str): Directory to write to; created if it does not exist
+        per_stratum(int): Maximum number of treenodes per z section and tile
+        patch_size(int): Width and height of patches, in pixels
+        chunk_size(int): Maximum number of patches per chunk file
+        seed(int): Seed for treenode sampling
+        cursor(django.db.connection.cursor, optional):
+
+    Returns:
+        generator: dicts of progress information ('chunk', 'patches', 'slices') after each chunk is written
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    workflow = resolve_workflow(project_id, ssw_id=ssw_id, cursor=cursor)
+    treenodes = np.array(
+        [tuple(row) for row in sample_treenodes_stratified(workflow, per_stratum, seed, cursor)], dtype=TREENODE_DTYPE
+    )
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    _write_array(os.path.join(output_dir, 'treenodes.npy'), treenodes)
+
+    chunks = []
+    for chunk_idx, start in enumerate(range(0, len(treenodes), chunk_size)):
+        chunk = treenodes[start:start + chunk_size]
+        origins = np.column_stack([chunk['x'] - patch_size // 2, chunk['y'] - patch_size // 2])
+
+        labels = np.lib.format.open_memmap(
+            os.path.join(output_dir, 'labels_{:05d}.npy'.format(chunk_idx)), mode='w+', dtype='<i8',
+            shape=(len(chunk), patch_size, patch_size)
+        )
+        associated = np.lib.format.open_memmap(
+            os.path.join(output_dir, 'associated_{:05d}.npy'.format(chunk_idx)), mode='w+', dtype='u1',
+            shape=(len(chunk), patch_size, patch_size)
+        )
+
+        slice_count = 0
+        for patch_idx, object_id, is_associated, geojson in _get_patch_slices(
+            workflow, chunk, origins, patch_size, cursor
+        ):
+            mask = rasterize_polygon(
+                json.loads(geojson)['coordinates'], origins[patch_idx], (patch_size, patch_size)
+            )
+            labels[patch_idx][mask] = object_id
+            if is_associated:
+                associated[patch_idx][mask] = 1
+            slice_count += 1
+
+        labels.flush()
+        associated.flush()
+        del labels, associated
+
+        chunks.append({
+            'labels': 'labels_{:05d}.npy'.format(chunk_idx),
+            'associated': 'associated_{:05d}.npy'.format(chunk_idx),
+            'start': start,
+            'count': len(chunk),
+        })
+        yield {'chunk': chunk_idx, 'patches': len(chunk), 'slices': slice_count}
+
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump({
+            'version': MANIFEST_VERSION,
+            'project_id': workflow.project_id,
+            'project_workflow_id': workflow.pssw_id,
+            'workflow_id': workflow.ssw_id,
+            'stack_id': workflow.stack_id,
+            'seed': seed,
+            'per_stratum': per_stratum,
+            'patch_size': patch_size,
+            'chunk_size': chunk_size,
+            'count': len(treenodes),
+            'treenodes': 'treenodes.npy',
+            'chunks': chunks,
+        }, f, indent=2)
+
+
+def _write_array(path, array):
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=array.shape)
+    out[...] = array
+    out.flush()
+
+
+def _get_patch_slices(workflow, treenodes, origins, patch_size, cursor):
+    """
+    Get the synapse slices overlapping each patch, in the patch's section.
+
+    Returns:
+        list: (patch index, synapse object ID, whether associated with the patch's treenode, GeoJSON geometry) rows,
+            ordered so that later slices are drawn over earlier ones consistently
+    """
+    if not len(treenodes):
+        return []
+
+    cursor.execute('''
+        SELECT patch.idx - 1, ss_so.synapse_object_id,
+          EXISTS (
+            SELECT * FROM synapse_slice_treenode sstn
+              WHERE sstn.synapse_slice_id = ss.id
+                AND sstn.treenode_id = patch.treenode_id
+                AND sstn.project_synapse_suggestion_workflow_id = %(pssw_id)s
+          ),
+          ST_AsGeoJSON(ss.geom_2d)
+          FROM unnest(%(treenode_ids)s::bigint[], %(x0s)s::int[], %(y0s)s::int[], %(zs)s::int[])
+            WITH ORDINALITY AS patch (treenode_id, x0, y0, z, idx)
+          INNER JOIN synapse_detection_tile tile
+            ON tile.synapse_suggestion_workflow_id = %(ssw_id)s
+            AND tile.z_tile_idx = patch.z
+            AND tile.y_tile_idx BETWEEN floor(patch.y0::float / %(tile_height)s)
+              AND floor((patch.y0 + %(size)s - 1)::float / %(tile_height)s)
+            AND tile.x_tile_idx BETWEEN floor(patch.x0::float / %(tile_width)s)
+              AND floor((patch.x0 + %(size)s - 1)::float / %(tile_width)s)
+          INNER JOIN synapse_slice ss
+            ON ss.synapse_detection_tile_id = tile.id
+            AND ss.synapse_suggestion_workflow_id = %(ssw_id)s
+            AND ss.geom_2d && ST_MakeEnvelope(patch.x0, patch.y0, patch.x0 + %(size)s, patch.y0 + %(size)s)
+          INNER JOIN synapse_slice_synapse_object ss_so
+            ON ss_so.synapse_slice_id = ss.id
+            AND ss_so.synapse_suggestion_workflow_id = %(ssw_id)s
+          ORDER BY patch.idx, ss.id;
+    ''', {
+        'treenode_ids': treenodes['treenode_id'].tolist(),
+        'x0s': origins[:, 0].tolist(),
+        'y0s': origins[:, 1].tolist(),
+        'zs': treenodes['z'].tolist(),
+        'pssw_id': workflow.pssw_id,
+        'ssw_id': workflow.ssw_id,
+        'tile_width': workflow.tile_width_px,
+        'tile_height': workflow.tile_height_px,
+        'size': patch_size,
+    })
+
+    return cursor.fetchall()
@@ -5,15 +5,14 @@ Methods used by the skeleton-node association code
 import json
 import logging
 
-from django.db import connection
+from django.db import connection, transaction
 from django.http import JsonResponse
 from rest_framework.decorators import api_view
 
 # from catmaid.control.authentication import requires_user_role
 from catmaid.control.common import get_request_list
-from synapsesuggestor.models import ProjectSynapseSuggestionWorkflow
 from synapsesuggestor.control.common import (
-    list_into_query, get_most_recent_project_SS_workflow, get_translation_resolution,  # get_project_SS_workflow
+    copy_rows, get_request_pssw_id, resolve_workflow,  # get_project_SS_workflow
 )
 
 
@@ -44,28 +43,194 @@ def add_treenode_synapse_associations(request, project_id=None):
     # todo: should take SSW and figure out PSSW itself
     # todo: add return type
 
-    pssw_id = int(request.POST.get(
-        'project_workflow_id', get_most_recent_project_SS_workflow(project_id).id
-    ))
+    pssw_id = get_request_pssw_id(request.POST, project_id)
     associations = get_request_list(request.POST, 'associations', tuple(), json.loads)
 
     if not associations:
         return JsonResponse([], safe=False)
 
-    rows = [(syn, treenode, contact_px, pssw_id) for syn, treenode, contact_px in associations]
+    synapse_slice_ids, treenode_ids, contact_pxs = zip(*associations)
+    new_ids = insert_treenode_associations(pssw_id, synapse_slice_ids, treenode_ids, contact_pxs, return_ids=True)
 
-    query, cursor_args = list_into_query('''
+    return JsonResponse([[new_id] for new_id in new_ids], safe=False)
+
+
+@api_view(['POST'])
+def add_treenode_synapse_associations_bulk(request, project_id=None):
+    """
+    POST request which adds a large set of treenode-synapse associations to the database, given as columns.
+    ---
+    parameters:
+      - name: project_workflow_id
+        type: integer
+        required: false
+        description: ID of project synapse suggestion workflow
+      - name: synapse_slice_ids
+        type: string
+        required: true
+        description: JSON-encoded array of synapse slice IDs
+      - name: treenode_ids
+        type: string
+        required: true
+        description: JSON-encoded array of treenode IDs, the same length as synapse_slice_ids
+      - name: contact_px
+        type: string
+        required: true
+        description: JSON-encoded array of contact area estimations, the same length as synapse_slice_ids
+      - name: method
+        type: string
+        enum: [unnest, copy]
+        required: false
+        description: Insert the columns as arrays with unnest (default), or stream rows with COPY
+      - name: return_ids
+        type: boolean
+        required: false
+        description: Whether to return the IDs of the new associations, in input order (default false)
+    type:
+      count:
+        type: integer
+        required: true
+      ids:
+        type: array
+        items:
+          type: integer
+        required: false
+    """
+    pssw_id = get_request_pssw_id(request.POST, project_id)
+    synapse_slice_ids = json.loads(request.POST['synapse_slice_ids'])
+    treenode_ids = json.loads(request.POST['treenode_ids'])
+    contact_pxs = json.loads(request.POST['contact_px'])
+    method = request.POST.get('method', 'unnest')
+    return_ids = request.POST.get('return_ids', 'false').lower() == 'true'
+
+    if not len(synapse_slice_ids) == len(treenode_ids) == len(contact_pxs):
+        raise ValueError('synapse_slice_ids, treenode_ids and contact_px must be the same length')
+
+    if method == 'unnest':
+        new_ids = insert_treenode_associations(pssw_id, synapse_slice_ids, treenode_ids, contact_pxs, return_ids)
+    elif method == 'copy':
+        new_ids = copy_treenode_associations(
+            pssw_id, zip(synapse_slice_ids, treenode_ids, contact_pxs), return_ids
+        )
+    else:
+        raise ValueError("method must be 'unnest' or 'copy', got {}".format(method))
+
+    response = {'count': len(synapse_slice_ids)}
+    if return_ids:
+        response['ids'] = new_ids
+
+    return JsonResponse(response)
+
+
+def insert_treenode_associations(pssw_id, synapse_slice_ids, treenode_ids, contact_pxs, return_ids=False,
+                                 cursor=None):
+    """
+    Insert treenode-synapse associations, sending each column as a single array.
+
+    Args:
+        pssw_id(int): Project synapse suggestion workflow ID
+        synapse_slice_ids(sequence):
+        treenode_ids(sequence):
+        contact_pxs(sequence): Contact area estimations
+        return_ids(bool): Whether to return the IDs of the new associations
+        cursor(django.db.connection.cursor, optional):
+
+    Returns:
+        list: IDs of the new associations in input order if return_ids is True, otherwise None
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    synapse_slice_ids = list(synapse_slice_ids)
+    new_ids = None
+    id_column, id_value, id_array = '', '', ''
+    if return_ids:
+        # the IDs are reserved up front, as INSERT ... RETURNING does not guarantee the order of its rows
+        cursor.execute('''
+            SELECT nextval(pg_get_serial_sequence('synapse_slice_treenode', 'id')) FROM generate_series(1, %s);
+        ''', (len(synapse_slice_ids),))
+        new_ids = [row[0] for row in cursor.fetchall()]
+        id_column, id_value, id_array = 'id, ', 'rows.id, ', '%(ids)s::bigint[], '
+
+    cursor.execute('''
         INSERT INTO synapse_slice_treenode (
-          synapse_slice_id, treenode_id, contact_px, project_synapse_suggestion_workflow_id
+          {}synapse_slice_id, treenode_id, contact_px, project_synapse_suggestion_workflow_id,
+          synapse_suggestion_workflow_id
         )
-        VALUES {}
-        RETURNING id;
-    ''', rows, fmt='(%s, %s, %s, %s)')
+        SELECT {}rows.synapse_slice_id, rows.treenode_id, rows.contact_px, %(pssw_id)s, (
+            SELECT pssw.synapse_suggestion_workflow_id FROM project_synapse_suggestion_workflow pssw
+              WHERE pssw.id = %(pssw_id)s
+          )
+          FROM unnest({}%(synapse_slice_ids)s::bigint[], %(treenode_ids)s::bigint[], %(contact_pxs)s::int[])
+            AS rows ({}synapse_slice_id, treenode_id, contact_px);
+    '''.format(id_column, id_value, id_array, id_column), {
+        'pssw_id': pssw_id,
+        'ids': new_ids,
+        'synapse_slice_ids': synapse_slice_ids,
+        'treenode_ids': list(treenode_ids),
+        'contact_pxs': list(contact_pxs),
+    })
+
+    return new_ids
+
+
+def copy_treenode_associations(pssw_id, rows, return_ids=False, cursor=None):
+    """
+    Stream treenode-synapse associations into the database through a COPY-populated staging table.
 
-    cursor = connection.cursor()
-    cursor.execute(query, cursor_args)
+    Args:
+        pssw_id(int): Project synapse suggestion workflow ID
+        rows(iterable): Iterable of (synapse slice ID, treenode ID, contact area estimation) tuples
+        return_ids(bool): Whether to return the IDs of the new associations
+        cursor(django.db.connection.cursor, optional):
 
-    return JsonResponse(cursor.fetchall(), safe=False)
+    Returns:
+        list: IDs of the new associations in input order if return_ids is True, otherwise None
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    with transaction.atomic():
+        cursor.execute("SELECT pg_get_serial_sequence('synapse_slice_treenode', 'id');")
+        sequence_name = cursor.fetchone()[0]
+
+        # IDs are assigned in the staging table, as INSERT ... RETURNING does not guarantee the order of its rows
+        cursor.execute('''
+            DROP TABLE IF EXISTS synapse_slice_treenode_staging;
+            CREATE TEMPORARY TABLE synapse_slice_treenode_staging (
+              ordinality bigserial,
+              id bigint NOT NULL DEFAULT nextval(%s::regclass),
+              synapse_slice_id int8,
+              treenode_id int8,
+              contact_px int4
+            ) ON COMMIT DROP;
+        ''', (sequence_name,))
+
+        copy_rows(
+            'synapse_slice_treenode_staging', ['synapse_slice_id', 'treenode_id', 'contact_px'],
+            ['int8', 'int8', 'int4'], rows, cursor
+        )
+
+        cursor.execute('''
+            INSERT INTO synapse_slice_treenode (
+              id, synapse_slice_id, treenode_id, contact_px, project_synapse_suggestion_workflow_id,
+              synapse_suggestion_workflow_id
+            )
+            SELECT staging.id, staging.synapse_slice_id, staging.treenode_id, staging.contact_px, %(pssw_id)s, (
+                SELECT pssw.synapse_suggestion_workflow_id FROM project_synapse_suggestion_workflow pssw
+                  WHERE pssw.id = %(pssw_id)s
+              )
+              FROM synapse_slice_treenode_staging staging;
+        ''', {'pssw_id': pssw_id})
+
+        new_ids = None
+        if return_ids:
+            cursor.execute('SELECT id FROM synapse_slice_treenode_staging ORDER BY ordinality;')
+            new_ids = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute('DROP TABLE synapse_slice_treenode_staging;')
+
+    return new_ids
 
 
 @api_view(['GET'])
@@ -87,9 +252,7 @@ def get_treenode_associations(request, project_id=None):
     # todo: improve error handling
 
     skel_id = int(request.GET['skid'])
-    pssw_id = int(request.GET.get(
-        'project_workflow_id', get_most_recent_project_SS_workflow(project_id).id
-    ))
+    pssw_id = get_request_pssw_id(request.GET, project_id)
 
     cursor = connection.cursor()
 
@@ -175,11 +338,32 @@ def get_synapse_objects_info(translation, resolution, synapse_object_ids, cursor
     )
 
 
+# Predicates selecting the synapse slices (as ssp, their project-space geometry) near a treenode (as tn), by the
+# number of dimensions searched. Each begins with a bounding box test which can use the n-dimensional index on
+# synapse_slice_project_geom.
+NEAR_SKELETON_PREDICATES = {
+    2: '''
+        ssp.geom_p &&& ST_Expand(
+          ST_MakePoint(tn.location_x, tn.location_y, tn.location_z), %(distance)s, %(distance)s, 0
+        )
+        AND ST_ZMin(ssp.geom_p)::real = tn.location_z
+        AND ST_DWithin(ST_MakePoint(tn.location_x, tn.location_y), ssp.geom_p, %(distance)s)
+    ''',
+    3: '''
+        ssp.geom_p &&& ST_Expand(ST_MakePoint(tn.location_x, tn.location_y, tn.location_z), %(distance)s)
+        AND ST_3DDWithin(ST_MakePoint(tn.location_x, tn.location_y, tn.location_z), ssp.geom_p, %(distance)s)
+    ''',
+}
+
+
 @api_view(['GET'])
 def get_synapse_slices_near_skeletons(request, project_id=None):
     """
     Find synapse slices which are within a given distance of a particular skeleton, or which are from the same
-    synapse object and in the same z-plane as a synapse slice near the skeleton.
+    synapse object as a synapse slice near the skeleton. Results are grouped by z-plane.
+
+    In 2D, only synapse slices in the same z-plane as a treenode are searched; in 3D, synapse slices in neighbouring
+    z-planes are also found if they are within the distance of the treenode.
 
     Returns {columns: [...], data: [[...], ...]}
 
@@ -199,66 +383,86 @@ def get_synapse_slices_near_skeletons(request, project_id=None):
         type: float
         required: false
         description: distance, in nm, within which to find synapses
+      - name: dimensions
+        type: integer
+        enum: [2, 3]
+        required: false
+        description: whether to search within the treenode's z-plane (2, default) or in 3D (3)
     """
     skel_id = int(request.GET['skid'])
-    pssw_id = int(request.GET.get('project_workflow_id', get_most_recent_project_SS_workflow(project_id).id))
+    pssw_id = get_request_pssw_id(request.GET, project_id)
     distance = float(request.GET.get('distance', 0))
-    dimensions = 2  # int(request.GET.get('dimensions', 2))
-
-    cursor = connection.cursor()
+    dimensions = int(request.GET.get('dimensions', 2))
 
-    ssw_id = ProjectSynapseSuggestionWorkflow.objects.get(id=pssw_id).synapse_suggestion_workflow_id
-
-    translation, resolution = get_translation_resolution(project_id, ssw_id, cursor)
-    offset_xs, offset_ys, offset_zs = translation / resolution
+    if dimensions not in NEAR_SKELETON_PREDICATES:
+        raise ValueError('`dimensions` must be 2 or 3')
 
     columns = ['skeleton_id', 'treenode_id', 'synapse_object_id', 'synapse_slice_ids', 'synapse_z_s',
                'synapse_bounds_s']
 
-    if dimensions == 2:
+    data = _get_synapse_slices_near_skeleton(project_id, pssw_id, skel_id, distance, dimensions)
 
-        cursor.execute('''
-            SELECT tn.skeleton_id, tn.id, ss_so2.synapse_object_id, array_agg(DISTINCT ss2.id),
-              tile2.z_tile_idx, ARRAY[
-                ST_XMin(ST_Extent(ss2.geom_2d)),
-                ST_YMin(ST_Extent(ss2.geom_2d)),
-                ST_XMax(ST_Extent(ss2.geom_2d)),
-                ST_YMax(ST_Extent(ss2.geom_2d))
-              ]
-            FROM synapse_slice ss1
+    return JsonResponse({'columns': columns, 'data': data})
+
+
+def _get_synapse_slices_near_skeleton(project_id, pssw_id, skel_id, distance, dimensions=2, cursor=None):
+    """
+    Get the rows of get_synapse_slices_near_skeletons.
+
+    Treenodes are compared with the project-space geometries of synapse slices (see
+    synapsesuggestor.control.synapse_detection.sync_synapse_slice_project_geoms), so that each treenode is an index
+    lookup regardless of the size of the skeleton.
+
+    Args:
+        project_id(int):
+        pssw_id(int): Project synapse suggestion workflow ID
+        skel_id(int): Skeleton ID
+        distance(float): Distance in project space
+        dimensions(int): 2 or 3; see NEAR_SKELETON_PREDICATES
+        cursor(django.db.connection.cursor, optional):
+
+    Returns:
+        list
+    """
+    if cursor is None:
+        cursor = connection.cursor()
+
+    ssw_id = resolve_workflow(project_id, pssw_id).ssw_id
+
+    cursor.execute('''
+        WITH near_objects AS (
+          SELECT DISTINCT tn.id AS treenode_id, ss_so1.synapse_object_id
+            FROM treenode tn
+            INNER JOIN synapse_slice_project_geom ssp
+              ON ssp.project_id = tn.project_id
+              AND {}
+            INNER JOIN synapse_slice ss1
+              ON ssp.synapse_slice_id = ss1.id
             INNER JOIN synapse_detection_tile tile1
               ON ss1.synapse_detection_tile_id = tile1.id
-            INNER JOIN treenode tn
-              ON tile1.z_tile_idx = (tn.location_z / %s) - %s
-              AND ST_DWithin(
-                    ST_MakePoint((tn.location_x / %s) - %s, (tn.location_y / %s) - %s),
-                    ss1.geom_2d,
-                    (%s / %s) - %s
-                )
             INNER JOIN synapse_slice_synapse_object ss_so1
               ON ss_so1.synapse_slice_id = ss1.id
-            INNER JOIN synapse_slice_synapse_object ss_so2
-              ON ss_so1.synapse_object_id = ss_so2.synapse_object_id
-            INNER JOIN synapse_slice ss2
-              ON ss_so2.synapse_slice_id = ss2.id
-            INNER JOIN synapse_detection_tile tile2
-              ON ss2.synapse_detection_tile_id = tile2.id
-            WHERE tn.skeleton_id = %s
-              AND tn.project_id = %s
-              AND tile1.synapse_suggestion_workflow_id = %s
-            GROUP BY ss_so2.synapse_object_id, tn.skeleton_id, tn.id, tile2.z_tile_idx;
-        ''', (
-                resolution[2], offset_zs,
-                resolution[0], offset_xs, resolution[1], offset_ys,
-                distance, resolution[0], offset_xs,  # assumes xy isotropy
-                skel_id, project_id, ssw_id
-            )
+            WHERE tn.skeleton_id = %(skel_id)s
+              AND tn.project_id = %(project_id)s
+              AND tile1.synapse_suggestion_workflow_id = %(ssw_id)s
         )
-
-        data = cursor.fetchall()
-    elif dimensions == 3:
-        raise NotImplementedError('Synapse slices near skeletons is only implemented for 2D search')
-    else:
-        raise ValueError('`dimensions` must be 2 or 3')
-
-    return JsonResponse({'columns': columns, 'data': data})
+        SELECT %(skel_id)s, near.treenode_id, ss_so2.synapse_object_id, array_agg(DISTINCT ss2.id),
+          tile2.z_tile_idx, ARRAY[
+            ST_XMin(ST_Extent(ss2.geom_2d)),
+            ST_YMin(ST_Extent(ss2.geom_2d)),
+            ST_XMax(ST_Extent(ss2.geom_2d)),
+            ST_YMax(ST_Extent(ss2.geom_2d))
+          ]
+        FROM near_objects near
+        INNER JOIN synapse_slice_synapse_object ss_so2
+          ON near.synapse_object_id = ss_so2.synapse_object_id
+        INNER JOIN synapse_slice ss2
+          ON ss_so2.synapse_slice_id = ss2.id
+        INNER JOIN synapse_detection_tile tile2
+          ON ss2.synapse_detection_tile_id = tile2.id
+        GROUP BY ss_so2.synapse_object_id, near.treenode_id, tile2.z_tile_idx;
+    '''.format(NEAR_SKELETON_PREDICATES[dimensions]), {
+        'skel_id': skel_id, 'project_id': project_id, 'ssw_id': ssw_id, 'distance': distance
+    })
+
+    return cursor.fetchall()
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from synapsesuggestor.control.synapse_detection import agglomerate_synapse_slices_by_layer
+
+
+class Command(BaseCommand):
+    help = 'Agglomerate all synapse slices of a workflow into synapse objects, one z layer of tiles at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('workflow_id', type=int, help='ID of synapse suggestion workflow to agglomerate')
+        parser.add_argument(
+            '--z-start', dest='z_start', type=int, default=None,
+            help='First z tile index to process, e.g. to resume an interrupted run'
+        )
+        parser.add_argument('--z-stop', dest='z_stop', type=int, default=None, help='Z tile index to stop before')
+
+    def handle(self, *args, **options):
+        start = time.time()
+        totals = {'layers': 0, 'slices': 0, 'new_objects': 0, 'merged_objects': 0}
+        for progress in agglomerate_synapse_slices_by_layer(
+            options['workflow_id'], options['z_start'], options['z_stop']
+        ):
+            totals['layers'] += 1
+            for key in ('slices', 'new_objects', 'merged_objects'):
+                totals[key] += progress[key]
+            self.stdout.write(
+                'z={z_idx}: {slices} slices, {new_objects} new objects, {merged_objects} merged objects'.format(
+                    **progress
+                )
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            'Agglomerated {slices} synapse slices in {layers} layers ({new_objects} new objects, '
+            '{merged_objects} merged objects) in {seconds:.2f}s'.format(seconds=time.time() - start, **totals)
+        ))
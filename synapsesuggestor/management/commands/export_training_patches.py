@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from synapsesuggestor.control.training_export import export_training_patches
+
+
+class Command(BaseCommand):
+    help = (
+        'Export label patches of synapse slices around treenodes sampled evenly over z sections and tiles, as chunked '
+        'arrays which can be memory-mapped with numpy.load(path, mmap_mode="r")'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int)
+        parser.add_argument('workflow_id', type=int, help='ID of synapse suggestion workflow whose slices to export')
+        parser.add_argument('output_dir', help='Directory to write arrays and manifest.json to')
+        parser.add_argument(
+            '--per-stratum', dest='per_stratum', type=int, default=1,
+            help='Maximum number of treenodes to sample per z section and tile'
+        )
+        parser.add_argument(
+            '--patch-size', dest='patch_size', type=int, default=64, help='Width and height of patches, in pixels'
+        )
+        parser.add_argument(
+            '--chunk-size', dest='chunk_size', type=int, default=1024, help='Maximum number of patches per array file'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Seed for treenode sampling')
+
+    def handle(self, *args, **options):
+        start = time.time()
+        totals = {'chunks': 0, 'patches': 0, 'slices': 0}
+        for progress in export_training_patches(
+            options['project_id'], options['workflow_id'], options['output_dir'], options['per_stratum'],
+            options['patch_size'], options['chunk_size'], options['seed']
+        ):
+            totals['chunks'] += 1
+            totals['patches'] += progress['patches']
+            totals['slices'] += progress['slices']
+            self.stdout.write('chunk {chunk}: {patches} patches, {slices} synapse slices'.format(**progress))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Exported {patches} patches ({slices} synapse slices) in {chunks} chunks to {output_dir} '
+            'in {seconds:.2f}s'.format(output_dir=options['output_dir'], seconds=time.time() - start, **totals)
+        ))
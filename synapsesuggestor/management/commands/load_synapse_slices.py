@@ -0,0 +1,52 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from synapsesuggestor.control.geometry import GEOM_FORMATS
+from synapsesuggestor.control.synapse_detection import load_synapse_slices
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load synapse slices from a newline-delimited JSON file using COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('workflow_id', type=int, help='ID of synapse suggestion workflow to load slices into')
+        parser.add_argument(
+            'path', help="Newline-delimited JSON file of synapse slices with tile indices, or '-' for stdin"
+        )
+        parser.add_argument('--tolerance', type=float, default=1, help='Geometry simplification tolerance')
+        parser.add_argument(
+            '--geom-format', dest='geom_format', default='geojson', choices=GEOM_FORMATS,
+            help='Encoding of the synapse slice geometries'
+        )
+        parser.add_argument(
+            '--ids-out', dest='ids_out', default=None,
+            help='Path to write tab-separated x_idx, y_idx, z_idx, naive ID and database ID of the inserted slices'
+        )
+
+    def handle(self, *args, **options):
+        in_file = sys.stdin if options['path'] == '-' else open(options['path'])
+
+        try:
+            records = (json.loads(line) for line in in_file if line.strip())
+            start = time.time()
+            count, id_rows = load_synapse_slices(
+                options['workflow_id'], records, options['tolerance'], return_ids=bool(options['ids_out']),
+                geom_format=options['geom_format']
+            )
+            elapsed = time.time() - start
+        finally:
+            if in_file is not sys.stdin:
+                in_file.close()
+
+        if options['ids_out']:
+            with open(options['ids_out'], 'w') as f:
+                for row in id_rows:
+                    f.write('\t'.join(str(item) for item in row) + '\n')
+
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            'Loaded {} synapse slices in {:.2f}s ({:.0f} rows/s)'.format(count, elapsed, rate)
+        ))
@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from synapsesuggestor.benchmarks import BENCHMARKS
+from synapsesuggestor.benchmarks.common import results_metadata, load_results, compare_results
+
+
+class Command(BaseCommand):
+    help = 'Run synapsesuggestor benchmarks. Database writes are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'benchmarks', nargs='*',
+            help='Benchmarks to run (default all): {}'.format(', '.join(BENCHMARKS))
+        )
+        parser.add_argument('--workflow-id', dest='workflow_id', type=int, default=None,
+                            help='Synapse suggestion workflow to benchmark against')
+        parser.add_argument('--size', type=int, default=10000, help='Problem size, e.g. number of rows')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for synthetic data generation')
+        parser.add_argument('--json', dest='json_path', default=None,
+                            help='Path to write results to, as JSON with the run\'s metadata')
+        parser.add_argument('--baseline', default=None,
+                            help='JSON results of a previous run to compare against; fails on regressions')
+        parser.add_argument('--max-slowdown', dest='max_slowdown', type=float, default=1.5,
+                            help='Largest allowed ratio of a result\'s time to its baseline time (default 1.5)')
+
+    def handle(self, *args, **options):
+        names = options['benchmarks'] or list(BENCHMARKS)
+        unknown = set(names).difference(BENCHMARKS)
+        if unknown:
+            raise CommandError('Unknown benchmark(s): {}'.format(', '.join(sorted(unknown))))
+
+        kwargs = {key: options[key] for key in ('workflow_id', 'size', 'seed')}
+
+        results = []
+        for name in names:
+            self.stdout.write('Running {}...'.format(name))
+            for row in BENCHMARKS[name](**kwargs):
+                results.append(row)
+                self.stdout.write('  {method}: {rows} rows in {seconds:.3f}s'.format(**row) + (
+                    ' ({:.0f} rows/s)'.format(row['rows_per_second']) if row['rows_per_second'] else ''
+                ))
+
+        if options['json_path']:
+            metadata = results_metadata(dict(kwargs, benchmarks=names))
+            with open(options['json_path'], 'w') as f:
+                json.dump({'metadata': metadata, 'results': results}, f, indent=2)
+
+        self.stdout.write(self.style.SUCCESS('Finished {} benchmark(s)'.format(len(names))))
+
+        if options['baseline']:
+            regressions = compare_results(load_results(options['baseline']), results, options['max_slowdown'])
+            for benchmark, method, baseline_seconds, seconds, ratio in regressions:
+                self.stdout.write(self.style.ERROR(
+                    '{}.{}: {:.3f}s, baseline {:.3f}s ({:.2f}x)'.format(
+                        benchmark, method, seconds, baseline_seconds, ratio
+                    )
+                ))
+            if regressions:
+                raise CommandError('{} result(s) regressed against {}'.format(len(regressions), options['baseline']))
+            self.stdout.write(self.style.SUCCESS('No regressions against {}'.format(options['baseline'])))
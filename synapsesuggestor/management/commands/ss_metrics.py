@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from synapsesuggestor.control.instrumentation import (
+    METRICS, collect_published_metrics, clear_published_metrics, summarize
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Show percentiles of the latency, database time, query count, rows and bytes of each synapsesuggestor '
+        'endpoint, merged from the metrics published to the cache by all server processes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', dest='as_json', action='store_true', help='Print the full summary as JSON')
+        parser.add_argument('--percentile', default='p90', choices=['p50', 'p90', 'p99', 'mean', 'max'],
+                            help='Statistic to show for each metric in the table (default p90)')
+        parser.add_argument('--slow', action='store_true', help='Also show the slowest requests and their plans')
+        parser.add_argument('--clear', action='store_true', help='Delete the published metrics after showing them')
+
+    def handle(self, *args, **options):
+        published = collect_published_metrics()
+        summary = summarize(list(published.values()))
+
+        if options['as_json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+        elif not summary:
+            self.stdout.write(self.style.WARNING(
+                'No metrics have been published. Metrics are shared through the cache, so a cache backend common to '
+                'all processes is required.'
+            ))
+        else:
+            statistic = options['percentile']
+            self.stdout.write('{} of {} processes\n'.format(statistic, len(published)))
+            self.stdout.write('{:<40} {:>8} {:>7}'.format('endpoint', 'count', 'errors') + ''.join(
+                ' {:>10}'.format(metric) for metric in METRICS
+            ))
+            for endpoint, entry in summary.items():
+                self.stdout.write('{:<40} {:>8} {:>7}'.format(endpoint, entry['count'], entry['errors']) + ''.join(
+                    ' {:>10}'.format('-' if entry[metric] is None else '{:.1f}'.format(entry[metric][statistic]))
+                    for metric in METRICS
+                ))
+
+            if options['slow']:
+                for endpoint, entry in summary.items():
+                    for slow in entry['slow']:
+                        self.stdout.write('\n{} {} ({:.0f}ms, slowest query {:.0f}ms):\n{}'.format(
+                            endpoint, slow['path'], slow['wall_ms'], slow['query_ms'], slow['sql']
+                        ))
+                        if slow['plan'] is not None:
+                            self.stdout.write(json.dumps(slow['plan'], indent=2))
+
+        if options['clear']:
+            clear_published_metrics()
+            self.stdout.write(self.style.SUCCESS('Cleared published metrics'))
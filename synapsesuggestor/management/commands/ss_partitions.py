@@ -0,0 +1,82 @@
+from __future__ import division
+
+from six.moves import input
+
+from django.core.management.base import BaseCommand, CommandError
+
+from synapsesuggestor.control import partitioning
+
+
+class Command(BaseCommand):
+    help = 'Partition the synapse detection tables by synapse suggestion workflow, and manage their partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action', choices=('status', 'enable', 'attach', 'detach'),
+            help="'enable' partitions the tables (requires PostgreSQL 12 or later); 'attach' creates or re-attaches "
+                 "a workflow's partitions; 'detach' detaches them"
+        )
+        parser.add_argument(
+            'workflow_id', nargs='?', type=int, help='Synapse suggestion workflow ID to attach or detach'
+        )
+        parser.add_argument(
+            '--drop', action='store_true', dest='drop', default=False,
+            help='Drop detached partitions rather than keeping them as standalone tables'
+        )
+        parser.add_argument('-y', action='store_true', dest='yes', default=False)
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action in ('attach', 'detach') and options['workflow_id'] is None:
+            raise CommandError('{} requires a workflow ID'.format(action))
+
+        try:
+            if action == 'status':
+                self.status()
+            elif action == 'enable':
+                self.enable(options['yes'])
+            elif action == 'attach':
+                created = partitioning.create_workflow_partitions(options['workflow_id'])
+                self.stdout.write(self.style.SUCCESS('Attached {}'.format(', '.join(created) or 'nothing')))
+            else:
+                self.detach(options['workflow_id'], options['drop'], options['yes'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def confirm(self, prompt, yes):
+        selection = 'y' if yes else 'not an option'
+        while selection.lower() not in ['y', 'n', '']:
+            selection = input(prompt + ' Are you sure ([y]/n)? ')
+
+        if selection == 'n':
+            self.stdout.write(self.style.FAILURE('Aborting'))
+            return False
+        return True
+
+    def status(self):
+        if not partitioning.is_partitioned():
+            self.stdout.write('synapsesuggestor tables are not partitioned')
+
+        for table, name, ssw_id, rows, size, attached in partitioning.partition_status():
+            self.stdout.write('{}: {} ({}), ~{} rows, {:.1f} MiB{}'.format(
+                table, name, 'default' if ssw_id is None else 'workflow {}'.format(ssw_id), rows, size / 1024 ** 2,
+                '' if attached else ', detached'
+            ))
+
+    def enable(self, yes):
+        if not self.confirm('This will rewrite the synapse detection tables, locking them until it finishes.', yes):
+            return
+
+        partitioned = partitioning.partition_tables()
+        self.stdout.write(self.style.SUCCESS('Partitioned {}'.format(', '.join(partitioned) or 'nothing')))
+
+    def detach(self, ssw_id, drop, yes):
+        if drop and not self.confirm('This will drop the synapse detection data of workflow {}.'.format(ssw_id), yes):
+            return
+
+        detached = partitioning.detach_workflow_partitions(ssw_id, drop)
+        self.stdout.write(self.style.SUCCESS('{} {}'.format(
+            'Dropped' if drop else 'Detached', ', '.join(detached) or 'nothing'
+        )))
+        if detached:
+            self.stdout.write('Synapse objects left without synapse slices can be deleted with sweep_synapse_objects')
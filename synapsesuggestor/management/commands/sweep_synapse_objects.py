@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from synapsesuggestor.control.synapse_detection import sweep_unused_synapse_objects
+
+
+class Command(BaseCommand):
+    help = 'Delete synapse objects which no synapse slice maps to, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', dest='batch_size', type=int, default=10000,
+            help='Number of synapse objects to check per transaction'
+        )
+        parser.add_argument(
+            '--start-id', dest='start_id', type=int, default=0,
+            help='Only check synapse objects with a greater ID, e.g. to resume an interrupted sweep'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for last_id, deleted in sweep_unused_synapse_objects(options['batch_size'], options['start_id']):
+            total += len(deleted)
+            self.stdout.write('Checked up to ID {}: deleted {} synapse objects'.format(last_id, len(deleted)))
+
+        self.stdout.write(self.style.SUCCESS('Deleted {} unused synapse objects'.format(total)))
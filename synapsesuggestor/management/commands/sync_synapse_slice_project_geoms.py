@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from synapsesuggestor.control.synapse_detection import sync_synapse_slice_project_geoms
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the project-space geometries of synapse slices, e.g. after adding a stack to a project'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project-id', dest='project_id', type=int, default=None,
+            help='Only sync geometries in this project (default all projects)'
+        )
+
+    def handle(self, *args, **options):
+        sync_synapse_slice_project_geoms(project_id=options['project_id'])
+        self.stdout.write(self.style.SUCCESS('Synced synapse slice project geometries'))
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 11:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('synapsesuggestor', '0003_tile_zyx_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SynapseDetectionTileTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('x_tile_idx', models.IntegerField()),
+                ('y_tile_idx', models.IntegerField()),
+                ('z_tile_idx', models.IntegerField()),
+                ('worker', models.TextField(default=None, null=True)),
+                ('lease_expires', models.DateTimeField(default=None, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('completed', models.DateTimeField(default=None, null=True)),
+                ('synapse_suggestion_workflow', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, to='synapsesuggestor.SynapseSuggestionWorkflow'
+                )),
+            ],
+            options={
+                'db_table': 'synapse_detection_tile_task',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='synapsedetectiontiletask',
+            unique_together=set([('synapse_suggestion_workflow', 'x_tile_idx', 'y_tile_idx', 'z_tile_idx')]),
+        ),
+        # claims only ever scan incomplete tasks, in z-order
+        migrations.RunSQL(
+            '''
+            CREATE INDEX synapse_detection_tile_task_pending
+              ON synapse_detection_tile_task (synapse_suggestion_workflow_id, z_tile_idx, y_tile_idx, x_tile_idx)
+              WHERE completed IS NULL;
+            ''',
+            'DROP INDEX synapse_detection_tile_task_pending;'
+        ),
+    ]
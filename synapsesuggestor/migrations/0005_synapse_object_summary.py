@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 13:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('synapsesuggestor', '0004_synapse_detection_tile_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SynapseObjectSummary',
+            fields=[
+                ('synapse_object', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False,
+                    to='synapsesuggestor.SynapseObject'
+                )),
+                ('slice_count', models.IntegerField()),
+                ('size_px', models.BigIntegerField(verbose_name='Sum of slice sizes in pixels')),
+                ('xs_centroid', models.FloatField(
+                    verbose_name='mean x coord of slice centroids in stack coordinates'
+                )),
+                ('ys_centroid', models.FloatField(
+                    verbose_name='mean y coord of slice centroids in stack coordinates'
+                )),
+                ('zs_centroid', models.FloatField(verbose_name='mean z tile index of slices')),
+                ('xs_min', models.FloatField()),
+                ('xs_max', models.FloatField()),
+                ('ys_min', models.FloatField()),
+                ('ys_max', models.FloatField()),
+                ('zs_min', models.IntegerField()),
+                ('zs_max', models.IntegerField()),
+                ('uncertainty_avg', models.FloatField(null=True)),
+            ],
+            options={
+                'db_table': 'synapse_object_summary',
+            },
+        ),
+        # backfill existing synapse objects
+        migrations.RunSQL(
+            '''
+            INSERT INTO synapse_object_summary (
+              synapse_object_id, slice_count, size_px, xs_centroid, ys_centroid, zs_centroid,
+              xs_min, xs_max, ys_min, ys_max, zs_min, zs_max, uncertainty_avg
+            )
+            SELECT ss_so.synapse_object_id, count(*), sum(ss.size_px),
+                avg(ss.xs_centroid), avg(ss.ys_centroid), avg(tile.z_tile_idx),
+                min(ST_XMin(ss.geom_2d)), max(ST_XMax(ss.geom_2d)),
+                min(ST_YMin(ss.geom_2d)), max(ST_YMax(ss.geom_2d)),
+                min(tile.z_tile_idx), max(tile.z_tile_idx), avg(ss.uncertainty)
+              FROM synapse_slice_synapse_object ss_so
+              INNER JOIN synapse_slice ss
+                ON ss_so.synapse_slice_id = ss.id
+              INNER JOIN synapse_detection_tile tile
+                ON ss.synapse_detection_tile_id = tile.id
+              GROUP BY ss_so.synapse_object_id;
+            ''',
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 14:02
+from __future__ import unicode_literals
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0022_add_reconstruction_sampler_tables'),
+        ('synapsesuggestor', '0005_synapse_object_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SynapseSliceProjectGeom',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geom_p', django.contrib.gis.db.models.fields.PolygonField(dim=3, spatial_index=False, srid=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.Project')),
+                ('synapse_slice', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, to='synapsesuggestor.SynapseSlice'
+                )),
+            ],
+            options={
+                'db_table': 'synapse_slice_project_geom',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='synapsesliceprojectgeom',
+            unique_together=set([('synapse_slice', 'project')]),
+        ),
+        migrations.RunSQL(
+            '''
+            CREATE INDEX synapse_slice_project_geom_geom_p_nd
+              ON synapse_slice_project_geom USING gist (geom_p gist_geometry_ops_nd);
+            ''',
+            'DROP INDEX synapse_slice_project_geom_geom_p_nd;'
+        ),
+        # backfill existing synapse slices
+        migrations.RunSQL(
+            '''
+            INSERT INTO synapse_slice_project_geom (synapse_slice_id, project_id, geom_p)
+              SELECT ss.id, ps.project_id, ST_Translate(
+                  ST_Force3D(ST_Scale(ss.geom_2d, (stack.resolution).x, (stack.resolution).y)),
+                  (ps.translation).x, (ps.translation).y, tile.z_tile_idx * (stack.resolution).z + (ps.translation).z
+                )
+                FROM synapse_slice ss
+                INNER JOIN synapse_detection_tile tile
+                  ON ss.synapse_detection_tile_id = tile.id
+                INNER JOIN synapse_suggestion_workflow ssw
+                  ON tile.synapse_suggestion_workflow_id = ssw.id
+                INNER JOIN synapse_detection_tiling tiling
+                  ON ssw.synapse_detection_tiling_id = tiling.id
+                INNER JOIN stack
+                  ON tiling.stack_id = stack.id
+                INNER JOIN project_stack ps
+                  ON ps.stack_id = stack.id;
+            ''',
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 18:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def workflow_field():
+    return models.ForeignKey(
+        null=True, on_delete=django.db.models.deletion.CASCADE, to='synapsesuggestor.SynapseSuggestionWorkflow'
+    )
+
+
+# rows inserted without the workflow (e.g. through the ORM) take it from the row they refer to; this only applies
+# while the tables are not partitioned, as partitioning requires the key up front
+TRIGGERS_SQL = '''
+CREATE FUNCTION synapse_slice_set_workflow() RETURNS trigger AS $$
+BEGIN
+  IF NEW.synapse_suggestion_workflow_id IS NULL THEN
+    SELECT tile.synapse_suggestion_workflow_id INTO NEW.synapse_suggestion_workflow_id
+      FROM synapse_detection_tile tile
+      WHERE tile.id = NEW.synapse_detection_tile_id;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION synapse_slice_child_set_workflow() RETURNS trigger AS $$
+BEGIN
+  IF NEW.synapse_suggestion_workflow_id IS NULL THEN
+    SELECT ss.synapse_suggestion_workflow_id INTO NEW.synapse_suggestion_workflow_id
+      FROM synapse_slice ss
+      WHERE ss.id = NEW.synapse_slice_id;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION synapse_slice_treenode_set_workflow() RETURNS trigger AS $$
+BEGIN
+  IF NEW.synapse_suggestion_workflow_id IS NULL THEN
+    SELECT pssw.synapse_suggestion_workflow_id INTO NEW.synapse_suggestion_workflow_id
+      FROM project_synapse_suggestion_workflow pssw
+      WHERE pssw.id = NEW.project_synapse_suggestion_workflow_id;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER synapse_slice_set_workflow BEFORE INSERT ON synapse_slice
+  FOR EACH ROW EXECUTE PROCEDURE synapse_slice_set_workflow();
+CREATE TRIGGER synapse_slice_synapse_object_set_workflow BEFORE INSERT ON synapse_slice_synapse_object
+  FOR EACH ROW EXECUTE PROCEDURE synapse_slice_child_set_workflow();
+CREATE TRIGGER synapse_slice_project_geom_set_workflow BEFORE INSERT ON synapse_slice_project_geom
+  FOR EACH ROW EXECUTE PROCEDURE synapse_slice_child_set_workflow();
+CREATE TRIGGER synapse_slice_treenode_set_workflow BEFORE INSERT ON synapse_slice_treenode
+  FOR EACH ROW EXECUTE PROCEDURE synapse_slice_treenode_set_workflow();
+'''
+
+DROP_TRIGGERS_SQL = '''
+DROP TRIGGER IF EXISTS synapse_slice_set_workflow ON synapse_slice;
+DROP TRIGGER IF EXISTS synapse_slice_synapse_object_set_workflow ON synapse_slice_synapse_object;
+DROP TRIGGER IF EXISTS synapse_slice_project_geom_set_workflow ON synapse_slice_project_geom;
+DROP TRIGGER IF EXISTS synapse_slice_treenode_set_workflow ON synapse_slice_treenode;
+DROP FUNCTION synapse_slice_set_workflow();
+DROP FUNCTION synapse_slice_child_set_workflow();
+DROP FUNCTION synapse_slice_treenode_set_workflow();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('synapsesuggestor', '0006_synapse_slice_project_geom'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synapseslice',
+            name='synapse_suggestion_workflow',
+            field=workflow_field(),
+        ),
+        migrations.AddField(
+            model_name='synapseslicesynapseobject',
+            name='synapse_suggestion_workflow',
+            field=workflow_field(),
+        ),
+        migrations.AddField(
+            model_name='synapseslicetreenode',
+            name='synapse_suggestion_workflow',
+            field=workflow_field(),
+        ),
+        migrations.AddField(
+            model_name='synapsesliceprojectgeom',
+            name='synapse_suggestion_workflow',
+            field=workflow_field(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='synapseslicesynapseobject',
+            unique_together=set([('synapse_slice', 'synapse_suggestion_workflow')]),
+        ),
+        migrations.RunSQL(TRIGGERS_SQL, DROP_TRIGGERS_SQL),
+        # backfill existing rows, last because the updates queue deferred foreign key checks, which would block
+        # further ALTER TABLE statements in this transaction
+        migrations.RunSQL(
+            '''
+            UPDATE synapse_slice ss
+              SET synapse_suggestion_workflow_id = tile.synapse_suggestion_workflow_id
+              FROM synapse_detection_tile tile
+              WHERE ss.synapse_detection_tile_id = tile.id;
+
+            UPDATE synapse_slice_synapse_object ss_so
+              SET synapse_suggestion_workflow_id = ss.synapse_suggestion_workflow_id
+              FROM synapse_slice ss
+              WHERE ss_so.synapse_slice_id = ss.id;
+
+            UPDATE synapse_slice_project_geom ssp
+              SET synapse_suggestion_workflow_id = ss.synapse_suggestion_workflow_id
+              FROM synapse_slice ss
+              WHERE ssp.synapse_slice_id = ss.id;
+
+            UPDATE synapse_slice_treenode sstn
+              SET synapse_suggestion_workflow_id = pssw.synapse_suggestion_workflow_id
+              FROM project_synapse_suggestion_workflow pssw
+              WHERE sstn.project_synapse_suggestion_workflow_id = pssw.id;
+            ''',
+            migrations.RunSQL.noop
+        ),
+    ]
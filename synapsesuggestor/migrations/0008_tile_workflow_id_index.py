@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-17 21:05
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('synapsesuggestor', '0007_workflow_partition_key'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='synapsedetectiontile',
+            index_together=set([
+                ('synapse_suggestion_workflow', 'z_tile_idx', 'y_tile_idx', 'x_tile_idx'),
+                ('synapse_suggestion_workflow', 'id'),
+            ]),
+        ),
+    ]
@@ -87,12 +87,48 @@ class SynapseDetectionTile(models.Model):
     class Meta:
         db_table = 'synapse_detection_tile'
         unique_together = ('synapse_suggestion_workflow', 'x_tile_idx', 'y_tile_idx', 'z_tile_idx')
+        index_together = [
+            # serves neighbourhood lookups and z-ordered scans within a workflow
+            ('synapse_suggestion_workflow', 'z_tile_idx', 'y_tile_idx', 'x_tile_idx'),
+            # serves the latest tile of a workflow, which validates cached detected tile listings
+            ('synapse_suggestion_workflow', 'id'),
+        ]
+
+
+@python_2_unicode_compatible
+class SynapseDetectionTileTask(models.Model):
+    """Tile waiting to be processed by a synapse detection worker, and the worker's lease on it"""
+    synapse_suggestion_workflow = models.ForeignKey(SynapseSuggestionWorkflow, on_delete=models.CASCADE)
+
+    x_tile_idx = models.IntegerField()
+    y_tile_idx = models.IntegerField()
+    z_tile_idx = models.IntegerField()
+
+    # null when not leased
+    worker = models.TextField(null=True, default=None)
+    lease_expires = models.DateTimeField(null=True, default=None)
+    attempts = models.IntegerField(default=0)
+    # null until completed
+    completed = models.DateTimeField(null=True, default=None)
+
+    def __str__(self):
+        return 'x{}y{}z{} in {} ({})'.format(
+            self.x_tile_idx, self.y_tile_idx, self.z_tile_idx, self.synapse_suggestion_workflow,
+            'completed' if self.completed else 'leased by {}'.format(self.worker) if self.worker else 'pending'
+        )
+
+    class Meta:
+        db_table = 'synapse_detection_tile_task'
+        unique_together = ('synapse_suggestion_workflow', 'x_tile_idx', 'y_tile_idx', 'z_tile_idx')
 
 
 @python_2_unicode_compatible
 class SynapseSlice(models.Model):
     """Region of a 2D cross-section of a synapse which appears in one tile"""
     synapse_detection_tile = models.ForeignKey(SynapseDetectionTile, on_delete=models.CASCADE)
+    # denormalised from the synapse detection tile, as the key by which the table may be partitioned (see
+    # synapsesuggestor.control.partitioning)
+    synapse_suggestion_workflow = models.ForeignKey(SynapseSuggestionWorkflow, null=True, on_delete=models.CASCADE)
 
     geom_2d = spatial_models.PolygonField(srid=0, spatial_index=True)
     size_px = models.IntegerField()
@@ -111,6 +147,26 @@ class SynapseSlice(models.Model):
         db_table = 'synapse_slice'
 
 
+@python_2_unicode_compatible
+class SynapseSliceProjectGeom(models.Model):
+    """Synapse slice geometry in a project's coordinates, at the z coordinate of its section"""
+    synapse_slice = models.ForeignKey(SynapseSlice, on_delete=models.CASCADE)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    # denormalised from the synapse slice, to refer to it within its workflow's partition (see
+    # synapsesuggestor.control.partitioning)
+    synapse_suggestion_workflow = models.ForeignKey(SynapseSuggestionWorkflow, null=True, on_delete=models.CASCADE)
+
+    # indexed with gist_geometry_ops_nd in the migration, for 3D bounding box (&&&) searches
+    geom_p = spatial_models.PolygonField(srid=0, dim=3, spatial_index=False)
+
+    def __str__(self):
+        return '{} in project {}'.format(self.synapse_slice_id, self.project_id)
+
+    class Meta:
+        db_table = 'synapse_slice_project_geom'
+        unique_together = ('synapse_slice', 'project')
+
+
 @python_2_unicode_compatible
 class SynapseObject(models.Model):
     """3D synapse object"""
@@ -122,17 +178,49 @@ class SynapseObject(models.Model):
         db_table = 'synapse_object'
 
 
+@python_2_unicode_compatible
+class SynapseObjectSummary(models.Model):
+    """Aggregate properties of the synapse slices making up a synapse object, maintained on agglomeration"""
+    synapse_object = models.OneToOneField(SynapseObject, primary_key=True, on_delete=models.CASCADE)
+
+    slice_count = models.IntegerField()
+    size_px = models.BigIntegerField(verbose_name='Sum of slice sizes in pixels')
+
+    xs_centroid = models.FloatField(verbose_name='mean x coord of slice centroids in stack coordinates')
+    ys_centroid = models.FloatField(verbose_name='mean y coord of slice centroids in stack coordinates')
+    zs_centroid = models.FloatField(verbose_name='mean z tile index of slices')
+
+    xs_min = models.FloatField()
+    xs_max = models.FloatField()
+    ys_min = models.FloatField()
+    ys_max = models.FloatField()
+    zs_min = models.IntegerField()
+    zs_max = models.IntegerField()
+
+    uncertainty_avg = models.FloatField(null=True)
+
+    def __str__(self):
+        return '{} ({} slices)'.format(self.synapse_object_id, self.slice_count)
+
+    class Meta:
+        db_table = 'synapse_object_summary'
+
+
 @python_2_unicode_compatible
 class SynapseSliceSynapseObject(models.Model):
     """Mapping from 2D partial synapse cross-sections to whole 3D synapse objects"""
     synapse_slice = models.OneToOneField(SynapseSlice, unique=True, on_delete=models.CASCADE)
     synapse_object = models.ForeignKey(SynapseObject, on_delete=models.CASCADE)
+    # denormalised from the synapse slice, as the partition key (see synapsesuggestor.control.partitioning)
+    synapse_suggestion_workflow = models.ForeignKey(SynapseSuggestionWorkflow, null=True, on_delete=models.CASCADE)
 
     def __str__(self):
         return '{} -- {}'.format(self.synapse_slice.id, self.synapse_object.id)
 
     class Meta:
         db_table = 'synapse_slice_synapse_object'
+        # arbiter for upserts, which must include the partition key when the table is partitioned
+        unique_together = ('synapse_slice', 'synapse_suggestion_workflow')
 
 
 class SynapseAssociationAlgorithm(Algorithm):
@@ -169,6 +257,9 @@ class SynapseSliceTreenode(models.Model):
     treenode = models.ForeignKey(Treenode, null=True, on_delete=models.CASCADE)
 
     project_synapse_suggestion_workflow = models.ForeignKey(ProjectSynapseSuggestionWorkflow, on_delete=models.CASCADE)
+    # denormalised from the project synapse suggestion workflow, as the partition key
+    # (see synapsesuggestor.control.partitioning)
+    synapse_suggestion_workflow = models.ForeignKey(SynapseSuggestionWorkflow, null=True, on_delete=models.CASCADE)
     contact_px = models.IntegerField(verbose_name='Size in pixels of 1D contact area between neuron and synapse')
 
     # contact geometry?
@@ -772,67 +772,85 @@
     return obj;
   };
 
-  SynapseDetectionTable.prototype.getSynapsesForSkel = function(skelID) {
+  /**
+   * Fetch the synapse detections, with their intersecting connectors, of whichever of the given skeletons are not
+   * cached, in a single request.
+   *
+   * @param skelIDs
+   * @return {Promise.<Object>} object mapping each skeleton ID to its array of detections
+   */
+  SynapseDetectionTable.prototype.getSynapsesForSkels = function(skelIDs) {
     const self = this;
 
-    if (this.cache[skelID]) {
-      if (this.cache[skelID].detections && Date.now() - this.cache[skelID].detections.timestamp <= CACHE_TIMEOUT) {
-        return Promise.resolve(this.cache[skelID].detections.results);
-      }
-    } else {
-      this.cache[skelID] = {detections: {}, connectors: {}};
-    }
+    const uncachedSkelIDs = skelIDs.filter(function(skelID) {
+      const cached = self.cache[skelID];
+      return !(cached && cached.detections && Date.now() - cached.detections.timestamp <= CACHE_TIMEOUT);
+    });
 
-    return CATMAID.fetch(
-      `${URL_BASE}/analysis/${project.id}/skeleton-synapses`, 'GET',
-      {skeleton_id: skelID, workflow_id: self.workflowInfo.workflow_id}
-      ).then(function(response){
-        return response.data.reduce(function (obj, responseRow) {
-          const responseRowObj = objZip(response.columns, responseRow);
-          obj[responseRowObj.synapse] = {
-            detectedSynapseID: responseRowObj.synapse,
-            coords: {
-              x: responseRowObj.xs,
-              y: responseRowObj.ys,
-              z: responseRowObj.zs,
-            },
-            sizePx: responseRowObj.size_px,
-            contactPx: responseRowObj.contact_px,
-            slices: new Set(responseRowObj.z_slices).size,
-            uncertainty: responseRowObj.uncertainty_avg,
-            nodeIDs: new Set(responseRowObj.nodes),
-            skelID: skelID,
-            associatedConnIDs: new Set()
-          };
-          return obj;
-        }, {});
-      }).then(function (rowsObj) {
-        const tolerance = Number(document.getElementById(self.idPrefix + 'tolerance').value);
-        const mode = document.getElementById(self.idPrefix + 'mode-select').value;
-        return CATMAID.fetch(
-          `${URL_BASE}/analysis/${project.id}/intersecting-connectors`, 'POST',
-          {
-            workflow_id: self.workflowInfo.workflow_id,
-            synapse_object_ids: Object.keys(rowsObj),
-            tolerance: tolerance,
-            mode: mode
-          }
-        ).then(function(response) {
-          for (let responseRow of response.data) {
+    let fetched = Promise.resolve();
+    if (uncachedSkelIDs.length) {
+      const tolerance = Number(document.getElementById(self.idPrefix + 'tolerance').value);
+      const mode = document.getElementById(self.idPrefix + 'mode-select').value;
+      fetched = CATMAID.fetch(
+        `${URL_BASE}/analysis/${project.id}/skeleton-synapses-batch`, 'POST',
+        {
+          skeleton_ids: uncachedSkelIDs,
+          workflow_id: self.workflowInfo.workflow_id,
+          include_connectors: true,
+          tolerance: tolerance,
+          mode: mode
+        }
+      ).then(function(response) {
+        for (let skelID of uncachedSkelIDs) {
+          const rowsObj = (response.data[skelID] || []).reduce(function (obj, responseRow) {
             const responseRowObj = objZip(response.columns, responseRow);
-            rowsObj[responseRowObj.synapse_object_id].associatedConnIDs.add(responseRowObj.connector_id);
+            obj[responseRowObj.synapse] = {
+              detectedSynapseID: responseRowObj.synapse,
+              coords: {
+                x: responseRowObj.xs,
+                y: responseRowObj.ys,
+                z: responseRowObj.zs,
+              },
+              sizePx: responseRowObj.size_px,
+              contactPx: responseRowObj.contact_px,
+              slices: new Set(responseRowObj.z_slices).size,
+              uncertainty: responseRowObj.uncertainty_avg,
+              nodeIDs: new Set(responseRowObj.nodes),
+              skelID: skelID,
+              associatedConnIDs: new Set()
+            };
+            return obj;
+          }, {});
+
+          for (let connectorRow of response.connectors[skelID] || []) {
+            const connectorRowObj = objZip(response.connector_columns, connectorRow);
+            rowsObj[connectorRowObj.synapse_object_id].associatedConnIDs.add(connectorRowObj.connector_id);
           }
-          const rowsWithIntersecting = Object.keys(rowsObj)
-            .sort(function(a, b) {return a - b;})
-            .map(function(synID) {return rowsObj[synID];});
 
+          if (!self.cache[skelID]) {
+            self.cache[skelID] = {detections: {}, connectors: {}};
+          }
           self.cache[skelID].detections = {
             timestamp: Date.now(),
-            results: rowsWithIntersecting
+            results: Object.keys(rowsObj)
+              .sort(function(a, b) {return a - b;})
+              .map(function(synID) {return rowsObj[synID];})
           };
+        }
+      });
+    }
 
-          return rowsWithIntersecting;
-        });
+    return fetched.then(function() {
+      return skelIDs.reduce(function(obj, skelID) {
+        obj[skelID] = self.cache[skelID].detections.results;
+        return obj;
+      }, {});
+    });
+  };
+
+  SynapseDetectionTable.prototype.getSynapsesForSkel = function(skelID) {
+    return this.getSynapsesForSkels([skelID]).then(function(resultsBySkel) {
+      return resultsBySkel[skelID];
     });
   };
 
@@ -905,7 +923,11 @@
 
     constraints = fillOutConstraints(constraints);
 
-    return Promise.all(skelIDs.map(self.getConnectorsSynapsesForSkel.bind(self)))
+    // fetch all uncached detections in one request, so that each skeleton's lookup below hits the cache
+    return self.getSynapsesForSkels(skelIDs)
+      .then(function() {
+        return Promise.all(skelIDs.map(self.getConnectorsSynapsesForSkel.bind(self)));
+      })
       .then(function(dataBySkel) {
         const results = {constraints: constraints};
 
@@ -996,7 +1018,11 @@
 
     constraints = fillOutConstraints(constraints);
 
-    return Promise.all(skelIDs.map(self.getConnectorsSynapsesForSkel.bind(self)))
+    // fetch all uncached detections in one request, so that each skeleton's lookup below hits the cache
+    return self.getSynapsesForSkels(skelIDs)
+      .then(function() {
+        return Promise.all(skelIDs.map(self.getConnectorsSynapsesForSkel.bind(self)));
+      })
       .then(function(dataBySkel) {
         const connSet = new Set();
         const detectedConns = new Set();
@@ -1211,13 +1237,9 @@
 
     this.getWorkflowInfo().then(function(){
       self.setWorkflowInfoFromSelect();
-      return Promise.all(
-        self.skeletonSource
-          .getSelectedSkeletons()
-          .map(self.getSynapsesForSkel.bind(self))
-      ).then(function(rowsArr) {
-        for (let rowObjs of rowsArr) {
-          self.oTable.rows.add(rowObjs);
+      return self.getSynapsesForSkels(self.skeletonSource.getSelectedSkeletons()).then(function(rowsBySkel) {
+        for (let skelID of Object.keys(rowsBySkel)) {
+          self.oTable.rows.add(rowsBySkel[skelID]);
         }
         self.populateAnalysisResults();
         self.setSkelSourceText();
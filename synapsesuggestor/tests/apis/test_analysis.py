@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 import json
+from unittest import skipUnless
 
 import numpy as np
 
 from catmaid.models import ProjectStack, Connector, Relation
 from catmaid.control.treenode import _create_treenode, create_connector_link
+from synapsesuggestor.control import columnar
 from synapsesuggestor.tests.common import SynapseSuggestorTestCase
 
 URL_PREFIX = '/ext/synapsesuggestor/analysis'
@@ -27,7 +29,7 @@ class AnalysisApiTests(SynapseSuggestorTestCase):
 
         response = self.client.get(URL_PREFIX + '/{}/skeleton-synapses'.format(self.test_project_id), params)
         self.assertEqual(response.status_code, 200)
-        return json.loads(response.content.decode('utf-8'))
+        return self.parse_json(response)
 
     def test_skeleton_synapses_successful(self):
         self.fake_authentication()
@@ -44,6 +46,92 @@ class AnalysisApiTests(SynapseSuggestorTestCase):
 
         self.assertDictEqual(expected_response, parsed_response)
 
+    @skipUnless(columnar.msgpack, 'msgpack is not installed')
+    def test_skeleton_synapses_msgpack(self):
+        self.fake_authentication()
+        params = {'workflow_id': self.test_ssw_id, 'skeleton_id': self.test_skeleton_id}
+        url = URL_PREFIX + '/{}/skeleton-synapses'.format(self.test_project_id)
+
+        response = self.client.get(url, params, HTTP_ACCEPT='application/x-msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        decoded = columnar.decode_msgpack_columns(response.content)
+
+        json_response = self.skeleton_synapses(self.test_ssw_id, self.test_skeleton_id)
+        self.assertListEqual(decoded['columns'], json_response['columns'])
+        # typed columns are numpy arrays; other columns are lists of values
+        decoded_rows = [list(row) for row in zip(*[
+            column.tolist() if isinstance(column, np.ndarray) else column for column in decoded['data']
+        ])]
+        self.assertListEqual(decoded_rows, json_response['data'])
+        self.assertIsInstance(decoded['data'][decoded['columns'].index('skeleton_id')], np.ndarray)
+
+    @skipUnless(columnar.pyarrow, 'pyarrow is not installed')
+    def test_skeleton_synapses_arrow(self):
+        self.fake_authentication()
+        params = {'workflow_id': self.test_ssw_id, 'skeleton_id': self.test_skeleton_id}
+        url = URL_PREFIX + '/{}/skeleton-synapses'.format(self.test_project_id)
+
+        response = self.client.get(url, params, HTTP_ACCEPT=columnar.ArrowRenderer.media_type)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], columnar.ArrowRenderer.media_type)
+        table = self.read_arrow(response.content)
+
+        json_response = self.skeleton_synapses(self.test_ssw_id, self.test_skeleton_id)
+        self.assertListEqual(table.schema.names, json_response['columns'])
+        self.assertListEqual(self.arrow_rows(table), json_response['data'])
+        self.assertEqual(str(table.schema.field(json_response['columns'].index('skeleton_id')).type), 'int64')
+
+        # as rendered by DRF from {columns, data}
+        rendered = self.read_arrow(columnar.ArrowRenderer().render(json_response))
+        self.assertListEqual(rendered.schema.names, json_response['columns'])
+        self.assertListEqual(self.arrow_rows(rendered), json_response['data'])
+
+    def read_arrow(self, content):
+        return columnar.pyarrow.RecordBatchStreamReader(columnar.pyarrow.BufferReader(content)).read_all()
+
+    def arrow_rows(self, table):
+        return [list(row) for row in zip(*[table.column(i).to_pylist() for i in range(table.num_columns)])]
+
+    def test_skeleton_synapses_not_acceptable(self):
+        self.fake_authentication()
+        params = {'workflow_id': self.test_ssw_id, 'skeleton_id': self.test_skeleton_id}
+
+        response = self.client.get(
+            URL_PREFIX + '/{}/skeleton-synapses'.format(self.test_project_id), params,
+            HTTP_ACCEPT='application/x-not-a-format'
+        )
+        self.assertEqual(response.status_code, 406)
+
+    def test_skeletons_synapses_successful(self):
+        other_skid = 235
+        self.fake_authentication()
+        tc_info = self.create_treenode_connector(self.outside_ss, self.inside_ss_2)
+
+        response = self.client.post(
+            URL_PREFIX + '/{}/skeleton-synapses-batch'.format(self.test_project_id),
+            {
+                'workflow_id': self.test_ssw_id,
+                'skeleton_ids': [self.test_skeleton_id, other_skid],
+                'include_connectors': 'true'
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+
+        single_response = self.skeleton_synapses(self.test_ssw_id, self.test_skeleton_id)
+        self.assertListEqual(parsed_response['columns'], single_response['columns'])
+        self.assertDictEqual(
+            parsed_response['data'], {str(self.test_skeleton_id): single_response['data'], str(other_skid): []}
+        )
+
+        self.assertListEqual(parsed_response['connectors'][str(other_skid)], [])
+        connector_rows = parsed_response['connectors'][str(self.test_skeleton_id)]
+        self.assertEqual(len(connector_rows), 1)
+        response_dict = dict(zip(parsed_response['connector_columns'], connector_rows[0]))
+        self.assertEqual(response_dict['synapse_object_id'], self.test_syn_obj_id)
+        self.assertEqual(response_dict['connector_id'], tc_info['connector_id'])
+
     def create_treenode_connector(
         self, treenode_xyz_s, connector_xyz_s, relation_name='presynaptic_to', stack_id=None,
         project_id=None
@@ -114,7 +202,7 @@ class AnalysisApiTests(SynapseSuggestorTestCase):
 
         response = self.client.post(URL_PREFIX + '/{}/intersecting-connectors'.format(self.test_project_id), data)
         self.assertEqual(response.status_code, 200)
-        parsed_response = json.loads(response.content.decode('utf-8'))
+        parsed_response = self.parse_json(response)
 
         if parsed_response['data']:
             self.assertEqual(len(parsed_response['columns']), len(parsed_response['data'][0]))
@@ -136,6 +224,23 @@ class AnalysisApiTests(SynapseSuggestorTestCase):
         self.assertEqual(response_dict['treenode_ids'], [tc_info['treenode_id']])
         self.assertEqual(response_dict['skeleton_ids'], [tc_info['skeleton_id']])
 
+    def test_partners_successful(self):
+        self.fake_authentication()
+
+        response = self.client.post(
+            URL_PREFIX + '/{}/partners'.format(self.test_project_id), {'synapse_object_ids': [self.test_syn_obj_id]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        parsed_response = self.parse_json(response)
+
+        expected_response = {
+            'columns': ['synapse_object_id', 'tnids', 'skid', 'contact_px'],
+            'data': [[self.test_syn_obj_id, [self.test_treenode_id], self.test_skeleton_id, 5]]
+        }
+
+        self.assertDictEqual(expected_response, parsed_response)
+
     def get_synapse_extents(self, synapse_object_ids=None, z_padding=None, xy_padding=None):
         if synapse_object_ids is None:
             synapse_object_ids = [self.test_syn_obj_id]
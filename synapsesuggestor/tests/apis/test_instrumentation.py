@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django.db import connection
+from django.test import override_settings
+
+from synapsesuggestor.control.instrumentation import _explain, registry
+from synapsesuggestor.tests.common import SynapseSuggestorTestCase
+
+URL_PREFIX = '/ext/synapsesuggestor'
+
+
+class InstrumentationApiTests(SynapseSuggestorTestCase):
+    def setUp(self):
+        super(InstrumentationApiTests, self).setUp()
+        registry.clear()
+
+    def get_metrics(self):
+        response = self.client.get(URL_PREFIX + '/metrics')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def get_treenode_associations(self):
+        response = self.client.get(
+            URL_PREFIX + '/treenode-association/{}/get'.format(self.test_project_id),
+            {'skid': self.test_skeleton_id, 'project_workflow_id': self.test_pssw_id}
+        )
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_records_requests(self):
+        self.fake_authentication()
+        rows = self.get_treenode_associations()
+        self.get_treenode_associations()
+
+        metrics = self.get_metrics()['get_treenode_associations']
+
+        self.assertEqual(metrics['count'], 2)
+        self.assertEqual(metrics['errors'], 0)
+        self.assertGreaterEqual(metrics['queries']['max'], 1)
+        self.assertEqual(metrics['rows']['max'], len(rows))
+        self.assertGreater(metrics['bytes']['max'], 0)
+        self.assertListEqual(metrics['slow'], [])
+
+    def test_records_streamed_requests(self):
+        self.fake_authentication()
+        response = self.client.post(
+            URL_PREFIX + '/analysis/{}/partners'.format(self.test_project_id), {'synapse_object_ids[0]': 1}
+        )
+        rows = self.parse_json(response)['data']
+
+        metrics = self.get_metrics()['get_partners']
+
+        self.assertEqual(metrics['count'], 1)
+        self.assertEqual(metrics['rows']['max'], len(rows))
+        # the partners query is streamed from a server-side cursor, outside of Django's cursors
+        self.assertEqual(len(response.streamed_queries), 1)
+        self.assertTrue(response.streamed_queries[0].executed)
+        self.assertGreaterEqual(metrics['queries']['max'], 1)
+        self.assertGreaterEqual(metrics['db_ms']['max'], 1000 * response.streamed_queries[0].seconds)
+
+    def test_omits_sql_without_explain_threshold(self):
+        self.fake_authentication()
+        self.get_treenode_associations()
+
+        self.assertGreaterEqual(len(connection.queries_log), 1)
+        self.assertTrue(all(query['sql'] is None for query in connection.queries_log))
+        self.assertFalse(connection.force_debug_cursor)
+
+    @override_settings(SYNAPSESUGGESTOR_EXPLAIN_THRESHOLD_MS=0)
+    def test_explain_slow_requests(self):
+        self.fake_authentication()
+        self.get_treenode_associations()
+
+        slow = self.get_metrics()['get_treenode_associations']['slow']
+
+        self.assertEqual(len(slow), 1)
+        self.assertTrue(slow[0]['sql'].lstrip().upper().startswith(('SELECT', 'WITH')))
+        self.assertIn('Plan', slow[0]['plan'][0])
+
+    def test_explain_only_analyzes_reads(self):
+        plan = _explain('SELECT id FROM synapse_object;')
+        self.assertIn('Actual Rows', plan[0]['Plan'])
+
+        plan = _explain('''
+            WITH deleted AS (DELETE FROM synapse_object WHERE id < 0 RETURNING id)
+            SELECT count(*) FROM deleted;
+        ''')
+        self.assertNotIn('Actual Rows', plan[0]['Plan'])
+
+        self.assertIsNone(_explain('SELECT 1; DELETE FROM synapse_object;'))
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import os
+
+from django.db import connection
+
+from synapsesuggestor.control import partitioning
+from synapsesuggestor.control.synapse_detection import load_synapse_slices
+from synapsesuggestor.control.treenode_association import insert_treenode_associations
+from synapsesuggestor.models import (
+    SynapseDetectionTile, SynapseSlice, SynapseSliceProjectGeom, SynapseSliceSynapseObject, SynapseSliceTreenode
+)
+from synapsesuggestor.tests.common import SynapseSuggestorTestCase
+
+
+class PartitioningTests(SynapseSuggestorTestCase):
+    def server_version(self):
+        cursor = connection.cursor()
+        cursor.execute('SHOW server_version_num;')
+        return int(cursor.fetchone()[0])
+
+    def test_workflow_set_on_insert(self):
+        ring = [[10, 10], [12, 10], [12, 12], [10, 12], [10, 10]]
+        _, id_rows = load_synapse_slices(self.test_ssw_id, [{
+            'id': 1, 'x_idx': 0, 'y_idx': 0, 'z_idx': 5, 'geom': {'type': 'Polygon', 'coordinates': [ring]},
+            'size_px': 4, 'xs_centroid': 11, 'ys_centroid': 11, 'uncertainty': 0.5,
+        }], return_ids=True)
+        slice_id = id_rows[0][4]
+        insert_treenode_associations(self.test_pssw_id, [slice_id], [self.test_treenode_id], [3])
+
+        self.assertEqual(SynapseSlice.objects.get(id=slice_id).synapse_suggestion_workflow_id, self.test_ssw_id)
+        for model in (SynapseSliceProjectGeom, SynapseSliceTreenode):
+            self.assertSetEqual(
+                set(model.objects.filter(synapse_slice_id=slice_id).values_list(
+                    'synapse_suggestion_workflow_id', flat=True
+                )),
+                {self.test_ssw_id}
+            )
+
+    def test_workflow_set_by_trigger(self):
+        tile = SynapseDetectionTile.objects.get(id=1)
+        syn_slice = SynapseSlice.objects.create(
+            synapse_detection_tile=tile, geom_2d='POLYGON ((0 0, 1 0, 1 1, 0 1, 0 0))', size_px=1, xs_centroid=0,
+            ys_centroid=0
+        )
+        syn_slice.refresh_from_db()
+
+        self.assertEqual(syn_slice.synapse_suggestion_workflow_id, tile.synapse_suggestion_workflow_id)
+
+    def test_fixture_workflow_backfilled(self):
+        for model in (SynapseSlice, SynapseSliceSynapseObject, SynapseSliceTreenode, SynapseSliceProjectGeom):
+            self.assertFalse(model.objects.filter(synapse_suggestion_workflow__isnull=True).exists())
+
+    def test_unique_indexes_include_partition_key(self):
+        definitions = partitioning._index_definitions(
+            'synapse_slice_synapse_object', 'synapse_slice_synapse_object_new', connection.cursor()
+        )
+
+        unique = [definition for definition in definitions if definition.startswith('CREATE UNIQUE')]
+        self.assertEqual(len(unique), 1)
+        self.assertIn('(synapse_slice_id, synapse_suggestion_workflow_id)', unique[0])
+        self.assertTrue(all(' ON synapse_slice_synapse_object_new ' in definition for definition in definitions))
+
+    def test_not_partitioned(self):
+        self.assertFalse(partitioning.is_partitioned())
+        with self.assertRaises(ValueError):
+            partitioning.detach_workflow_partitions(self.test_ssw_id)
+
+    def test_partition_detach_attach(self):
+        if self.server_version() < partitioning.MIN_SERVER_VERSION:
+            # the CI job on PostgreSQL 12 sets this, so that the test cannot be skipped there
+            self.assertFalse(os.environ.get('SYNAPSESUGGESTOR_TEST_PARTITIONING'), 'PostgreSQL 12 required')
+            self.skipTest('declarative partitioning requires PostgreSQL 12')
+
+        cursor = connection.cursor()
+        # fire the foreign key checks deferred by the fixtures, which would otherwise block ALTER TABLE
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE;')
+        slice_count = SynapseSlice.objects.count()
+        geoms = set(SynapseSliceProjectGeom.objects.values_list('synapse_slice_id', 'project_id'))
+        self.assertTrue(geoms)
+
+        self.assertListEqual(partitioning.partition_tables(), list(partitioning.PARTITIONED_TABLES))
+        for table in partitioning.PARTITIONED_TABLES:
+            self.assertTrue(partitioning.is_partitioned(table))
+        self.assertEqual(SynapseSlice.objects.count(), slice_count)
+        self.assertIn(
+            ('synapse_slice', 'synapse_slice_w{}'.format(self.test_ssw_id), self.test_ssw_id),
+            [status[:3] for status in partitioning.partition_status()]
+        )
+
+        detached = partitioning.detach_workflow_partitions(self.test_ssw_id)
+        self.assertEqual(len(detached), len(partitioning.PARTITIONED_TABLES))
+        self.assertFalse(SynapseSlice.objects.filter(synapse_suggestion_workflow_id=self.test_ssw_id).exists())
+        self.assertFalse(SynapseSliceProjectGeom.objects.filter(
+            synapse_suggestion_workflow_id=self.test_ssw_id
+        ).exists())
+
+        partitioning.create_workflow_partitions(self.test_ssw_id)
+        self.assertEqual(SynapseSlice.objects.count(), slice_count)
+        self.assertSetEqual(set(SynapseSliceProjectGeom.objects.values_list('synapse_slice_id', 'project_id')), geoms)
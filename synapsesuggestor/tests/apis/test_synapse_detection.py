@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+import base64
 import json
+import struct
+import zlib
 from unittest import skip
 
 import numpy as np
@@ -7,7 +10,12 @@ from six import assertCountEqual
 
 from django.db import connection
 
-from synapsesuggestor.models import SynapseSliceSynapseObject, SynapseObject, SynapseSlice
+from catmaid.fields import Double3D
+from catmaid.models import ProjectStack, Stack
+from synapsesuggestor.control.synapse_detection import (
+    agglomerate_synapse_slices_by_layer, sweep_unused_synapse_objects
+)
+from synapsesuggestor.models import SynapseSliceSynapseObject, SynapseObject, SynapseSlice, SynapseObjectSummary
 from synapsesuggestor.tests.common import SynapseSuggestorTestCase
 
 URL_PREFIX = '/ext/synapsesuggestor/synapse-detection'
@@ -42,11 +50,53 @@ class SynapseDetectionApiTests(SynapseSuggestorTestCase):
             {'workflow_id': self.test_ssw_id}
         )
         self.assertEqual(response.status_code, 200)
-        parsed_response = json.loads(response.content.decode('utf-8'))
+        parsed_response = self.parse_json(response)
 
         expected_result = [[0, 0, 0], [0, 0, 1]]
         assertCountEqual(self, expected_result, parsed_response)
 
+    def test_get_detected_tiles_rle(self):
+        self.fake_authentication()
+
+        response = self.client.get(URL_PREFIX + '/tiles/detected', {'workflow_id': self.test_ssw_id, 'format': 'rle'})
+        self.assertEqual(response.status_code, 200)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(len(parsed_response['shape']), 3)
+        self.assertListEqual(parsed_response['layers'], [[0, [0, 1]], [1, [0, 1]]])
+
+    def test_get_detected_tiles_bitmap_binary(self):
+        self.fake_authentication()
+
+        response = self.client.get(
+            URL_PREFIX + '/tiles/detected', {'workflow_id': self.test_ssw_id, 'format': 'bitmap', 'binary': 'true'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        shape = [int(item) for item in response['X-Tile-Grid-Shape'].split(',')]
+        size = shape[0] * shape[1] * shape[2]
+        grid = np.unpackbits(np.frombuffer(response.content, dtype=np.uint8))[:size].reshape(shape)
+
+        assertCountEqual(self, np.argwhere(grid).tolist(), [[0, 0, 0], [1, 0, 0]])
+
+    def test_get_detected_tiles_not_modified(self):
+        self.fake_authentication()
+
+        response = self.client.get(URL_PREFIX + '/tiles/detected', {'workflow_id': self.test_ssw_id})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(
+            URL_PREFIX + '/tiles/detected', {'workflow_id': self.test_ssw_id}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+        self.insert_synapses(2, (0, 0))
+        response = self.client.get(
+            URL_PREFIX + '/tiles/detected', {'workflow_id': self.test_ssw_id}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
     def test_get_detected_tiles_empty(self):
         other_ssw_id = 500
 
@@ -57,7 +107,7 @@ class SynapseDetectionApiTests(SynapseSuggestorTestCase):
             {'workflow_id': other_ssw_id}
         )
         self.assertEqual(response.status_code, 200)
-        parsed_response = json.loads(response.content.decode('utf-8'))
+        parsed_response = self.parse_json(response)
 
         expected_result = []
         self.assertListEqual(expected_result, parsed_response)
@@ -130,6 +180,75 @@ class SynapseDetectionApiTests(SynapseSuggestorTestCase):
         self.assertSetEqual({int(key) for key in parsed_response.keys()}, set(orig_ids))
         self.assertEqual(len(parsed_response), len(set(parsed_response.values())))
 
+    def test_add_synapse_slices_from_tiles(self):
+        """Depends on get_detected_tiles"""
+        self.fake_authentication()
+
+        syn1_coords = [(0, 0), (1, 0), (1, 1), (0, 1)]
+        syn2_coords = [(1, 0), (2, 0), (2, 1), (1, 1)]
+        existing_tile_data, existing_orig_ids = self.create_synapse_slice_data([syn1_coords, syn2_coords], [0, 0, 1])
+        new_tile_data, new_orig_ids = self.create_synapse_slice_data([syn1_coords], [0, 0, 2])
+
+        tiles = []
+        for tile_data in (existing_tile_data, new_tile_data):
+            tiles.append(json.dumps({
+                'x_idx': tile_data['x_idx'],
+                'y_idx': tile_data['y_idx'],
+                'z_idx': tile_data['z_idx'],
+                'synapse_slices': [json.loads(s) for s in tile_data['synapse_slices']]
+            }))
+
+        response = self.client.post(
+            URL_PREFIX + '/tiles/insert-synapse-slices-batch',
+            {'workflow_id': self.test_ssw_id, 'tiles': tiles, 'tolerance': RDP_TOLERANCE}
+        )
+        self.assertEqual(response.status_code, 200)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(len(parsed_response), 2)
+        for id_mapping, orig_ids in zip(parsed_response, (existing_orig_ids, new_orig_ids)):
+            self.assertSetEqual({int(key) for key in id_mapping.keys()}, set(orig_ids))
+
+        new_ids = [value for id_mapping in parsed_response for value in id_mapping.values()]
+        self.assertEqual(len(new_ids), len(set(new_ids)))
+        self.assertEqual(SynapseSlice.objects.filter(pk__in=new_ids).count(), 3)
+
+        response = self.client.get(URL_PREFIX + '/tiles/detected', {'workflow_id': self.test_ssw_id})
+        parsed_response = self.parse_json(response)
+        assertCountEqual(self, [[0, 0, 0], [0, 0, 1], [0, 0, 2]], parsed_response)
+
+    def test_load_synapse_slices_from_stream(self):
+        self.fake_authentication()
+
+        syn1_coords = [(0, 0), (1, 0), (1, 1), (0, 1)]
+        syn2_coords = [(1, 0), (2, 0), (2, 1), (1, 1)]
+        lines = []
+        for tile_idx in ([0, 0, 1], [0, 0, 2]):
+            data, _ = self.create_synapse_slice_data([syn1_coords, syn2_coords], tile_idx)
+            for syn_slice_str in data['synapse_slices']:
+                record = json.loads(syn_slice_str)
+                record.update(zip(['x_idx', 'y_idx', 'z_idx'], tile_idx))
+                lines.append(json.dumps(record))
+
+        response = self.client.post(
+            URL_PREFIX + '/tiles/load-synapse-slices?workflow_id={}&tolerance={}&return_ids=true'.format(
+                self.test_ssw_id, RDP_TOLERANCE
+            ),
+            '\n'.join(lines),
+            content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 200)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(parsed_response['count'], 4)
+        self.assertEqual(len(parsed_response['data']), 4)
+        new_ids = [row[-1] for row in parsed_response['data']]
+        self.assertEqual(SynapseSlice.objects.filter(pk__in=new_ids).count(), 4)
+
+        response = self.client.get(URL_PREFIX + '/tiles/detected', {'workflow_id': self.test_ssw_id})
+        parsed_response = self.parse_json(response)
+        assertCountEqual(self, [[0, 0, 0], [0, 0, 1], [0, 0, 2]], parsed_response)
+
     def insert_synapses(self, z, *toplefts, **kwargs):
         """
         Insert synapses into the database at the given locations
@@ -165,6 +284,85 @@ class SynapseDetectionApiTests(SynapseSuggestorTestCase):
 
         return [parsed_response[str(orig_id)] for orig_id in orig_ids]
 
+    def test_insert_synapse_slices_syncs_project_geom(self):
+        """Test that inserted synapse slices get project-space geometries at the z of their section"""
+        self.fake_authentication()
+
+        new_ids = self.insert_synapses(2, (0, 0))
+
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT ST_ZMin(ssp.geom_p), (stack.resolution).z * 2 + (ps.translation).z
+              FROM synapse_slice_project_geom ssp
+              INNER JOIN project_stack ps
+                ON ps.project_id = ssp.project_id
+                AND ps.stack_id = %s
+              INNER JOIN stack
+                ON stack.id = ps.stack_id
+              WHERE ssp.synapse_slice_id = %s;
+        ''', (self.test_stack_id, new_ids[0]))
+        rows = cursor.fetchall()
+
+        self.assertTrue(rows)
+        for z, expected_z in rows:
+            self.assertAlmostEqual(z, expected_z)
+
+    def test_project_stack_changes_sync_project_geom(self):
+        """Test that project-space geometries follow changes to the project's translation of the stack"""
+        self.fake_authentication()
+
+        new_id = self.insert_synapses(2, (0, 0))[0]
+        project_stack = ProjectStack.objects.get(project_id=self.test_project_id, stack_id=self.test_stack_id)
+        translation = project_stack.translation
+        project_stack.translation = Double3D(translation.x, translation.y, translation.z + 10)
+        project_stack.save()
+
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT ST_ZMin(ssp.geom_p), (stack.resolution).z * 2 + %s
+              FROM synapse_slice_project_geom ssp
+              INNER JOIN stack
+                ON stack.id = %s
+              WHERE ssp.synapse_slice_id = %s
+                AND ssp.project_id = %s;
+        ''', (translation.z + 10, self.test_stack_id, new_id, self.test_project_id))
+        z, expected_z = cursor.fetchone()
+        self.assertAlmostEqual(z, expected_z)
+
+        project_stack.delete()
+
+        cursor.execute('''
+            SELECT count(*) FROM synapse_slice_project_geom WHERE synapse_slice_id = %s AND project_id = %s;
+        ''', (new_id, self.test_project_id))
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_unchanged_stack_saves_skip_project_geom_sync(self):
+        """Test that project-space geometries are only re-synced when the stack's placement or scale changes"""
+        self.fake_authentication()
+
+        new_id = self.insert_synapses(2, (0, 0))[0]
+        cursor = connection.cursor()
+        cursor.execute('''
+            UPDATE synapse_slice_project_geom SET geom_p = ST_Translate(geom_p, 0, 0, 1000) WHERE synapse_slice_id = %s;
+        ''', (new_id,))
+
+        def zmin():
+            cursor.execute('''
+                SELECT ST_ZMin(geom_p) FROM synapse_slice_project_geom WHERE synapse_slice_id = %s AND project_id = %s;
+            ''', (new_id, self.test_project_id))
+            return cursor.fetchone()[0]
+
+        moved_z = zmin()
+        ProjectStack.objects.get(project_id=self.test_project_id, stack_id=self.test_stack_id).save()
+        stack = Stack.objects.get(pk=self.test_stack_id)
+        stack.comment = 'edited'
+        stack.save()
+        self.assertAlmostEqual(zmin(), moved_z)
+
+        stack.resolution = Double3D(stack.resolution.x, stack.resolution.y, stack.resolution.z * 2)
+        stack.save()
+        self.assertNotAlmostEqual(zmin(), moved_z)
+
     def test_simplified_geom(self):
         """Test that unnecessary points are removed from a geometry"""
         input_coord_list = [(0, 0), (1, 0), (1, 0.5), (1, 1), (0, 1), (0, 0)]
@@ -179,6 +377,88 @@ class SynapseDetectionApiTests(SynapseSuggestorTestCase):
         self.assertEqual(len(outer_ring), len(input_coord_list) - 1)  # remove a coord
         self.assertSetEqual({tuple(xy) for xy in outer_ring}, {(0, 0), (1, 0), (1, 1), (0, 1)})
 
+    def insert_encoded_geom(self, geom, geom_format, tile_idx=(0, 0, 0), **extra):
+        data, orig_ids = self.create_synapse_slice_data([[(0, 0), (1, 0), (1, 1), (0, 1)]], tile_idx)
+        syn_slice = json.loads(data['synapse_slices'][0])
+        syn_slice['geom'] = geom
+        syn_slice.update(extra)
+        data['synapse_slices'] = [json.dumps(syn_slice)]
+        data['geom_format'] = geom_format
+
+        response = self.client.post(URL_PREFIX + '/tiles/insert-synapse-slices', data)
+        self.assertEqual(response.status_code, 200)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        new_id = parsed_response[str(orig_ids[0])]
+        return get_slice_geom(new_id)[new_id]
+
+    def test_insert_wkb_geom(self):
+        self.fake_authentication()
+        ring = [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]
+        wkb = struct.pack('<BIII', 1, 3, 1, len(ring)) + np.array(ring, dtype='<f8').tobytes()
+
+        geom = self.insert_encoded_geom(base64.b16encode(wkb).decode('ascii'), 'wkb_hex')
+        self.assertSetEqual({tuple(xy) for xy in geom['coordinates'][0]}, set(ring))
+
+        geom = self.insert_encoded_geom(base64.b64encode(wkb).decode('ascii'), 'wkb_base64')
+        self.assertSetEqual({tuple(xy) for xy in geom['coordinates'][0]}, set(ring))
+
+    def test_insert_packed_geom(self):
+        """Packed coordinates are relative to the tile origin; the test tile is at the origin of the stack"""
+        self.fake_authentication()
+        ring = [(0, 0), (1, 0), (1, 1), (0, 1)]
+        packed = base64.b64encode(np.array(ring, dtype='<i2').tobytes()).decode('ascii')
+
+        geom = self.insert_encoded_geom(packed, 'packed', ring_offsets=[0])
+        self.assertEqual(len(geom['coordinates']), 1)
+        self.assertSetEqual({tuple(xy) for xy in geom['coordinates'][0]}, set(ring))
+
+    def test_insert_packed_geom_offset_tile(self):
+        """Packed coordinates are offset by the position of their tile, whose size is 512x512 in the test workflow"""
+        self.fake_authentication()
+        ring = [(0, 0), (1, 0), (1, 1), (0, 1)]
+        packed = base64.b64encode(np.array(ring, dtype='<i2').tobytes()).decode('ascii')
+
+        geom = self.insert_encoded_geom(packed, 'packed', tile_idx=(1, 1, 0), ring_offsets=[0])
+        self.assertSetEqual({tuple(xy) for xy in geom['coordinates'][0]}, {(x + 512, y + 512) for x, y in ring})
+
+    def test_add_synapse_slices_from_label_image(self):
+        self.fake_authentication()
+        tile_size = 512
+        labels = np.zeros((tile_size, tile_size), dtype='<u4')
+        labels[10:12, 20:23] = 5  # 2 rows x 3 columns
+        labels[12, 20] = 5  # connected below the first region
+        labels[100, 100] = 7
+
+        data = {
+            'workflow_id': self.test_ssw_id,
+            'x_idx': 1,
+            'y_idx': 0,
+            'z_idx': 0,
+            'label_image': base64.b64encode(zlib.compress(labels.tobytes())).decode('ascii'),
+            'uncertainties': json.dumps({'5': 0.25}),
+            'tolerance': RDP_TOLERANCE,
+        }
+        response = self.client.post(URL_PREFIX + '/tiles/insert-label-image', data)
+        self.assertEqual(response.status_code, 200)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+
+        rows = {row[1]: dict(zip(parsed_response['columns'], row)) for row in parsed_response['data']}
+        self.assertSetEqual(set(rows), {5, 7})
+        self.assertEqual(rows[5]['size_px'], 7)
+        self.assertEqual(rows[7]['size_px'], 1)
+        self.assertEqual(rows[7]['xs_centroid'], tile_size + 100)
+        self.assertEqual(rows[7]['ys_centroid'], 100)
+
+        syn_slice = SynapseSlice.objects.get(pk=rows[5]['synapse_slice_id'])
+        self.assertEqual(syn_slice.uncertainty, 0.25)
+
+        geom = get_slice_geom(rows[7]['synapse_slice_id'])[rows[7]['synapse_slice_id']]
+        self.assertEqual(geom['type'], 'Polygon')
+        self.assertSetEqual(
+            {tuple(xy) for xy in geom['coordinates'][0]},
+            {(tile_size + 100, 100), (tile_size + 101, 100), (tile_size + 101, 101), (tile_size + 100, 101)}
+        )
+
     @skip("Database does not force geometries into particular orientation")
     def test_RHR_geom(self):
         """Test that the stored geometry returns a left-hand-rule-compliant geometry (exterior counter-clockwise)"""
@@ -219,17 +499,40 @@ class SynapseDetectionApiTests(SynapseSuggestorTestCase):
         self.assertEqual(response.status_code, 200)
         return json.loads(response.content.decode('utf-8'))
 
-    def test_agglomerate_synapse_slices_deletes_object(self):
+    def test_agglomerate_synapse_slices_ignores_unrelated_object(self):
         """
-        Test that the agglomerate endpoint deletes empty synapse objects
+        Test that the agglomerate endpoint only deletes empty synapse objects it has remapped slices away from
         """
         self.fake_authentication()
 
         parsed_response = self.agglomerate_synapses([])
-        self.assertListEqual(parsed_response['deleted_objects'], [2])
+        self.assertListEqual(parsed_response['deleted_objects'], [])
 
         syn_objs = SynapseObject.objects.filter(pk=2)
-        self.assertEqual(syn_objs.exists(), False)
+        self.assertEqual(syn_objs.exists(), True)
+
+    def test_agglomerate_synapse_slices_deletes_object(self):
+        """
+        Depends on add_synapse_slices_from_tile
+
+        Test that the agglomerate endpoint deletes synapse objects which are merged into another
+        """
+        self.fake_authentication()
+
+        separate_ids = self.insert_synapses(0, (0, 3))
+        separate_object = self.agglomerate_synapses(separate_ids)['slice_object_mappings'][str(separate_ids[0])]
+
+        bridge_ids = self.insert_synapses(0, (0, 1), height=2)
+        parsed_response = self.agglomerate_synapses(bridge_ids)
+        # the bridged slices keep the existing object 1, so the separate slice's object is emptied
+        self.assertListEqual(parsed_response['deleted_objects'], [separate_object])
+        self.assertFalse(SynapseObjectSummary.objects.filter(synapse_object_id=separate_object).exists())
+        self.assertEqual(SynapseObjectSummary.objects.get(synapse_object_id=1).slice_count, 4)
+
+    def test_sweep_unused_synapse_objects(self):
+        deleted = [obj_id for _, batch in sweep_unused_synapse_objects(batch_size=1) for obj_id in batch]
+        self.assertListEqual(deleted, [2])
+        self.assertEqual(SynapseObject.objects.filter(pk=2).exists(), False)
 
     def test_agglomerate_synapse_slices_xy_adjacent(self):
         """
@@ -247,6 +550,22 @@ class SynapseDetectionApiTests(SynapseSuggestorTestCase):
 
         self.assertDictEqual(expected_response, parsed_response['slice_object_mappings'])
 
+    def test_agglomerate_synapse_slices_updates_summary(self):
+        """
+        Depends on add_synapse_slices_from_tile
+
+        Test that the summary of a synapse object which gains a slice is updated
+        """
+        self.fake_authentication()
+
+        new_ids = self.insert_synapses(1, (0, 0), width=3)
+        self.agglomerate_synapses(new_ids)
+
+        summary = SynapseObjectSummary.objects.get(synapse_object_id=1)
+        self.assertEqual(summary.slice_count, 3)
+        self.assertEqual((summary.zs_min, summary.zs_max), (0, 1))
+        self.assertEqual((summary.xs_min, summary.xs_max), (0, 3))
+
     def test_agglomerate_synapse_slices_z_adjacent(self):
         """
         Depends on add_synapse_slices_from_tile
@@ -360,3 +679,28 @@ class SynapseDetectionApiTests(SynapseSuggestorTestCase):
 
         self.assertEqual(SynapseObject.objects.count(), 1)
         self.assertEqual(SynapseSliceSynapseObject.objects.count(), SynapseSlice.objects.count())
+
+    def test_agglomerate_synapse_slices_by_layer(self):
+        """
+        Depends on add_synapse_slices_from_tile
+
+        Test that layer-by-layer agglomeration merges objects first seen in an earlier layer when a later layer bridges
+        them, and leaves separate slices separate.
+        """
+        self.fake_authentication()
+        self.clear_synapses()
+
+        self.insert_synapses(0, (0, 0), (20, 20))
+        self.insert_synapses(1, (0, 0), (5, 0))
+        self.insert_synapses(2, (0, 0), width=6)
+
+        progress = list(agglomerate_synapse_slices_by_layer(self.test_ssw_id))
+
+        self.assertListEqual([p['z_idx'] for p in progress], [0, 1, 2])
+        self.assertListEqual([p['merged_objects'] for p in progress], [0, 0, 1])
+        self.assertEqual(SynapseObject.objects.count(), 2)
+        self.assertEqual(SynapseSliceSynapseObject.objects.count(), SynapseSlice.objects.count())
+
+        # resuming from a later layer does not change the result
+        list(agglomerate_synapse_slices_by_layer(self.test_ssw_id, z_start=1))
+        self.assertEqual(SynapseObject.objects.count(), 2)
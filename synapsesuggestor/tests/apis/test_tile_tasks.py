@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import json
+
+from synapsesuggestor.models import SynapseDetectionTileTask
+from synapsesuggestor.tests.common import SynapseSuggestorTestCase
+
+URL_PREFIX = '/ext/synapsesuggestor/synapse-detection/tiles/tasks'
+
+
+class TileTaskApiTests(SynapseSuggestorTestCase):
+    def post(self, endpoint, data):
+        response = self.client.post(URL_PREFIX + endpoint, data)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def populate(self, **kwargs):
+        """Queue tasks in a 3x2x2 block of tiles; (0, 0, 0) and (0, 0, 1) have already been detected"""
+        data = {'workflow_id': self.test_ssw_id, 'x_max': 3, 'y_max': 2, 'z_max': 2}
+        data.update(kwargs)
+        return self.post('/populate', data)
+
+    def claim(self, worker, count=1, **kwargs):
+        data = {'workflow_id': self.test_ssw_id, 'worker': worker, 'count': count}
+        data.update(kwargs)
+        return self.post('/claim', data)['data']
+
+    def complete(self, worker, task_ids):
+        return self.post('/complete', {'workflow_id': self.test_ssw_id, 'worker': worker, 'tasks': task_ids})
+
+    def test_populate(self):
+        self.fake_authentication()
+        task_count = SynapseDetectionTileTask.objects.count()
+
+        self.assertEqual(self.populate()['count'], 10)
+        self.assertEqual(SynapseDetectionTileTask.objects.count(), task_count + 10)
+
+        # repopulating does not duplicate tasks
+        self.assertEqual(self.populate(skip_detected='false')['count'], 1)
+
+    def test_claim_distinct(self):
+        self.fake_authentication()
+        self.populate()
+
+        first = self.claim('a', 4)
+        second = self.claim('b', 100)
+
+        self.assertEqual(len(first), 4)
+        self.assertEqual(len(second), 6)
+        self.assertFalse({row[0] for row in first} & {row[0] for row in second})
+        # claims are made in z, y, x order
+        self.assertListEqual([row[1:4] for row in first], [[1, 0, 0], [2, 0, 0], [0, 1, 0], [1, 1, 0]])
+        self.assertListEqual(self.claim('c'), [])
+
+    def test_claim_expired(self):
+        self.fake_authentication()
+        self.assertEqual(self.populate(x_max=2, y_max=1, z_max=1)['count'], 1)
+
+        first = self.claim('a', lease_seconds=0)
+        second = self.claim('b', lease_seconds=0)
+
+        self.assertEqual(first[0][0], second[0][0])
+        self.assertEqual(second[0][4], 2)
+        self.assertListEqual(self.claim('c', max_attempts=2), [])
+
+    def test_complete(self):
+        self.fake_authentication()
+        self.populate()
+
+        task_ids = [row[0] for row in self.claim('a', 3)]
+
+        self.assertListEqual(self.complete('b', task_ids), [])
+        self.assertListEqual(self.complete('a', task_ids), sorted(task_ids))
+        self.assertListEqual(self.complete('a', task_ids), [])
+
+        response = self.client.get(URL_PREFIX + '/status', {'workflow_id': self.test_ssw_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(
+            json.loads(response.content.decode('utf-8')), {'pending': 7, 'leased': 0, 'completed': 4}
+        )
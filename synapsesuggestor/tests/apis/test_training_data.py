@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+
+from django.db import connection
+
+from catmaid.models import Treenode, TreenodeClassInstance
+from synapsesuggestor.control.common import resolve_workflow
+from synapsesuggestor.control.training_data import (
+    relation_cache, reservoir_sample, sample_treenode_rows, sample_treenodes_stratified
+)
+from synapsesuggestor.tests.common import SynapseSuggestorTestCase
+
+URL_PREFIX = '/ext/synapsesuggestor/training-data'
+
+
+class TrainingDataApiTests(SynapseSuggestorTestCase):
+    def sample_treenodes(self, count, seed):
+        response = self.client.get(
+            URL_PREFIX + '/{}/treenodes/sample'.format(self.test_project_id), {'count': count, 'seed': seed}
+        )
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def project_treenode_ids(self):
+        return set(Treenode.objects.filter(project_id=self.test_project_id).values_list('id', flat=True))
+
+    def test_sample_treenodes(self):
+        self.fake_authentication()
+
+        parsed_response = self.sample_treenodes(5, 1)
+
+        self.assertEqual(parsed_response['seed'], 1)
+        self.assertIn(parsed_response['method'], ('tablesample', 'reservoir'))
+        self.assertIn('percent', parsed_response)
+        self.assertListEqual(parsed_response['columns'], ['treenode_id', 'xp', 'yp', 'zp'])
+        sampled_ids = [row[0] for row in parsed_response['data']]
+        self.assertEqual(len(set(sampled_ids)), 5)
+        self.assertTrue(set(sampled_ids).issubset(self.project_treenode_ids()))
+
+        self.assertListEqual(self.sample_treenodes(5, 1)['data'], parsed_response['data'])
+
+    def test_sample_treenodes_more_than_project(self):
+        self.fake_authentication()
+        treenode_ids = self.project_treenode_ids()
+
+        parsed_response = self.sample_treenodes(len(treenode_ids) + 10, 1)
+
+        self.assertSetEqual({row[0] for row in parsed_response['data']}, treenode_ids)
+
+    def test_sample_treenode_rows_methods(self):
+        treenode_ids = self.project_treenode_ids()
+
+        for method in ('tablesample', 'reservoir'):
+            rows, used_method, percent = sample_treenode_rows(self.test_project_id, 3, 2, method)
+            self.assertEqual(used_method, method)
+            self.assertEqual(percent is None, method == 'reservoir')
+            self.assertEqual(len(rows), 3)
+            self.assertTrue({row[0] for row in rows}.issubset(treenode_ids))
+            self.assertListEqual(sample_treenode_rows(self.test_project_id, 3, 2, method)[0], rows)
+
+    def test_sample_treenode_rows_replay(self):
+        """Test that the returned method and rate give the same sample, whatever the table's statistics"""
+        rows, method, percent = sample_treenode_rows(self.test_project_id, 3, 2)
+
+        cursor = connection.cursor()
+        cursor.execute('ANALYZE treenode;')
+
+        self.assertListEqual(sample_treenode_rows(self.test_project_id, 3, 2, method, percent=percent)[0], rows)
+
+    def test_reservoir_sample(self):
+        self.assertListEqual(reservoir_sample(range(3), 5), [0, 1, 2])
+
+        sample = reservoir_sample(range(100), 10, random.Random(0))
+        self.assertEqual(len(set(sample)), 10)
+        self.assertListEqual(reservoir_sample(range(100), 10, random.Random(0)), sample)
+
+    def test_sample_treenodes_stratified(self):
+        workflow = resolve_workflow(self.test_project_id, ssw_id=self.test_ssw_id)
+
+        rows = sample_treenodes_stratified(workflow, 1, 3)
+
+        self.assertTrue(rows)
+        self.assertTrue({row[0] for row in rows}.issubset(self.project_treenode_ids()))
+        strata = [(z, y // workflow.tile_height_px, x // workflow.tile_width_px) for _, _, x, y, z in rows]
+        self.assertEqual(len(set(strata)), len(strata))
+        self.assertListEqual(sample_treenodes_stratified(workflow, 1, 3), rows)
+
+        self.assertGreaterEqual(len(sample_treenodes_stratified(workflow, 2, 3)), len(rows))
+
+    def labeled_treenodes(self):
+        return sorted(
+            TreenodeClassInstance.objects.filter(
+                project_id=self.test_project_id, relation__relation_name='labeled_as'
+            ).values_list('class_instance__name', 'treenode_id')
+        )
+
+    def get_treenodes_by_label(self, tags, **params):
+        params['tags'] = tags
+        response = self.client.get(URL_PREFIX + '/{}/treenodes/label'.format(self.test_project_id), params)
+        self.assertEqual(response.status_code, 200)
+        return self.parse_json(response)
+
+    def test_treenodes_by_label(self):
+        self.fake_authentication()
+        expected = self.labeled_treenodes()
+        tags = sorted({tag for tag, _ in expected})
+
+        parsed_response = self.get_treenodes_by_label(tags)
+
+        self.assertListEqual(parsed_response['columns'], ['tag_name', 'treenode_id', 'xp', 'yp', 'zp'])
+        # ordering follows the database's collation, so compare sorted
+        self.assertListEqual(sorted((row[0], row[1]) for row in parsed_response['data']), expected)
+
+    def test_treenodes_by_label_pages(self):
+        self.fake_authentication()
+        expected = self.labeled_treenodes()
+        tags = sorted({tag for tag, _ in expected})
+
+        found = []
+        params = {'limit': 2}
+        while True:
+            parsed_response = self.get_treenodes_by_label(tags, **params)
+            self.assertLessEqual(len(parsed_response['data']), 2)
+            found.extend((row[0], row[1]) for row in parsed_response['data'])
+            if parsed_response['next'] is None:
+                break
+            params.update(parsed_response['next'])
+
+        self.assertEqual(len(set(found)), len(found))
+        self.assertListEqual(sorted(found), expected)
+
+    def test_treenodes_by_label_rejects_limit_below_1(self):
+        self.fake_authentication()
+        tags = [self.labeled_treenodes()[0][0]]
+
+        for limit in (0, -1):
+            response = self.client.get(
+                URL_PREFIX + '/{}/treenodes/label'.format(self.test_project_id), {'tags': tags, 'limit': limit}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_treenodes_by_label_caches_relation(self):
+        self.fake_authentication()
+        tags = [self.labeled_treenodes()[0][0]]
+
+        relation_cache.reset_stats()
+        self.get_treenodes_by_label(tags)
+        self.run_on_commit()
+        self.get_treenodes_by_label(tags)
+
+        self.assertEqual(relation_cache.stats()['hits'], 1)
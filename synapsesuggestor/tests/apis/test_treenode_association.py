@@ -3,6 +3,8 @@ import json
 
 from six import assertCountEqual
 
+from synapsesuggestor.control.treenode_association import copy_treenode_associations, insert_treenode_associations
+from synapsesuggestor.models import SynapseSliceTreenode
 from synapsesuggestor.tests.common import SynapseSuggestorTestCase
 
 
@@ -87,6 +89,59 @@ class TreenodeAssociationApiTests(SynapseSuggestorTestCase):
 
         assertCountEqual(self, expected_result, parsed_response)
 
+    def test_add_treenode_synapse_associations_bulk(self):
+        syn_slice_ids = [2, 3]
+        syn_obj_id = 1
+        other_skid = 235
+        other_tns = [237, 239]
+        contact_px = 10
+
+        self.fake_authentication()
+        for method, return_ids in (('unnest', 'true'), ('copy', 'false')):
+            response = self.client.post(
+                URL_PREFIX + '/{}/add-bulk'.format(self.test_project_id),
+                {
+                    'project_workflow_id': self.test_pssw_id,
+                    'synapse_slice_ids': json.dumps(syn_slice_ids),
+                    'treenode_ids': json.dumps(other_tns),
+                    'contact_px': json.dumps([contact_px] * len(other_tns)),
+                    'method': method,
+                    'return_ids': return_ids,
+                }
+            )
+            self.assertEqual(response.status_code, 200)
+            parsed_response = json.loads(response.content.decode('utf-8'))
+            self.assertEqual(parsed_response['count'], 2)
+            self.assertEqual(len(parsed_response.get('ids', [])), 2 if return_ids == 'true' else 0)
+
+        parsed_response = self.get_response(
+            URL_PREFIX + '/{}/get'.format(self.test_project_id),
+            {'skid': other_skid}
+        )
+
+        # each treenode now has two associations with the same object
+        expected_result = [[other_tn, syn_obj_id, 2 * contact_px] for other_tn in other_tns]
+
+        assertCountEqual(self, expected_result, parsed_response)
+
+    def test_association_ids_in_input_order(self):
+        syn_slice_ids = [2, 3, 2]
+        treenode_ids = [239, 237, 237]
+        contact_pxs = [1, 2, 3]
+
+        new_ids = insert_treenode_associations(
+            self.test_pssw_id, syn_slice_ids, treenode_ids, contact_pxs, return_ids=True
+        )
+        new_ids += copy_treenode_associations(
+            self.test_pssw_id, zip(syn_slice_ids, treenode_ids, contact_pxs), return_ids=True
+        )
+
+        associations = SynapseSliceTreenode.objects.in_bulk(new_ids)
+        self.assertListEqual(
+            [(sstn.synapse_slice_id, sstn.treenode_id, sstn.contact_px) for sstn in map(associations.get, new_ids)],
+            2 * list(zip(syn_slice_ids, treenode_ids, contact_pxs))
+        )
+
     def _get_stack_info(self):
         stack_response = self.client.get(
             '/{}/stack/{}/info'.format(self.test_project_id, self.test_stack_id),
@@ -203,3 +258,41 @@ class TreenodeAssociationApiTests(SynapseSuggestorTestCase):
         }
 
         self.assertDictEqual(parsed_response, expected_response)
+
+    def test_get_synapse_slices_near_skeleton_3d_offset_z(self):
+        """Test that a 3D search finds synapse slices in a neighbouring z-plane"""
+        self.fake_authentication()
+
+        treenodes_info = self._create_treenodes({'x': 1, 'y': 1.5, 'z': 1})
+        resolution = treenodes_info['resolution']
+        # the treenode is half a pixel from the synapse slices in XY and one section from them in Z
+        distance_p = resolution['z'] + resolution['x']
+        params = {
+            'skid': treenodes_info['skeleton_id'], 'pssw_id': self.test_pssw_id, 'distance': distance_p,
+            'dimensions': 3
+        }
+        parsed_response = self.get_response(URL_PREFIX + '/{}/get-distance'.format(self.test_project_id), params)
+
+        expected_response = {
+            'columns': SYN_SLICE_NEAR_SKEL_COLS,
+            'data': [
+                [treenodes_info['skeleton_id'], treenodes_info['treenode_ids'][0], 1, [2, 3], 0, [0.0, 0.0, 2.0, 1.0]]
+            ]
+        }
+
+        self.assertDictEqual(parsed_response, expected_response)
+
+    def test_get_synapse_slices_near_skeleton_3d_too_far(self):
+        """Test that a 3D search does not find synapse slices in a neighbouring z-plane further than the distance"""
+        self.fake_authentication()
+
+        treenodes_info = self._create_treenodes({'x': 1, 'y': 1.5, 'z': 1})
+        resolution = treenodes_info['resolution']
+        distance_p = resolution['z'] / 2
+        params = {
+            'skid': treenodes_info['skeleton_id'], 'pssw_id': self.test_pssw_id, 'distance': distance_p,
+            'dimensions': 3
+        }
+        parsed_response = self.get_response(URL_PREFIX + '/{}/get-distance'.format(self.test_project_id), params)
+
+        self.assertDictEqual(parsed_response, {'columns': SYN_SLICE_NEAR_SKEL_COLS, 'data': []})
@@ -2,6 +2,12 @@
 from __future__ import unicode_literals
 import json
 
+from django.http import QueryDict
+
+from synapsesuggestor.control.cache import clear_caches
+from synapsesuggestor.control.common import (
+    get_most_recent_project_SS_workflow, get_request_pssw_id, resolve_workflow
+)
 from synapsesuggestor.models import (
     SynapseSuggestionWorkflow, SynapseDetectionAlgorithm, SynapseDetectionTiling,
     ProjectSynapseSuggestionWorkflow, SynapseAssociationAlgorithm
@@ -198,3 +204,64 @@ class WorkflowApiTests(SynapseSuggestorTestCase):
         self.assertEqual(project_workflow_count + 1, new_project_workflow_count)
         new_assoc_algo_count = SynapseAssociationAlgorithm.objects.count()
         self.assertEqual(assoc_algo_count, new_assoc_algo_count)
+
+    def test_most_recent_project_workflow_cache_invalidated(self):
+        """Test that the cached most recent project workflow is replaced when a new one is created"""
+        self.fake_authentication()
+
+        self.assertEqual(get_most_recent_project_SS_workflow(self.test_project_id).id, self.test_pssw_id)
+        self.run_on_commit()
+        self.assertEqual(get_most_recent_project_SS_workflow(self.test_project_id).id, self.test_pssw_id)
+
+        parsed_response = self.get_project_workflow(self.test_ssw_id, 'not_an_existing_hash')
+
+        self.assertEqual(
+            get_most_recent_project_SS_workflow(self.test_project_id).id, parsed_response['project_workflow_id']
+        )
+
+    def test_cache_stats(self):
+        self.fake_authentication()
+        clear_caches(reset_stats=True)
+        get_most_recent_project_SS_workflow(self.test_project_id)
+        self.run_on_commit()
+        get_most_recent_project_SS_workflow(self.test_project_id)
+
+        response = self.client.get(URL_PREFIX + '/cache/stats')
+        self.assertEqual(response.status_code, 200)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(parsed_response['project_workflow']['hits'], 1)
+        self.assertEqual(parsed_response['project_workflow']['misses'], 1)
+
+    def test_resolve_workflow(self):
+        with self.assertNumQueries(1):
+            context = resolve_workflow(self.test_project_id)
+        # only cached once the transaction commits
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_workflow(self.test_project_id), context)
+        self.run_on_commit()
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_workflow(self.test_project_id), context)
+
+        self.assertEqual(context.pssw_id, self.test_pssw_id)
+        self.assertEqual(context.ssw_id, self.test_ssw_id)
+        self.assertEqual(context.stack_id, self.test_stack_id)
+        self.assertEqual((context.tile_width_px, context.tile_height_px), (512, 512))
+        self.assertEqual(len(context.translation), 3)
+        self.assertEqual(len(context.resolution), 3)
+
+        self.assertEqual(resolve_workflow(self.test_project_id, ssw_id=self.test_ssw_id), context)
+        with self.assertRaises(ProjectSynapseSuggestionWorkflow.DoesNotExist):
+            resolve_workflow(self.test_project_id, pssw_id=500)
+        self.run_on_commit()
+        # missing workflows are not cached
+        with self.assertNumQueries(1), self.assertRaises(ProjectSynapseSuggestionWorkflow.DoesNotExist):
+            resolve_workflow(self.test_project_id, pssw_id=500)
+
+    def test_get_request_pssw_id_given(self):
+        """Test that no query is made for the default workflow when the project workflow is given"""
+        with self.assertNumQueries(0):
+            pssw_id = get_request_pssw_id(QueryDict('project_workflow_id=500'), self.test_project_id)
+        self.assertEqual(pssw_id, 500)
+
+        self.assertEqual(get_request_pssw_id(QueryDict(), self.test_project_id), self.test_pssw_id)
@@ -1,6 +1,16 @@
 # -*- coding: utf-8 -*-
+import json
+
+from django.db import connection
+
 from catmaid.tests.apis.common import CatmaidApiTestCase
 
+from synapsesuggestor.control.cache import clear_caches
+from synapsesuggestor.control.synapse_detection import (
+    _refresh_synapse_object_summaries, sync_synapse_slice_project_geoms
+)
+from synapsesuggestor.models import SynapseObject
+
 
 class SynapseSuggestorTestCase(CatmaidApiTestCase):
     fixtures = CatmaidApiTestCase.fixtures + ['synapsesuggestor_testdata.json']
@@ -13,3 +23,26 @@ class SynapseSuggestorTestCase(CatmaidApiTestCase):
         cls.test_treenode_id = 7
         cls.test_skeleton_id = 1
         cls.test_stack_id = 3
+
+        # summaries and project-space geometries are derived from the fixture's synapse slices
+        _refresh_synapse_object_summaries(SynapseObject.objects.values_list('id', flat=True))
+        sync_synapse_slice_project_geoms()
+
+    def run_on_commit(self):
+        """
+        Run the callbacks waiting for the test's transaction to commit, as if it had, e.g. to fill caches. As the
+        transaction is rolled back, the caches are cleared again after the test.
+        """
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        self.addCleanup(clear_caches)
+        for _, callback in callbacks:
+            callback()
+
+    @staticmethod
+    def parse_json(response):
+        """Parse the JSON body of a response, which may be streamed"""
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+        return json.loads(content.decode('utf-8'))
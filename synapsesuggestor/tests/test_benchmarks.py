@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+from synapsesuggestor.benchmarks.common import compare_results
+from synapsesuggestor.benchmarks.synthetic import (
+    synthetic_synapse_objects, synapse_slice_records, synthetic_skeletons
+)
+
+
+class SyntheticVolumeTests(TestCase):
+    tile_size = (128, 128)
+
+    def setUp(self):
+        self.objects = synthetic_synapse_objects(500, self.tile_size, sections=10, seed=1)
+        self.records = list(synapse_slice_records(self.objects, self.tile_size, seed=1))
+
+    def test_objects_span_consecutive_sections(self):
+        self.assertEqual(len(self.records), 500)
+        for obj in self.objects:
+            zs = [z for z, _, _, _ in obj]
+            self.assertListEqual(zs, list(range(zs[0], zs[0] + len(zs))))
+            self.assertTrue(0 <= zs[0] and zs[-1] < 10)
+
+    def test_slices_within_tiles(self):
+        for record in self.records:
+            self.assertEqual(record['xs_centroid'] // self.tile_size[0], record['x_idx'])
+            self.assertEqual(record['ys_centroid'] // self.tile_size[1], record['y_idx'])
+
+    def test_skeletons_touch_slices_in_their_sections(self):
+        skeletons = synthetic_skeletons(self.objects, 3, objects_per_skeleton=5, seed=2)
+        self.assertEqual(len(skeletons), 3)
+        for nodes, associations in skeletons:
+            zs = [z for _, _, z in nodes]
+            self.assertListEqual(zs, list(range(zs[0], zs[0] + len(zs))))
+            self.assertTrue(associations)
+            for node_idx, naive_id, contact_px in associations:
+                self.assertEqual(self.records[naive_id]['z_idx'], nodes[node_idx][2])
+                self.assertGreater(contact_px, 0)
+
+    def test_reproducible(self):
+        self.assertListEqual(synthetic_synapse_objects(500, self.tile_size, sections=10, seed=1), self.objects)
+
+
+class CompareResultsTests(TestCase):
+    def test_compare_results(self):
+        baseline = [
+            {'benchmark': 'volume', 'method': 'slice_ingest', 'seconds': 1.0},
+            {'benchmark': 'volume', 'method': 'partners', 'seconds': 1.0},
+        ]
+        results = [
+            {'benchmark': 'volume', 'method': 'slice_ingest', 'seconds': 1.2},
+            {'benchmark': 'volume', 'method': 'partners', 'seconds': 2.0},
+            {'benchmark': 'volume', 'method': 'agglomeration', 'seconds': 5.0},
+        ]
+        self.assertListEqual(compare_results(baseline, results, 1.5), [('volume', 'partners', 1.0, 2.0, 2.0)])
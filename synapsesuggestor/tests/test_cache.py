@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+from synapsesuggestor.control.cache import TTLCache
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTests(TestCase):
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.cache = TTLCache('test', maxsize=2, ttl=10, timer=self.timer)
+
+    def test_get_or_set(self):
+        calls = []
+
+        def compute():
+            calls.append(None)
+            return 'value'
+
+        self.assertEqual(self.cache.get_or_set('key', compute), 'value')
+        self.assertEqual(self.cache.get_or_set('key', compute), 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_set_none(self):
+        calls = []
+
+        def compute():
+            calls.append(None)
+
+        self.assertIsNone(self.cache.get_or_set('key', compute))
+        self.assertIsNone(self.cache.get_or_set('key', compute))
+        self.assertEqual(len(calls), 2)
+
+    def test_expiry(self):
+        self.cache.set('key', 'value')
+        self.timer.now = 9
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.timer.now = 10
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru_eviction(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_stats(self):
+        self.assertIsNone(self.cache.stats()['hit_rate'])
+
+        self.cache.set('key', 'value')
+        self.cache.get('key')
+        self.cache.get('key')
+        self.cache.get('other')
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertAlmostEqual(stats['hit_rate'], 2 / 3.0)
+
+        self.cache.reset_stats()
+        self.assertEqual(self.cache.stats()['hits'], 0)
@@ -1,6 +1,15 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from six import StringIO
+
 from django.core.management import call_command
 from django.apps import apps
 
+from synapsesuggestor.models import SynapseSlice, SynapseSliceSynapseObject, SynapseObject
 from synapsesuggestor.tests.common import SynapseSuggestorTestCase
 
 
@@ -14,3 +23,64 @@ class CommandsTests(SynapseSuggestorTestCase):
         self.assert_ss_db_population_state(True)
         call_command('clear_ss_tables', '-y')
         self.assert_ss_db_population_state(False)
+
+    def test_load_synapse_slices(self):
+        ring = [[10, 10], [12, 10], [12, 12], [10, 12], [10, 10]]
+        record = {
+            'id': 1, 'x_idx': 0, 'y_idx': 0, 'z_idx': 3,
+            'geom': {'type': 'Polygon', 'coordinates': [ring]},
+            'size_px': 4, 'xs_centroid': 11, 'ys_centroid': 11, 'uncertainty': 0.5
+        }
+        slice_count = SynapseSlice.objects.count()
+
+        fd, path = tempfile.mkstemp(suffix='.ndjson')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(json.dumps(record) + '\n')
+            call_command('load_synapse_slices', str(self.test_ssw_id), path, '--tolerance', '0.1')
+        finally:
+            os.remove(path)
+
+        self.assertEqual(SynapseSlice.objects.count(), slice_count + 1)
+        self.assertTrue(SynapseSlice.objects.filter(synapse_detection_tile__z_tile_idx=3).exists())
+
+    def test_agglomerate_synapse_slices(self):
+        call_command('agglomerate_synapse_slices', str(self.test_ssw_id))
+        self.assertEqual(SynapseSliceSynapseObject.objects.count(), SynapseSlice.objects.count())
+
+    def test_sweep_synapse_objects(self):
+        call_command('sweep_synapse_objects', '--batch-size', '1')
+        self.assertFalse(SynapseObject.objects.filter(pk=2).exists())
+
+    def test_ss_partitions_status(self):
+        out = StringIO()
+        call_command('ss_partitions', 'status', stdout=out)
+        self.assertIn('not partitioned', out.getvalue())
+
+    def test_export_training_patches(self):
+        output_dir = tempfile.mkdtemp()
+        try:
+            call_command(
+                'export_training_patches', str(self.test_project_id), str(self.test_ssw_id), output_dir,
+                '--patch-size', '16', '--chunk-size', '2'
+            )
+
+            with open(os.path.join(output_dir, 'manifest.json')) as f:
+                manifest = json.load(f)
+            self.assertEqual(manifest['patch_size'], 16)
+            self.assertEqual(sum(chunk['count'] for chunk in manifest['chunks']), manifest['count'])
+
+            treenodes = np.load(os.path.join(output_dir, manifest['treenodes']), mmap_mode='r')
+            self.assertEqual(len(treenodes), manifest['count'])
+
+            object_ids = set(SynapseSliceSynapseObject.objects.values_list('synapse_object_id', flat=True))
+            for chunk in manifest['chunks']:
+                self.assertLessEqual(chunk['count'], 2)
+                labels = np.load(os.path.join(output_dir, chunk['labels']), mmap_mode='r')
+                associated = np.load(os.path.join(output_dir, chunk['associated']), mmap_mode='r')
+                self.assertTupleEqual(labels.shape, (chunk['count'], 16, 16))
+                self.assertTupleEqual(associated.shape, labels.shape)
+                self.assertTrue(set(np.unique(labels)).issubset(object_ids | {0}))
+                self.assertFalse(np.any(associated[labels == 0]))
+        finally:
+            shutil.rmtree(output_dir)
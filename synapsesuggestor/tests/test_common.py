@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import json
+from decimal import Decimal
+from unittest import TestCase
+
+from synapsesuggestor.control.common import iter_json, prime
+
+
+class IterJsonTests(TestCase):
+    rows = [(1, [2, 3], 'a'), (4, [], None), (5, [6], Decimal('0.5'))]
+
+    def test_columns_data(self):
+        for chunk_size in (1, 2, 10):
+            chunks = list(iter_json(iter(self.rows), ['x', 'y', 'z'], chunk_size=chunk_size))
+            self.assertDictEqual(json.loads(''.join(chunks)), {
+                'columns': ['x', 'y', 'z'],
+                'data': [[1, [2, 3], 'a'], [4, [], None], [5, [6], '0.5']]
+            })
+
+    def test_extra(self):
+        parsed = json.loads(''.join(iter_json(self.rows[:1], ['x', 'y', 'z'], extra={'count': 1})))
+        self.assertEqual(parsed['count'], 1)
+        self.assertListEqual(parsed['data'], [[1, [2, 3], 'a']])
+
+    def test_empty(self):
+        self.assertDictEqual(json.loads(''.join(iter_json([], ['x']))), {'columns': ['x'], 'data': []})
+        self.assertListEqual(json.loads(''.join(iter_json([]))), [])
+
+    def test_bare_array(self):
+        parsed = json.loads(''.join(iter_json(self.rows[:2], chunk_size=1)))
+        self.assertListEqual(parsed, [[1, [2, 3], 'a'], [4, [], None]])
+
+    def test_error(self):
+        def failing_rows():
+            yield self.rows[0]
+            raise ValueError('lost connection')
+
+        for chunk_size in (1, 10):
+            parsed = json.loads(''.join(iter_json(failing_rows(), ['x', 'y', 'z'], chunk_size=chunk_size)))
+            self.assertListEqual(parsed['data'], [[1, [2, 3], 'a']])
+            self.assertDictEqual(parsed['error'], {'error': 'lost connection', 'type': 'ValueError'})
+
+            parsed = json.loads(''.join(iter_json(failing_rows(), chunk_size=chunk_size)))
+            self.assertListEqual(parsed, [[1, [2, 3], 'a'], {'error': 'lost connection', 'type': 'ValueError'}])
+
+
+class PrimeTests(TestCase):
+    def test_prime(self):
+        def failing_rows():
+            raise ValueError('bad query')
+            yield
+
+        with self.assertRaises(ValueError):
+            prime(failing_rows())
+        self.assertListEqual(list(prime(iter([]))), [])
+        self.assertListEqual(list(prime(x for x in [1, 2])), [1, 2])
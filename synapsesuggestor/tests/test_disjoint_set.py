@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+import numpy as np
+
+from synapsesuggestor.control.disjoint_set import connected_components, cluster_slices
+
+
+class DisjointSetTests(TestCase):
+    def test_connected_components(self):
+        edges = np.array([[4, 3], [3, 0], [1, 5]])
+        roots = connected_components(7, edges)
+        self.assertListEqual(roots.tolist(), [0, 1, 2, 0, 0, 1, 6])
+
+    def test_connected_components_no_edges(self):
+        roots = connected_components(3, np.empty((0, 2), dtype=int))
+        self.assertListEqual(roots.tolist(), [0, 1, 2])
+
+    def test_cluster_slices(self):
+        seeds = [10, 11, 20, 30]
+        adjacencies = np.array([[10, 11], [11, 10], [20, 21]])
+        # 21 and 22 already share object 1; 30 and 31 have separate objects which 30's cluster does not bridge
+        slice_object_pairs = np.array([[21, 1], [22, 1], [31, 2]])
+
+        clusters = cluster_slices(seeds, adjacencies, slice_object_pairs)
+        canonical = sorted((sorted(slices), sorted(objects)) for slices, objects in clusters)
+
+        self.assertListEqual(canonical, [
+            ([10, 11], []),
+            ([20, 21, 22], [1]),
+            ([30], []),
+            ([31], [2]),
+        ])
+
+    def test_cluster_slices_merges_objects(self):
+        clusters = cluster_slices([1], np.array([[1, 2], [1, 3]]), np.array([[2, 5], [3, 6], [4, 6]]))
+        self.assertEqual(len(clusters), 1)
+        self.assertSetEqual(clusters[0][0], {1, 2, 3, 4})
+        self.assertSetEqual(clusters[0][1], {5, 6})
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+from synapsesuggestor.control.instrumentation import MetricsRegistry, summarize
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry(window=3)
+
+    def test_rolling_window(self):
+        for wall_ms in (100, 1, 2, 3):
+            self.registry.record('view', {'wall_ms': wall_ms, 'queries': 1})
+
+        summary = summarize([self.registry.snapshot()])['view']
+
+        self.assertEqual(summary['count'], 4)
+        self.assertEqual(summary['window'], 3)
+        self.assertEqual(summary['wall_ms']['max'], 3)
+        self.assertEqual(summary['wall_ms']['p50'], 2)
+        self.assertIsNone(summary['rows'])
+
+    def test_merge_processes(self):
+        other = MetricsRegistry(window=3)
+        self.registry.record('view', {'wall_ms': 1})
+        other.record('view', {'wall_ms': 3}, error=True)
+        other.record('other_view', {'wall_ms': 5})
+
+        summary = summarize([self.registry.snapshot(), other.snapshot()])
+
+        self.assertListEqual(list(summary), ['other_view', 'view'])
+        self.assertEqual(summary['view']['count'], 2)
+        self.assertEqual(summary['view']['errors'], 1)
+        self.assertEqual(summary['view']['wall_ms']['mean'], 2)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+import numpy as np
+
+from synapsesuggestor.control.raster import rasterize_labels, rasterize_polygon
+
+
+class RasterizeTests(TestCase):
+    square = [[[1, 1], [3, 1], [3, 3], [1, 3], [1, 1]]]
+
+    def test_square(self):
+        expected = np.zeros((4, 4), dtype=bool)
+        expected[1:3, 1:3] = True
+        self.assertTrue(np.array_equal(rasterize_polygon(self.square, (0, 0), (4, 4)), expected))
+
+    def test_origin_and_clipping(self):
+        mask = rasterize_polygon(self.square, (2, 2), (4, 4))
+        self.assertEqual(mask.sum(), 1)
+        self.assertTrue(mask[0, 0])
+
+        self.assertFalse(rasterize_polygon(self.square, (10, 10), (4, 4)).any())
+
+    def test_hole(self):
+        rings = [[[0, 0], [5, 0], [5, 5], [0, 5], [0, 0]], [[2, 2], [3, 2], [3, 3], [2, 3], [2, 2]]]
+        mask = rasterize_polygon(rings, (0, 0), (5, 5))
+        self.assertEqual(mask.sum(), 24)
+        self.assertFalse(mask[2, 2])
+
+    def test_labels(self):
+        other = [[[2, 0], [4, 0], [4, 2], [2, 2], [2, 0]]]
+        labels = rasterize_labels([self.square, other], [5, 7], (0, 0), (4, 4))
+        self.assertSetEqual(set(np.unique(labels)), {0, 5, 7})
+        # later polygons are drawn over earlier ones
+        self.assertEqual(labels[1, 2], 7)
+        self.assertEqual(labels[2, 2], 5)
@@ -4,7 +4,8 @@ from __future__ import unicode_literals
 from django.conf.urls import url
 
 from synapsesuggestor.control import (
-    treenode_association as node_assoc, synapse_detection as syn_det, workflow, analysis, training_data
+    treenode_association as node_assoc, synapse_detection as syn_det, workflow, analysis, training_data, tile_tasks,
+    cache, instrumentation
 )
 
 app_name = 'synapsesuggestor'
@@ -16,6 +17,13 @@ urlpatterns = []
 urlpatterns += [
     url(r'^synapse-detection/tiles/detected$', syn_det.get_detected_tiles),
     url(r'^synapse-detection/tiles/insert-synapse-slices$', syn_det.add_synapse_slices_from_tile),
+    url(r'^synapse-detection/tiles/insert-synapse-slices-batch$', syn_det.add_synapse_slices_from_tiles),
+    url(r'^synapse-detection/tiles/load-synapse-slices$', syn_det.load_synapse_slices_from_stream),
+    url(r'^synapse-detection/tiles/insert-label-image$', syn_det.add_synapse_slices_from_label_image),
+    url(r'^synapse-detection/tiles/tasks/populate$', tile_tasks.populate_tile_tasks),
+    url(r'^synapse-detection/tiles/tasks/claim$', tile_tasks.claim_tile_tasks),
+    url(r'^synapse-detection/tiles/tasks/complete$', tile_tasks.complete_tile_tasks),
+    url(r'^synapse-detection/tiles/tasks/status$', tile_tasks.get_tile_task_status),
     url(r'^synapse-detection/slices/agglomerate$', syn_det.agglomerate_synapse_slices),
     url(r'^synapse-detection/workflow$', workflow.get_workflow),
 ]
@@ -26,6 +34,7 @@ urlpatterns += [
     url(r'^treenode-association/(?P<project_id>\d+)/get$', node_assoc.get_treenode_associations),
     url(r'^treenode-association/(?P<project_id>\d+)/get-distance$', node_assoc.get_synapse_slices_near_skeletons),
     url(r'^treenode-association/(?P<project_id>\d+)/add$', node_assoc.add_treenode_synapse_associations),
+    url(r'^treenode-association/(?P<project_id>\d+)/add-bulk$', node_assoc.add_treenode_synapse_associations_bulk),
     url(r'^treenode-association/(?P<project_id>\d+)/workflow$', workflow.get_project_workflow),
 ]
 
@@ -33,6 +42,7 @@ urlpatterns += [
 
 urlpatterns += [
     url(r'^analysis/(?P<project_id>\d+)/skeleton-synapses$', analysis.get_skeleton_synapses),
+    url(r'^analysis/(?P<project_id>\d+)/skeleton-synapses-batch$', analysis.get_skeletons_synapses),
     url(r'^analysis/(?P<project_id>\d+)/intersecting-connectors$', analysis.get_intersecting_connectors),
     url(r'^analysis/(?P<project_id>\d+)/workflow-info$', workflow.get_workflows_info),
     url(r'^analysis/(?P<project_id>\d+)/partners$', analysis.get_partners),
@@ -45,3 +55,14 @@ urlpatterns += [
     url(r'^training-data/(?P<project_id>\d+)/treenodes/sample$', training_data.sample_treenodes),
     url(r'^training-data/(?P<project_id>\d+)/treenodes/label$', training_data.treenodes_by_label)
 ]
+
+# record the latency, queries and response size of all of the above
+
+urlpatterns = instrumentation.instrument_urlpatterns(urlpatterns)
+
+# diagnostic endpoints
+
+urlpatterns += [
+    url(r'^cache/stats$', cache.get_cache_stats),
+    url(r'^metrics$', instrumentation.get_metrics),
+]